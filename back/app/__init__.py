@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
 from .api import (
@@ -6,11 +7,32 @@ from .api import (
     analysis,
     commits,
     notifications,
-    merge_requests
+    merge_requests,
+    metrics,
+    usage,
+    admin,
 )
+from .core.config import settings
+from .db import engine, migrate, aio
 from .errors import GitlabReviewerException
+from .service import jobs, webhooks, webhook_logs
+from .openai import chunking
 
-app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.db_auto_migrate:
+        migrate.upgrade(engine)
+    chunking.load_tokenizer()
+    webhook_logs.start()
+    jobs.start_workers()
+    yield
+    jobs.stop_workers()
+    webhook_logs.stop()
+    await aio.dispose()
+
+
+app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None, lifespan=lifespan)
 app.include_router(auth.router)
 app.include_router(repositories.router)
 app.include_router(analysis.router)
@@ -18,6 +40,9 @@ app.include_router(commits.webhook_router)
 app.include_router(commits.router)
 app.include_router(notifications.router)
 app.include_router(merge_requests.router)
+app.include_router(metrics.router)
+app.include_router(usage.router)
+app.include_router(admin.router)
 
 @app.exception_handler(GitlabReviewerException)
 async def gitlab_reviewer_exception_handler(request, exc: GitlabReviewerException):
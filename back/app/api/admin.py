@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Request
+from ..core.loop import run_blocking
+from ..schema import EmptyOutput
+from ..service.auth import verify_admin_token
+from ..service.jobs import cancel_job
+
+router = APIRouter(prefix='/api/admin')
+
+
+@router.post('/jobs/{job_id}/cancel', response_model=EmptyOutput)
+async def cancel_job_route(request: Request, job_id: int):
+    """取消后台任务。执行中的任务会在下一次请求大模型或执行函数调用前停止"""
+    verify_admin_token(request.headers.get('X-Admin-Token'))
+    await run_blocking(cancel_job, job_id)
+    return EmptyOutput()
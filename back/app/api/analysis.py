@@ -1,6 +1,9 @@
-from fastapi import APIRouter, Request
+from typing import Optional
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
 from ..schema import BaseOutput, EmptyOutput, analysis as analysis_models
-from ..service.auth import get_token_from_cookie, check_repo_permission
+from ..core.loop import run_blocking
+from ..service.auth import get_token_from_cookie
 from ..service.analysis import *
 
 router = APIRouter(prefix='/api/analysis')
@@ -11,10 +14,10 @@ async def post_analysis(
     request: Request,
     input_schema: analysis_models.PostAnalysisInput,
 ):
-    token = get_token_from_cookie(request)
+    token = await get_token_from_cookie(request)
     repo_id = input_schema.repo_id
     branch = input_schema.branch
-    analyze(token, repo_id, branch)
+    await run_blocking(analyze, token, repo_id, branch, input_schema.full)
     return EmptyOutput()
 
 
@@ -22,25 +25,42 @@ async def post_analysis(
 async def get_analysis_history_route(
     request: Request,
     repo_id: int,
+    limit: int = Query(default=20, ge=1, le=100, description='每页条数'),
+    cursor: Optional[int] = Query(default=None, description='上一页返回的next_cursor，为空则从最新的分析开始'),
 ):
-    token = get_token_from_cookie(request)
-    analysis_history = get_analysis_history(token, repo_id)
+    token = await get_token_from_cookie(request)
+    history, next_cursor = await get_analysis_history(token, repo_id, limit, cursor)
     return BaseOutput(data=analysis_models.GetAnalysisHistoryOutput(
-        analysis_history=analysis_history
+        analysis_history=[row['id'] for row in history],
+        items=[analysis_models.AnalysisSummary(**row) for row in history],
+        next_cursor=next_cursor,
     ))
 
 
+@router.get('/{analysis_id}/events')
+async def get_analysis_events_route(
+    request: Request,
+    analysis_id: int,
+):
+    """以SSE推送分析进度，分析结束后推送结果并关闭连接"""
+    token = await get_token_from_cookie(request)
+    return StreamingResponse(
+        await stream_analysis_events(token, analysis_id, request.headers.get('Last-Event-ID')),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
 @router.get('/{analysis_id}', response_model=BaseOutput[analysis_models.GetAnalysisOutput])
 async def get_analysis_route(
     request: Request,
     analysis_id: int,
 ):
-    token = get_token_from_cookie(request)
-    analysis_obj = get_analysis(token, analysis_id)
-    score = get_score(token, analysis_obj.repo_id)
-    assert analysis_obj.analysis_json is not None
+    token = await get_token_from_cookie(request)
+    analysis_obj, analysis_json = await get_analysis(token, analysis_id)
+    score = await get_score(token, analysis_obj.repo_id)
     return BaseOutput(data=analysis_models.GetAnalysisOutput(
         analyze_time=int(analysis_obj.created_at.timestamp()),
-        result=analysis_obj.analysis_json,
+        result=analysis_json,
         score=score
     ))
@@ -36,8 +36,8 @@ async def login_callback(code: str):
 @router.post('/logout')
 async def logout_route(request: Request, response: Response):
     """登出"""
-    token = get_token_from_cookie(request)
-    logout(token)
+    token = await get_token_from_cookie(request)
+    await logout(token)
     response.delete_cookie('token')
     return RedirectResponse(url='/login')
 
@@ -45,7 +45,7 @@ async def logout_route(request: Request, response: Response):
 @router.get('/profile',response_model=BaseOutput[auth_models.ProfileOutput])
 async def profile(request: Request):
     """获取用户信息"""
-    token = get_token_from_cookie(request)
+    token = await get_token_from_cookie(request)
     return BaseOutput(data=auth_models.ProfileOutput(
         username=token.user.username,
         email=token.user.email
@@ -1,22 +1,37 @@
 from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
 from ..schema import BaseOutput, EmptyOutput
 from ..schema.merge_requests import *
-from ..service.auth import get_token_from_cookie, check_repo_permission
+from ..service.auth import get_token_from_cookie
 from ..service.merge_requests import *
 
 router = APIRouter(prefix="/api/merge_requests")
 
 
 @router.get("/{repo_id}/{merge_request_iid}/review", response_model=BaseOutput[MrReviewOutput])
-def get_mr_review_route(
+async def get_mr_review_route(
     request: Request,
     repo_id: int,
     merge_request_iid: int,
 ):
-    token = get_token_from_cookie(request)
-    review = get_mr_review(token, repo_id, merge_request_iid)
-    assert review.review_json
+    token = await get_token_from_cookie(request)
+    review, review_json = await get_mr_review(token, repo_id, merge_request_iid)
     return BaseOutput(data=MrReviewOutput(
-        review=review.review_json,
+        review=review_json,
         created_at=int(review.created_at.timestamp()),
     ))
+
+
+@router.get("/{repo_id}/{merge_request_iid}/review/events")
+async def get_mr_review_events_route(
+    request: Request,
+    repo_id: int,
+    merge_request_iid: int,
+):
+    """以SSE推送评审进度，评审结束后推送结果并关闭连接"""
+    token = await get_token_from_cookie(request)
+    return StreamingResponse(
+        await stream_mr_review_events(token, repo_id, merge_request_iid, request.headers.get('Last-Event-ID')),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
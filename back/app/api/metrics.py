@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Request
+from ..core import metrics
+from ..schema import BaseOutput
+from ..service.auth import verify_admin_token
+
+router = APIRouter(prefix='/api/metrics')
+
+
+@router.get('', response_model=BaseOutput[dict[str, dict]])
+async def get_metrics(request: Request):
+    """获取运行指标"""
+    verify_admin_token(request.headers.get('X-Admin-Token'))
+    return BaseOutput(data=metrics.collect())
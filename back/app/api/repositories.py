@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Request
+from ..core.loop import run_blocking
 from ..service.auth import get_token_from_cookie
 from ..service.repositories import *
 from ..schema import BaseOutput, EmptyOutput
@@ -13,11 +14,12 @@ router = APIRouter(prefix='/api/repositories')
             ]])
 async def get_repositories(request: Request):
     """获取用户绑定的仓库列表"""
-    token = get_token_from_cookie(request)
-    repos = get_user_binded_repos(token.user.id)
+    token = await get_token_from_cookie(request)
+    repos = await get_user_binded_repos(token.user.id)
     return BaseOutput(data=[repo_models.GetRepositoriesOutput(
         id=repo.id,
-        analysis_id=repo.analysis_id # type: ignore
+        analysis_id=repo.analysis_id, # type: ignore
+        review_exclude=(repo.review_exclude or '').splitlines(),
     ) for repo in repos])
 
 
@@ -27,8 +29,8 @@ async def add_repository(
     input_schema: repo_models.AddRepositoryInput,
 ):
     """绑定新仓库"""
-    token = get_token_from_cookie(request)
-    bind_repo(token, input_schema.repo_id)
+    token = await get_token_from_cookie(request)
+    await run_blocking(bind_repo, token, input_schema.repo_id)
     return EmptyOutput()
 
 
@@ -38,9 +40,22 @@ async def delete_repository(
     repo_id: int,
 ):
     """解绑仓库"""
-    token = get_token_from_cookie(request)
-    unbind_repo(
+    token = await get_token_from_cookie(request)
+    await run_blocking(
+        unbind_repo,
         token=token,
         repo_id=repo_id
     )
     return EmptyOutput()
+
+
+@router.put('/{repo_id}/review_exclude', response_model=EmptyOutput)
+async def set_review_exclude_route(
+    request: Request,
+    repo_id: int,
+    input_schema: repo_models.SetReviewExcludeInput,
+):
+    """设置审查时跳过的文件"""
+    token = await get_token_from_cookie(request)
+    await run_blocking(set_review_exclude, token, repo_id, input_schema.patterns)
+    return EmptyOutput()
@@ -0,0 +1,23 @@
+from typing import Optional
+from fastapi import APIRouter, Query, Request
+from ..core.loop import run_blocking
+from ..schema import BaseOutput, usage as usage_models
+from ..service.auth import verify_admin_token
+from ..service.usage import get_usage_summary
+
+router = APIRouter(prefix='/api/usage')
+
+
+@router.get('', response_model=BaseOutput[usage_models.GetUsageOutput])
+async def get_usage_route(
+    request: Request,
+    days: int = Query(default=30, ge=1, le=366, description='统计最近多少天'),
+    repo_id: Optional[int] = Query(default=None, description='只统计指定仓库'),
+):
+    """按仓库和按天汇总模型用量"""
+    verify_admin_token(request.headers.get('X-Admin-Token'))
+    by_repo, by_day = await run_blocking(get_usage_summary, days, repo_id)
+    return BaseOutput(data=usage_models.GetUsageOutput(
+        by_repo=[usage_models.RepoUsage(**row) for row in by_repo],
+        by_day=[usage_models.DayUsage(**row) for row in by_day],
+    ))
@@ -1,6 +1,10 @@
 from enum import Enum
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 from gitlab import Gitlab
+from requests import Session
+from requests.adapters import HTTPAdapter
+from http.cookiejar import DefaultCookiePolicy
 
 
 class SmtpEncryption(str, Enum):
@@ -10,18 +14,62 @@ class SmtpEncryption(str, Enum):
     STARTTLS = "starttls"
 
 
+class LlmProvider(BaseModel):
+    """一个大模型服务"""
+    name: str = ""  # 服务名称，用于日志和指标，为空则使用模型和地址
+    base_url: str
+    api_key: str
+    model: str = "" # 为空则使用openai_model
+    weight: float = 1   # 负载均衡权重
+
+
 class Settings(BaseSettings):
     self_url: str = ""   # XXX: 待适配其他模块
     database_url: str = ""
+    async_database_url: str = ""    # API使用的异步数据库URL，为空时由database_url推导（mysql使用aiomysql，sqlite使用aiosqlite）
+    db_pool_size: int = 10  # 数据库连接池大小，同步和异步连接池各自独立
+    db_max_overflow: int = 20   # 连接池满时最多额外创建的连接数
+    db_pool_recycle: float = 3600   # 连接使用超过此时间（秒）后重建，应小于数据库的wait_timeout
+    db_pool_timeout: float = 30 # 从连接池获取连接的等待上限（秒）
+    blob_zstd_level: int = 9   # 评审和分析结果的zstd压缩级别
+    db_auto_migrate: bool = True    # 启动时执行数据库迁移。多副本部署时建议关闭，在部署时单独执行python -m app.db.migrate
     gitlab_url: str = ""
     gitlab_oauth_redirect_url: str = ""
     gitlab_client_id: str = ""
     gitlab_client_secret: str = ""
     gitlab_webhook_token: str = ""  # webhook防伪token
     gitlab_root_private_token: str = "" # gitlab root用户token，用于获取所有项目的信息
+    gitlab_pool_size: int = 32  # 与gitlab之间保持的HTTP连接数上限，建议不小于blocking_workers
     openai_base_url: str = ""
     openai_api_key: str = ""
     openai_model: str = ""
+    llm_providers: list[LlmProvider] = []   # 多个大模型服务，JSON格式，如[{"base_url": "...", "api_key": "...", "model": "...", "weight": 2}]。为空则只使用openai_base_url等配置的服务
+    llm_breaker_threshold: int = 5  # 大模型服务连续失败此次数后熔断，期间请求发往其他服务
+    llm_breaker_cooldown: float = 30    # 熔断时长（秒），之后放行一个试探请求，成功则恢复
+    llm_hedge_delay: float = 0  # merge request评审的请求超过此时间（秒）未完成时，向另一个服务发出相同请求，采用先完成的结果。为0则不对冲
+    llm_max_in_flight: int = 8  # 同时进行的大模型请求数上限
+    llm_rpm: int = 0    # 每分钟大模型请求数上限，为0则不限制
+    llm_tpm: int = 0    # 每分钟大模型token数上限，为0则不限制
+    llm_rate_limit_retries: int = 5 # 大模型返回429时的重试次数
+    llm_stream: bool = True # 使用流式输出，实时上报评审进度。服务商不支持时可关闭
+    llm_tool_concurrency: int = 4   # 单次审查中并行执行的函数调用数上限
+    llm_job_token_budget: int = 500000  # 单次审查/分析的token预算，用尽后不再执行函数调用，为0则不限制
+    llm_tool_output_max_tokens: int = 8000  # 单次函数调用结果的token上限，超出部分截断，为0则不限制
+    llm_compact_threshold: int = 60000  # 对话历史超过此token数时压缩较早的函数调用结果，为0则不压缩
+    llm_compact_keep_recent: int = 4    # 压缩时保留最近的函数调用结果数
+    llm_max_turns: int = 40 # 单次审查/分析的最大请求轮数，达到后要求模型直接给出结果，为0则不限制
+    llm_max_tool_calls: int = 100   # 单次审查/分析的函数调用次数上限，达到后要求模型直接给出结果，为0则不限制
+    llm_request_timeout: float = 120    # 单次大模型请求的超时（秒）
+    review_chunk_tokens: int = 24000    # 提交差异超过此token数时分块审查，也是每块的大小上限
+    review_chunk_concurrency: int = 4   # 分块审查时并行审查的块数，也是增量分析时并行更新的章节数
+    review_exclude_globs: list[str] = []    # 所有仓库都不审查的文件glob（.gitattributes语法），仓库可单独配置更多
+    review_skip_generated: bool = True  # 审查时跳过依赖锁文件、生成的代码和第三方代码，仓库可在.gitattributes中用linguist-generated/linguist-vendored调整
+    review_max_file_tokens: int = 12000 # 单个文件的差异超过此token数时不放入提示词，由模型按需通过函数调用查看，为0则不限制
+    analysis_incremental_max_ratio: float = 0.5 # 增量分析时需要更新的章节超过此比例则重新完整分析
+    tool_cache_max_bytes: int = 64 * 1024 * 1024    # 函数调用结果内存缓存上限（字节）
+    tool_cache_ttl: float = 30  # 分支名等可变引用的查询结果缓存时间（秒），为0则不缓存
+    tool_cache_dir: str = ""    # 内存缓存淘汰的不可变结果写入此目录，为空则不写入磁盘
+    tool_cache_dir_max_bytes: int = 1024 * 1024 * 1024  # 磁盘缓存上限（字节），为0则不限制
     enable_email: bool = False
     smtp_host: str = ""
     smtp_port: int = 25
@@ -29,16 +77,53 @@ class Settings(BaseSettings):
     smtp_password: str = ""
     smtp_encryption: SmtpEncryption = SmtpEncryption.NONE
     email_from: str = ""
+    job_workers: int = 64   # 同时执行的后台任务（协程）数量，为0时本进程不执行后台任务（仅作为API节点）
+    blocking_workers: int = 16  # 执行gitlab请求、数据库读写等阻塞操作的线程数
+    job_poll_interval: float = 2    # 任务表轮询间隔（秒）
+    job_visibility_timeout: float = 600 # 任务租约时长（秒），worker崩溃后任务会在租约过期后被重新领取
+    job_max_attempts: int = 3   # 任务最大尝试次数
+    job_timeout: float = 1200   # 单次任务的执行时间上限（秒），超时后要求模型直接给出结果，为0则不限制
+    job_retry_backoff: float = 10   # 重试退避基数（秒），按2的幂次增长
+    job_retry_backoff_max: float = 600  # 重试退避上限（秒）
+    push_coalesce_window: float = 60  # 同一分支的推送在此时间（秒）内没有新的推送才开始评审，期间的推送合并为一次评审
+    push_coalesce_max_delay: float = 300    # 合并推送时，评审最多推迟到首次推送后的时间（秒）
+    webhook_dedup_cache_size: int = 10000   # 本地缓存的最近webhook去重键数量
+    webhook_dedup_retention_days: float = 7 # 数据库中webhook去重键的保留天数
+    webhook_log_buffer_size: int = 10000    # webhook日志写入缓冲区长度，满时丢弃新日志
+    webhook_log_batch_size: int = 500   # webhook日志单次批量写入的最大条数
+    webhook_log_flush_interval: float = 1   # webhook日志最长缓冲时间（秒）
+    webhook_log_max_age_days: float = 30    # webhook日志保留天数，为0则不限制
+    webhook_log_max_rows: int = 100000  # webhook日志最多保留条数，为0则不限制
+    webhook_log_max_bytes: int = 512 * 1024 * 1024  # webhook日志最多占用的空间（压缩后，字节），为0则不限制
+    webhook_log_prune_interval: float = 3600    # webhook日志清理间隔（秒）
+    webhook_log_prune_chunk: int = 1000 # webhook日志清理时每个事务删除的条数
+    progress_flush_interval: float = 0.5    # 评审进度事件写入数据库的间隔（秒）
+    progress_poll_interval: float = 1   # SSE接口轮询数据库中进度事件的间隔（秒），用于获取其他进程中任务的进度
+    permission_cache_ttl: float = 5 # 用户仓库权限检查结果的缓存时间（秒），绑定/解绑时清除本进程中的缓存。为0则不缓存
+    admin_token: str = ""   # 管理接口（如/api/metrics）的访问令牌，通过X-Admin-Token请求头传递。为空则禁用管理接口
 
     class Config:
         env_file = ".env"   # 配置文件
         env_prefix = "GLRV_"    # 环境变量前缀
 
 
+def _create_gitlab_session() -> Session:
+    """Gitlab实例共用的HTTP会话，复用keep-alive连接。
+    身份只由请求头中的token决定，禁用cookie，避免gitlab下发的会话cookie被其他身份的请求带上"""
+    session = Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.gitlab_pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
 def get_gitlab_obj() -> Gitlab:
     """获取Gitlab实例"""
-    return Gitlab(settings.gitlab_url)
+    return Gitlab(settings.gitlab_url, session=root_gitlab_session)
 
 
 # 全局实例
 settings = Settings()
+root_gitlab_session = _create_gitlab_session()  # root token专用
+gitlab_session = _create_gitlab_session()   # 各用户的oauth token共用
@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+import time
+
+__all__ = [
+    'Cancelled',
+    'ExecutionLimitExceeded',
+    'CancelToken',
+    'use_cancel_token',
+    'current_cancel_token',
+    'check_cancelled',
+]
+
+
+class Cancelled(Exception):
+    """任务被取消（管理员取消、被新的推送取代等）"""
+
+
+class ExecutionLimitExceeded(Exception):
+    """任务超出执行限制（轮数、函数调用次数、时间等），且无法给出最终结果"""
+
+
+class CancelToken:
+    """协作式取消令牌。执行方在检查点调用check()，取消方调用cancel()，可跨线程使用"""
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def cancel(self, reason: str):
+        if self.reason is None:
+            self.reason = reason
+
+    def check(self):
+        if self.reason is not None:
+            raise Cancelled(self.reason)
+
+
+_current: ContextVar[Optional[CancelToken]] = ContextVar('cancel_token', default=None)
+
+
+@contextmanager
+def use_cancel_token(token: CancelToken) -> Iterator[CancelToken]:
+    """在当前上下文（包括其中创建的协程和线程池任务）中使用token"""
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+
+def current_cancel_token() -> Optional[CancelToken]:
+    return _current.get()
+
+
+def check_cancelled():
+    """当前任务已被取消时抛出Cancelled，不在任务中时什么也不做"""
+    if (token := _current.get()) is not None:
+        token.check()
@@ -0,0 +1,55 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Thread, Lock
+from typing import Any, Callable, Coroutine, Optional, TypeVar
+from .config import settings
+import asyncio, contextvars, functools
+
+__all__ = [
+    'get_loop',
+    'run',
+    'submit',
+    'run_blocking',
+]
+T = TypeVar('T')
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = Lock()
+# 阻塞操作（gitlab请求、数据库读写等）的有界线程池
+_executor = ThreadPoolExecutor(max_workers=settings.blocking_workers, thread_name_prefix='blocking')
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """获取后台事件循环，所有大模型请求和后台任务都在这个循环中以协程方式执行"""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            Thread(target=_loop.run_forever, name='engine-loop', daemon=True).start()
+    return _loop
+
+
+def submit(coro: Coroutine[Any, Any, T]) -> 'Future[T]':
+    """将协程提交到后台事件循环，立即返回"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro: Coroutine[Any, Any, T]) -> T:
+    """在后台事件循环中执行协程并阻塞等待结果。不能在后台事件循环中调用"""
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError('不能在后台事件循环中同步等待协程')
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+async def run_blocking(func: Callable[..., T], *args, **kwargs) -> T:
+    """在有界线程池中执行阻塞函数，并保留当前上下文变量"""
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        _executor,
+        functools.partial(ctx.run, func, *args, **kwargs)
+    )
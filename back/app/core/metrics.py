@@ -0,0 +1,75 @@
+from collections import deque
+from threading import Lock
+from typing import Callable
+import time
+
+__all__ = [
+    'LatencyRecorder',
+    'latency',
+    'register',
+    'collect',
+]
+
+
+class LatencyRecorder:
+    """滑动窗口内的延迟统计"""
+
+    def __init__(self, window: int = 4096):
+        self._samples: deque[float] = deque(maxlen=window)
+        self._count = 0
+        self._lock = Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._count += 1
+
+    def timer(self) -> '_Timer':
+        return _Timer(self)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self._count
+        return {
+            'count': count,
+            'p50_ms': _percentile(samples, 0.50) * 1000,
+            'p99_ms': _percentile(samples, 0.99) * 1000,
+            'max_ms': (samples[-1] if samples else 0.) * 1000,
+        }
+
+
+class _Timer:
+    def __init__(self, recorder: LatencyRecorder):
+        self._recorder = recorder
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self._recorder.record(time.perf_counter() - self._start)
+
+
+def _percentile(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+_collectors: dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, collector: Callable[[], dict]):
+    """注册指标采集函数，在/api/metrics中以name为键输出"""
+    _collectors[name] = collector
+
+
+def latency(name: str) -> LatencyRecorder:
+    recorder = LatencyRecorder()
+    register(name, recorder.snapshot)
+    return recorder
+
+
+def collect() -> dict[str, dict]:
+    return {name: collector() for name, collector in _collectors.items()}
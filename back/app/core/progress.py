@@ -0,0 +1,27 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional
+
+__all__ = [
+    'emit',
+    'use_sink',
+]
+
+Sink = Callable[[str, dict], None]
+_sink: ContextVar[Optional[Sink]] = ContextVar('progress_sink', default=None)
+
+
+def emit(type: str, **data):
+    """上报当前任务的进度事件。当前上下文没有订阅者时什么也不做"""
+    if (sink := _sink.get()) is not None:
+        sink(type, data)
+
+
+@contextmanager
+def use_sink(sink: Optional[Sink]) -> Iterator[None]:
+    """在当前上下文（线程或协程）中将进度事件交给sink处理，为None时不上报"""
+    token = _sink.set(sink)
+    try:
+        yield
+    finally:
+        _sink.reset(token)
@@ -1,6 +1,8 @@
-from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel import create_engine, Session
+from sqlalchemy.pool import Pool, QueuePool
+from ..core import metrics
 from ..core.config import settings
-# 以下导入仅用于SQLModel.metadata.create_all(engine)时检测到所有的表
+# 导入所有的表，使模型之间的外键和关联可以解析。表结构由迁移（app/db/migrations）维护
 from ..model.users import User
 from ..model.tokens import Token
 from ..model.repositories import Repository
@@ -8,19 +10,46 @@ from ..model.repository_bindings import RepositoryBinding
 from ..model.repository_analyses import RepositoryAnalysis
 from ..model.repository_metrics import RepositoryMetric
 from ..model.commit_reviews import CommitReview
+from ..model.commit_review_bindings import CommitReviewBinding
 from ..model.notification_settings import NotificationSettings
 from ..model.mr_reviews import MrReview
 from ..model.webhook_logs import WebhookLog
+from ..model.jobs import Job
+from ..model.webhook_events import WebhookEvent
+from ..model.review_events import ReviewEvent
+from ..model.llm_usages import LlmUsage
+from ..model.blobs import Blob
 
-engine = create_engine(
-    settings.database_url,
-    pool_pre_ping=True
-)
-SQLModel.metadata.create_all(engine)
+
+
+def pool_options() -> dict:
+    return dict(
+        pool_pre_ping=True,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_recycle=settings.db_pool_recycle,
+        pool_timeout=settings.db_pool_timeout,
+    )
+
+
+def pool_stats(pool: Pool) -> dict:
+    """连接池状态，in_use为正在使用的连接数"""
+    if not isinstance(pool, QueuePool):
+        return {}
+    return {
+        'size': pool.size(),
+        'in_use': pool.checkedout(),
+        'idle': pool.checkedin(),
+        'overflow': pool.overflow(),
+    }
+
+
+engine = create_engine(settings.database_url, **pool_options())
+metrics.register('db_pool', lambda: pool_stats(engine.pool))
 
 
 def get_session() -> Session:
     return Session(engine)
 
 
-__all__ = ["get_session"]
+__all__ = ["engine", "get_session", "pool_options", "pool_stats"]
@@ -0,0 +1,66 @@
+"""API使用的异步数据库会话，避免请求处理阻塞事件循环。
+后台任务在独立的事件循环和线程池中执行，仍使用同步会话（app.db.get_session）"""
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ...core import metrics
+from ...core.config import settings
+from .. import pool_options, pool_stats
+
+__all__ = [
+    'get_engine',
+    'get_session',
+    'dispose',
+]
+
+# 同步驱动对应的异步驱动
+_ASYNC_DRIVERS = {
+    'sqlite': 'aiosqlite',
+    'mysql': 'aiomysql',
+    'mariadb': 'aiomysql',
+    'postgresql': 'asyncpg',
+}
+_engine: Optional[AsyncEngine] = None
+checkout_wait = metrics.LatencyRecorder()   # 从连接池获取连接的等待时间
+
+
+def _async_url() -> URL:
+    if settings.async_database_url:
+        return make_url(settings.async_database_url)
+    url = make_url(settings.database_url)
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f'无法由database_url推导{backend}的异步驱动，请配置async_database_url')
+    return url.set(drivername=f'{backend}+{_ASYNC_DRIVERS[backend]}')
+
+
+def get_engine() -> AsyncEngine:
+    """首次使用时创建，只在API所在的事件循环中使用"""
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(_async_url(), **pool_options())
+    return _engine
+
+
+@asynccontextmanager
+async def get_session() -> AsyncIterator[AsyncSession]:
+    # 提交后不使对象过期，离开会话后仍可读取已加载的属性（异步会话不能延迟加载）
+    async with AsyncSession(get_engine(), expire_on_commit=False) as session:
+        with checkout_wait.timer():
+            await session.connection()
+        yield session
+
+
+async def dispose():
+    global _engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+
+
+metrics.register('db_pool_async', lambda: {
+    **(pool_stats(_engine.pool) if _engine is not None else {}),
+    'checkout_wait': checkout_wait.snapshot(),
+})
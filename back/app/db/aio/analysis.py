@@ -0,0 +1,37 @@
+from typing import Optional
+from sqlmodel import select, desc
+from ...model.repository_analyses import RepositoryAnalysis
+from ...model.repository_metrics import RepositoryMetric
+from ...errors.review import *
+from ..analysis import history_statement
+from . import get_session
+
+__all__ = [
+    'get_analysis',
+    'get_analysis_history',
+    'get_score',
+]
+
+
+async def get_analysis(analysis_id: int) -> RepositoryAnalysis:
+    async with get_session() as session:
+        if not (analysis := await session.get(RepositoryAnalysis, analysis_id)):
+            raise ReviewNotExist
+    return analysis
+
+
+async def get_analysis_history(repo_id: int, limit: int, cursor: Optional[int] = None) -> list[dict]:
+    async with get_session() as session:
+        rows = (await session.exec(history_statement(repo_id, limit, cursor))).all() # pyright: ignore[reportCallIssue, reportArgumentType]
+    return [dict(row._mapping) for row in rows]
+
+
+async def get_score(repo_id: int) -> float:
+    async with get_session() as session:
+        metric = (await session.exec(
+            select(RepositoryMetric)
+            .filter_by(repo_id=repo_id)
+            .order_by(desc(RepositoryMetric.created_at))
+        )).first()
+    assert metric is not None
+    return metric.quality_score
@@ -0,0 +1,60 @@
+from sqlalchemy.orm import selectinload
+from ...model.tokens import Token
+from ...model.users import User
+from ...errors.auth import *
+from . import get_session
+
+__all__ = [
+    'save_userinfo',
+    'save_token',
+    'get_token_obj',
+    'delete_token',
+]
+
+
+async def save_userinfo(uid: int, username: str, email: str) -> bool:
+    """返回值：是否注册过"""
+    async with get_session() as session:
+        if user := await session.get(User, uid):
+            registered = True
+            user.username = username
+            user.email = email
+            session.add(user)
+        else:
+            registered = False
+            session.add(User(
+                id=uid,
+                username=username,
+                email=email
+            ))
+        await session.commit()
+    return registered
+
+
+async def save_token(token: str, uid: int, exp: int) -> Token:
+    async with get_session() as session:
+        assert await session.get(User, uid)    # 确保用户存在
+        token_obj = Token(
+            token=token,
+            user_id=uid,
+            exp=exp
+        )
+        session.add(token_obj)
+        await session.commit()
+        await session.refresh(token_obj)
+    return token_obj
+
+
+async def get_token_obj(token: str) -> Token:
+    async with get_session() as session:
+        token_obj = await session.get(Token, token, options=[selectinload(Token.user)])  # type: ignore
+    if token_obj is None:
+        raise InvalidGitlabToken
+    return token_obj
+
+
+async def delete_token(token: Token):
+    async with get_session() as session:
+        token = await session.merge(token)  # 将model附加到session
+        await session.delete(token)
+        await session.commit()
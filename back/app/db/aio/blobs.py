@@ -0,0 +1,18 @@
+from typing import Optional
+from ...model.blobs import Blob
+from ..blobs import decode
+from . import get_session
+
+__all__ = [
+    'get',
+]
+
+
+async def get(blob_hash: Optional[str]) -> Optional[str]:
+    if blob_hash is None:
+        return None
+    async with get_session() as session:
+        blob = await session.get(Blob, blob_hash)
+    if blob is None:
+        return None
+    return decode(blob)
@@ -0,0 +1,28 @@
+from sqlmodel import select
+from ...model.commit_reviews import CommitReview
+from ...model.commit_review_bindings import CommitReviewBinding
+from ...errors.review import *
+from . import get_session
+
+__all__ = [
+    'get_review_by_commit_id',
+]
+
+
+async def get_review_by_commit_id(commit_id: str) -> CommitReview:
+    """先查找复用的评审，再查找该commit自己的评审"""
+    async with get_session() as session:
+        binding = (await session.exec(
+            select(CommitReviewBinding)
+            .filter_by(commit_id=commit_id)
+        )).one_or_none()
+        if binding is not None:
+            review = await session.get(CommitReview, binding.review_id)
+        else:
+            review = (await session.exec(
+                select(CommitReview)
+                .filter_by(after_commit=commit_id)
+            )).one_or_none()
+    if review is None:
+        raise ReviewNotExist
+    return review
@@ -0,0 +1,20 @@
+from sqlmodel import select
+from ...model.mr_reviews import MrReview
+from ...errors.review import *
+from . import get_session
+
+__all__ = [
+    'get_mr_review',
+]
+
+
+async def get_mr_review(repo_id: int, mr_iid: int) -> MrReview:
+    async with get_session() as session:
+        review = (await session.exec(
+            select(MrReview)
+            .where(MrReview.repo_id == repo_id)
+            .where(MrReview.mr_iid == mr_iid)
+        )).one_or_none()
+    if review is None:
+        raise ReviewNotExist
+    return review
@@ -0,0 +1,29 @@
+from sqlmodel import select
+from ...model.notification_settings import NotificationSettings
+from . import get_session
+
+__all__ = [
+    'get_notification_settings',
+    'update_notification_settings',
+]
+
+
+async def get_notification_settings(user_id: int) -> NotificationSettings:
+    async with get_session() as session:
+        return (await session.exec(
+            select(NotificationSettings)
+            .where(NotificationSettings.user_id == user_id)
+        )).one()
+
+
+async def update_notification_settings(model: NotificationSettings):
+    async with get_session() as session:
+        existing_model = (await session.exec(
+            select(NotificationSettings)
+            .filter_by(user_id=model.user_id)
+        )).one_or_none()    # 考虑到新注册用户可能会没有记录
+        if existing_model is not None:
+            await session.delete(existing_model)
+            await session.flush()
+        session.add(model)
+        await session.commit()
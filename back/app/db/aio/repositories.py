@@ -0,0 +1,28 @@
+from sqlmodel import select, and_, exists
+from ...model.repositories import Repository
+from ...model.repository_bindings import RepositoryBinding
+from . import get_session
+
+__all__ = [
+    'get_user_binded_repos',
+    'is_repo_binded',
+]
+
+
+async def get_user_binded_repos(user_id: int) -> list[Repository]:
+    async with get_session() as session:
+        return list((await session.exec(
+            select(Repository)
+            .join(RepositoryBinding, and_(RepositoryBinding.repo_id == Repository.id))
+            .filter_by(user_id = user_id)
+        )).all())
+
+
+async def is_repo_binded(user_id: int, repo_id: int) -> bool:
+    async with get_session() as session:
+        return (await session.exec(
+            select(exists().where(
+                RepositoryBinding.repo_id == repo_id,
+                RepositoryBinding.user_id == user_id,
+            ))
+        )).one()
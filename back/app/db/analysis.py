@@ -1,9 +1,12 @@
-from sqlmodel import select, desc
+from typing import Optional
+from sqlmodel import select, desc, or_
+from sqlalchemy import Select
 from ..model import ReviewStatus
 from ..model.repositories import Repository
 from ..model.repository_analyses import RepositoryAnalysis
 from ..model.repository_metrics import RepositoryMetric
-from . import get_session
+from ..model.blobs import Blob
+from . import get_session, blobs
 from ..errors.review import *
 
 __all__ = [
@@ -12,6 +15,7 @@ __all__ = [
     'create_analysis',
     'update_analysis',
     'fail_analysis',
+    'get_last_completed_analysis',
 ]
 
 
@@ -22,21 +26,45 @@ def get_analysis(analysis_id: int) -> RepositoryAnalysis:
     return analysis
 
 
-def get_analysis_history(repo_id: int) -> list[int]:
+def history_statement(repo_id: int, limit: int, cursor: Optional[int] = None) -> Select:
+    """按(created_at, id)逆序分页的分析摘要，cursor为上一页最后一条分析的id。
+    只读取摘要列和结果大小，不读取结果内容"""
+    statement = (
+        select(
+            RepositoryAnalysis.id,
+            RepositoryAnalysis.status,
+            RepositoryAnalysis.created_at,
+            RepositoryAnalysis.branch,
+            RepositoryAnalysis.score,
+            Blob.size,
+        )
+        .outerjoin(Blob, Blob.hash == RepositoryAnalysis.analysis_hash) # pyright: ignore[reportArgumentType]
+        .where(RepositoryAnalysis.repo_id == repo_id)
+        .order_by(desc(RepositoryAnalysis.created_at), desc(RepositoryAnalysis.id))
+        .limit(limit)
+    )
+    if cursor is not None:
+        # 与数据库中保存的值比较，不受时间戳精度和格式影响
+        last = select(RepositoryAnalysis.created_at).where(RepositoryAnalysis.id == cursor).scalar_subquery()
+        statement = (
+            statement
+            .where(RepositoryAnalysis.created_at <= last) # pyright: ignore[reportOperatorIssue]
+            .where(or_(RepositoryAnalysis.created_at < last, RepositoryAnalysis.id < cursor)) # pyright: ignore[reportOperatorIssue, reportArgumentType]
+        )
+    return statement
+
+
+def get_analysis_history(repo_id: int, limit: int, cursor: Optional[int] = None) -> list[dict]:
     with get_session() as session:
-        analyses = session.exec(
-            select(RepositoryAnalysis.id)
-            .where(RepositoryAnalysis.repo_id == repo_id)
-            .order_by(desc(RepositoryAnalysis.created_at))
-        ).all()
-    return list(analyses)
+        return [dict(row._mapping) for row in session.exec(history_statement(repo_id, limit, cursor)).all()] # pyright: ignore[reportCallIssue, reportArgumentType]
 
 
-def create_analysis(repo_id: int) -> RepositoryAnalysis:
+def create_analysis(repo_id: int, branch: Optional[str] = None) -> RepositoryAnalysis:
     with get_session() as session:
         # 创建并插入分析对象
         analysis = RepositoryAnalysis(
-            repo_id=repo_id
+            repo_id=repo_id,
+            branch=branch,
         )
         session.add(analysis)
         session.commit()
@@ -47,28 +75,42 @@ def create_analysis(repo_id: int) -> RepositoryAnalysis:
         repo.analysis = analysis
         session.add(repo)
         session.commit()
+        session.refresh(analysis)   # 提交后对象已过期，调用方需要读取id
     return analysis
 
 
-def update_analysis(repo_id: int, analysis_json: str):
+def update_analysis(analysis_id: int, analysis_json: str, commit_sha: Optional[str] = None):
+    analysis_hash = blobs.put(analysis_json)
     with get_session() as session:
-        assert (repo := session.get(Repository, repo_id)) is not None
-        assert (analysis := session.get(RepositoryAnalysis,repo.analysis_id)) is not None
+        assert (analysis := session.get(RepositoryAnalysis, analysis_id)) is not None
         analysis.status = ReviewStatus.COMPLETED
-        analysis.analysis_json = analysis_json
+        analysis.analysis_hash = analysis_hash
+        analysis.commit_sha = commit_sha
         session.add(analysis)
         session.commit()
 
 
-def fail_analysis(repo_id: int):
+def fail_analysis(analysis_id: int):
     with get_session() as session:
-        assert (repo := session.get(Repository, repo_id)) is not None
-        assert (analysis := session.get(RepositoryAnalysis,repo.analysis_id)) is not None
+        assert (analysis := session.get(RepositoryAnalysis, analysis_id)) is not None
         analysis.status = ReviewStatus.FAILED
         session.add(analysis)
         session.commit()
 
 
+def get_last_completed_analysis(repo_id: int, branch: str) -> Optional[RepositoryAnalysis]:
+    """获取该分支最近一次记录了commit的已完成分析"""
+    with get_session() as session:
+        return session.exec(
+            select(RepositoryAnalysis)
+            .where(RepositoryAnalysis.repo_id == repo_id)
+            .where(RepositoryAnalysis.branch == branch)
+            .where(RepositoryAnalysis.status == ReviewStatus.COMPLETED)
+            .where(RepositoryAnalysis.commit_sha != None) # noqa: E711
+            .order_by(desc(RepositoryAnalysis.created_at), desc(RepositoryAnalysis.id))
+        ).first()
+
+
 def get_score(repo_id: int) -> float:
     with get_session() as session:
         metric = (session.exec(
@@ -81,9 +123,13 @@ def get_score(repo_id: int) -> float:
     return metric.quality_score
 
 
-def save_score(repo_id: int, score: float):
+def save_score(repo_id: int, score: float, analysis_id: Optional[int] = None):
+    """记录仓库得分，指定analysis_id时同时记录到该分析上"""
     with get_session() as session:
         session.add(
             RepositoryMetric(repo_id=repo_id, quality_score=score)
         )
+        if analysis_id is not None and (analysis := session.get(RepositoryAnalysis, analysis_id)) is not None:
+            analysis.score = score
+            session.add(analysis)
         session.commit()
@@ -0,0 +1,60 @@
+"""评审和分析结果等大对象单独存放并压缩，读取评审记录时不必加载结果内容。
+以内容的sha256为主键，重复的结果（如复用的评审、未变化的分析）只存一份"""
+from typing import Optional
+from sqlalchemy.exc import IntegrityError
+from ..core.config import settings
+from ..model.blobs import Blob
+from . import get_session
+import hashlib, zstandard
+
+__all__ = [
+    'encode',
+    'decode',
+    'put',
+    'get',
+]
+
+_DECODERS = {
+    'zstd': zstandard.decompress,
+}
+
+
+def encode(content: str) -> Blob:
+    raw = content.encode()
+    data = zstandard.compress(raw, settings.blob_zstd_level)
+    return Blob(
+        hash=hashlib.sha256(raw).hexdigest(),
+        codec='zstd',
+        data=data,
+        size=len(raw),
+        stored_size=len(data),
+    )
+
+
+def decode(blob: Blob) -> str:
+    return _DECODERS[blob.codec](blob.data).decode()
+
+
+def put(content: str) -> str:
+    """保存内容，返回其哈希。内容已存在时不重复写入"""
+    blob = encode(content)
+    blob_hash = blob.hash
+    with get_session() as session:
+        if session.get(Blob, blob_hash) is not None:
+            return blob_hash
+        session.add(blob)
+        try:
+            session.commit()
+        except IntegrityError:  # 相同内容被并发写入
+            session.rollback()
+    return blob_hash
+
+
+def get(blob_hash: Optional[str]) -> Optional[str]:
+    if blob_hash is None:
+        return None
+    with get_session() as session:
+        blob = session.get(Blob, blob_hash)
+    if blob is None:
+        return None
+    return decode(blob)
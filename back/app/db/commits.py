@@ -1,27 +1,37 @@
 from typing import Optional
 from sqlmodel import select
+from sqlalchemy.exc import IntegrityError
 from ..model import ReviewStatus
 from ..model.commit_reviews import CommitReview
-from ..model.webhook_logs import WebhookLog
+from ..model.commit_review_bindings import CommitReviewBinding
 from ..errors.review import *
-from . import get_session
+from . import get_session, blobs
 
 __all__ = [
     'create_review',
     'get_review',
-    'update_review'
+    'get_review_by_commit_id',
+    'get_completed_review_by_diff_hash',
+    'bind_review',
+    'update_review',
+    'update_review_result',
 ]
 
 
-def create_review(repo_id: int, before: str, after: str) -> CommitReview:
+def create_review(repo_id: int, before: str, after: str, diff_hash: Optional[str] = None) -> CommitReview:
     review = CommitReview(
         repo_id=repo_id,
         before_commit=before,
         after_commit=after,
+        diff_hash=diff_hash,
     )
     with get_session() as session:
         session.add(review)
-        session.commit()
+        try:
+            session.commit()
+        except IntegrityError:  # 同一commit被并发推送到多个分支
+            session.rollback()
+            return get_review_by_commit_id(after)
         session.refresh(review)
     return review
 
@@ -34,40 +44,59 @@ def get_review(review_id: int) -> CommitReview:
     return review
 
 
-# def get_review_by_commit_id(commit_id: str) -> CommitReview:
-#     with get_session() as session:
-#         review = (session.exec(
-#             select(CommitReviewBinding)
-#             .filter_by(commit_id=commit_id)
-#         )
-#         .one()
-#         .review)
-#     if review is None:
-#         raise ReviewNotExist
-#     return review
-
-
 def get_review_by_commit_id(commit_id: str) -> CommitReview:
+    """先查找复用的评审，再查找该commit自己的评审"""
     with get_session() as session:
-        review = (session.exec(
-            select(CommitReview)
-            .filter_by(after_commit=commit_id)
+        binding = (session.exec(
+            select(CommitReviewBinding)
+            .filter_by(commit_id=commit_id)
         )
         .one_or_none())
+        if binding is not None:
+            review = session.get(CommitReview, binding.review_id)
+        else:
+            review = (session.exec(
+                select(CommitReview)
+                .filter_by(after_commit=commit_id)
+            )
+            .one_or_none())
     if review is None:
         raise ReviewNotExist
     return review
 
 
+def get_completed_review_by_diff_hash(repo_id: int, diff_hash: str) -> Optional[CommitReview]:
+    with get_session() as session:
+        return (session.exec(
+            select(CommitReview)
+            .filter_by(repo_id=repo_id, diff_hash=diff_hash, status=ReviewStatus.COMPLETED)
+            .limit(1)
+        )
+        .first())
+
+
+def bind_review(commit_id: str, review: CommitReview):
+    """将commit关联到差异相同的已有评审"""
+    with get_session() as session:
+        session.add(CommitReviewBinding(commit_id=commit_id, review_id=review.id))
+        try:
+            session.commit()
+        except IntegrityError:  # 已被其他任务关联
+            session.rollback()
+
+
 def update_review(review: CommitReview, status: ReviewStatus, review_json: Optional[str] = None):
     review.status = status
-    review.review_json = review_json
+    review.review_hash = blobs.put(review_json) if review_json is not None else None
     with get_session() as session:
         session.add(review)
         session.commit()
 
 
-def record_webhook_received(data: str):
+def update_review_result(review: CommitReview, source: CommitReview):
+    """复用已完成评审的结果，不必重新读取和写入结果内容"""
+    review.status = ReviewStatus.COMPLETED
+    review.review_hash = source.review_hash
     with get_session() as session:
-        session.add(WebhookLog(data=data))
+        session.add(review)
         session.commit()
@@ -0,0 +1,287 @@
+from typing import Callable, Optional
+from sqlmodel import select, and_, or_
+from sqlalchemy import update
+from ..model.jobs import Job, JobStatus
+from . import get_session
+import json, time
+
+__all__ = [
+    'enqueue',
+    'coalesce',
+    'claim',
+    'heartbeat',
+    'add_llm_wait',
+    'complete',
+    'cancel',
+    'retry',
+    'fail',
+    'request_cancel',
+    'supersede_running',
+    'update_payload',
+    'list_cancel_requested',
+    'exists',
+]
+
+
+def enqueue(kind: str, payload: dict, priority: int, max_attempts: int, delay: float = 0) -> Job:
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload, ensure_ascii=False),
+        priority=priority,
+        max_attempts=max_attempts,
+        run_after=time.time() + delay,
+    )
+    with get_session() as session:
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+    return job
+
+
+def coalesce(
+    kind: str,
+    key: str,
+    payload: dict,
+    merge: Callable[[dict, dict], dict],
+    priority: int,
+    max_attempts: int,
+    delay: float,
+    max_delay: float,
+) -> Job:
+    """将任务合并到相同键的待执行任务中，并将其推迟delay秒（不超过首次入队后max_delay秒）。
+    不存在可合并的任务时新建任务"""
+    now = time.time()
+    with get_session() as session:
+        pending = session.exec(
+            select(Job)
+            .where(Job.kind == kind)
+            .where(Job.key == key)
+            .where(Job.status == JobStatus.PENDING)
+            .order_by(Job.id)
+        ).first()
+        if pending is not None:
+            assert pending.coalesce_until is not None
+            merged = json.dumps(merge(json.loads(pending.payload), payload), ensure_ascii=False)
+            result = session.execute(
+                update(Job)
+                .where(and_(Job.id == pending.id, Job.status == JobStatus.PENDING))
+                .values(
+                    payload=merged,
+                    run_after=min(now + delay, pending.coalesce_until),
+                )
+            )
+            session.commit()
+            if result.rowcount == 1:    # pyright: ignore[reportAttributeAccessIssue]
+                session.refresh(pending)
+                return pending
+
+        # 没有待执行的任务，或任务刚被领取
+        job = Job(
+            kind=kind,
+            key=key,
+            payload=json.dumps(payload, ensure_ascii=False),
+            priority=priority,
+            max_attempts=max_attempts,
+            run_after=now + delay,
+            coalesce_until=now + max_delay,
+        )
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+    return job
+
+
+def _claimable(now: float):
+    """可领取的任务：到期的PENDING任务，或租约已过期的RUNNING任务（worker崩溃后遗留）"""
+    return or_(
+        and_(Job.status == JobStatus.PENDING, Job.run_after <= now),
+        and_(Job.status == JobStatus.RUNNING, Job.locked_until < now),
+    )
+
+
+def claim(worker_id: str, limit: int, visibility_timeout: float) -> list[Job]:
+    """领取至多limit个任务。通过条件更新实现多worker/多副本间的互斥"""
+    now = time.time()
+    claimed: list[int] = []
+    with get_session() as session:
+        candidates = session.exec(
+            select(Job.id)
+            .where(_claimable(now))
+            .order_by(Job.priority, Job.run_after)
+            .limit(limit)
+        ).all()
+        for job_id in candidates:
+            result = session.execute(
+                update(Job)
+                .where(and_(Job.id == job_id, _claimable(now)))
+                .values(
+                    status=JobStatus.RUNNING,
+                    attempts=Job.attempts + 1,
+                    locked_until=now + visibility_timeout,
+                    locked_by=worker_id,
+                )
+            )
+            session.commit()
+            if result.rowcount == 1:    # pyright: ignore[reportAttributeAccessIssue]
+                claimed.append(job_id)
+        if not claimed:
+            return []
+        return list(session.exec(
+            select(Job)
+            .where(Job.id.in_(claimed)) # pyright: ignore[reportAttributeAccessIssue]
+        ).all())
+
+
+def heartbeat(job_ids: list[int], worker_id: str, visibility_timeout: float):
+    """续租正在执行的任务"""
+    if not job_ids:
+        return
+    with get_session() as session:
+        session.execute(
+            update(Job)
+            .where(and_(
+                Job.id.in_(job_ids), # pyright: ignore[reportAttributeAccessIssue]
+                Job.status == JobStatus.RUNNING,
+                Job.locked_by == worker_id,
+            ))
+            .values(locked_until=time.time() + visibility_timeout)
+        )
+        session.commit()
+
+
+def add_llm_wait(job_id: int, seconds: float):
+    with get_session() as session:
+        session.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(llm_wait=Job.llm_wait + seconds)
+        )
+        session.commit()
+
+
+def complete(job_id: int, worker_id: str) -> bool:
+    return _finish(job_id, worker_id, JobStatus.COMPLETED)
+
+
+def cancel(job_id: int, worker_id: str, reason: str) -> bool:
+    return _finish(job_id, worker_id, JobStatus.CANCELLED, reason)
+
+
+def fail(job_id: int, worker_id: str, error: str) -> bool:
+    return _finish(job_id, worker_id, JobStatus.FAILED, error)
+
+
+def retry(job_id: int, worker_id: str, error: str, delay: float) -> bool:
+    """以下更新只对仍持有租约的worker生效，租约过期后任务可能已被其他worker重新领取，此时返回False"""
+    with get_session() as session:
+        result = session.execute(
+            update(Job)
+            .where(and_(
+                Job.id == job_id,
+                Job.status == JobStatus.RUNNING,
+                Job.locked_by == worker_id,
+            ))
+            .values(
+                status=JobStatus.PENDING,
+                run_after=time.time() + delay,
+                locked_until=None,
+                locked_by=None,
+                last_error=error,
+            )
+        )
+        session.commit()
+    return result.rowcount == 1 # pyright: ignore[reportAttributeAccessIssue]
+
+
+def _finish(job_id: int, worker_id: str, status: JobStatus, error: Optional[str] = None) -> bool:
+    with get_session() as session:
+        result = session.execute(
+            update(Job)
+            .where(and_(
+                Job.id == job_id,
+                Job.status == JobStatus.RUNNING,
+                Job.locked_by == worker_id,
+            ))
+            .values(
+                status=status,
+                locked_until=None,
+                locked_by=None,
+                last_error=error,
+            )
+        )
+        session.commit()
+    return result.rowcount == 1 # pyright: ignore[reportAttributeAccessIssue]
+
+
+def request_cancel(job_id: int, reason: str) -> bool:
+    """待执行的任务直接取消，执行中的任务标记为待取消，由执行它的worker在下一个检查点停止。
+    任务不存在或已结束时返回False"""
+    with get_session() as session:
+        result = session.execute(
+            update(Job)
+            .where(and_(Job.id == job_id, Job.status == JobStatus.PENDING))
+            .values(status=JobStatus.CANCELLED, last_error=reason)
+        )
+        if result.rowcount == 0:    # pyright: ignore[reportAttributeAccessIssue]
+            result = session.execute(
+                update(Job)
+                .where(and_(Job.id == job_id, Job.status == JobStatus.RUNNING))
+                .values(cancel_requested=reason)
+            )
+        session.commit()
+    return result.rowcount == 1 # pyright: ignore[reportAttributeAccessIssue]
+
+
+def supersede_running(kind: str, key: str, job_id: int, reason: str) -> list[dict]:
+    """请求取消相同合并键的执行中任务（job_id除外），按入队顺序返回这些任务的参数"""
+    superseded = []
+    with get_session() as session:
+        running = session.exec(
+            select(Job)
+            .where(Job.kind == kind)
+            .where(Job.key == key)
+            .where(Job.status == JobStatus.RUNNING)
+            .where(Job.cancel_requested == None)    # noqa: E711
+            .where(Job.id != job_id)
+            .order_by(Job.id)
+        ).all()
+        for job in running:
+            result = session.execute(
+                update(Job)
+                .where(and_(Job.id == job.id, Job.status == JobStatus.RUNNING, Job.cancel_requested == None))   # noqa: E711
+                .values(cancel_requested=reason)
+            )
+            if result.rowcount == 1:    # pyright: ignore[reportAttributeAccessIssue]
+                superseded.append(json.loads(job.payload))
+        session.commit()
+    return superseded
+
+
+def update_payload(job_id: int, payload: dict) -> bool:
+    """修改待执行任务的参数，任务已被领取时返回False"""
+    with get_session() as session:
+        result = session.execute(
+            update(Job)
+            .where(and_(Job.id == job_id, Job.status == JobStatus.PENDING))
+            .values(payload=json.dumps(payload, ensure_ascii=False))
+        )
+        session.commit()
+    return result.rowcount == 1 # pyright: ignore[reportAttributeAccessIssue]
+
+
+def list_cancel_requested(job_ids: list[int]) -> list[tuple[int, str]]:
+    """job_ids中被请求取消的执行中任务，返回[(任务id, 取消原因)]"""
+    if not job_ids:
+        return []
+    with get_session() as session:
+        return list(session.exec(
+            select(Job.id, Job.cancel_requested)
+            .where(Job.id.in_(job_ids)) # pyright: ignore[reportAttributeAccessIssue]
+            .where(Job.status == JobStatus.RUNNING)
+            .where(Job.cancel_requested != None)    # noqa: E711
+        ).all())   # pyright: ignore[reportReturnType]
+
+
+def exists(job_id: int) -> bool:
+    with get_session() as session:
+        return session.get(Job, job_id) is not None
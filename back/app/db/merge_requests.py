@@ -1,9 +1,10 @@
 from typing import Optional
 from sqlmodel import select
+from sqlalchemy.exc import IntegrityError
 from ..model import ReviewStatus
 from ..model.mr_reviews import MrReview
 from ..errors.review import *
-from . import get_session
+from . import get_session, blobs
 
 __all__ = [
     "get_mr_review",
@@ -17,7 +18,11 @@ def create_review(repo_id: int, mr_iid: int) -> MrReview:
     )
     with get_session() as session:
         session.add(review)
-        session.commit()
+        try:
+            session.commit()
+        except IntegrityError:  # 同一merge request的评审被并发创建
+            session.rollback()
+            return get_mr_review(repo_id, mr_iid)
         session.refresh(review)
     return review
 
@@ -39,7 +44,7 @@ def get_mr_review(repo_id: int, mr_iid: int) -> MrReview:
 
 def update_review(review: MrReview, status: ReviewStatus, review_json: Optional[str] = None):
     review.status = status
-    review.review_json = review_json
+    review.review_hash = blobs.put(review_json) if review_json is not None else None
     with get_session() as session:
         session.add(review)
         session.commit()
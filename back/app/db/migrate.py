@@ -0,0 +1,75 @@
+"""按版本号依次执行app/db/migrations中尚未执行的迁移，已执行的版本记录在schema_version表中。
+部署时可单独执行：python -m app.db.migrate [--status] [--target 版本号]"""
+from types import ModuleType
+from typing import Optional
+from sqlalchemy import Column, Engine, Float, Integer, MetaData, String, Table, func, inspect, insert, select
+from . import engine
+from .migrations import MIGRATIONS
+import argparse, logging, time
+
+__all__ = [
+    'current_version',
+    'pending_migrations',
+    'upgrade',
+]
+logger = logging.getLogger(__name__)
+
+schema_version = Table(
+    'schema_version',
+    MetaData(),
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('description', String(255), nullable=False),
+    Column('applied_at', Float, nullable=False),
+)
+
+
+def current_version(bind: Engine = engine) -> int:
+    """数据库当前的版本，未执行过迁移时为0"""
+    with bind.connect() as conn:
+        if not inspect(conn).has_table(schema_version.name):
+            return 0
+        return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def pending_migrations(bind: Engine = engine) -> list[ModuleType]:
+    version = current_version(bind)
+    return [migration for migration in MIGRATIONS if migration.version > version]
+
+
+def upgrade(bind: Engine = engine, target: Optional[int] = None) -> list[int]:
+    """执行版本不超过target（默认为最新版本）的待执行迁移，返回执行的版本。
+    每个迁移在一个事务中执行（MySQL的DDL不支持事务回滚，失败后重新执行即可，迁移可重复执行）"""
+    schema_version.create(bind, checkfirst=True)
+    applied = []
+    for migration in pending_migrations(bind):
+        if target is not None and migration.version > target:
+            break
+        logger.info(f'执行数据库迁移{migration.version}：{migration.description}')
+        with bind.begin() as conn:
+            migration.upgrade(conn)
+            conn.execute(insert(schema_version).values(
+                version=migration.version,
+                description=migration.description,
+                applied_at=time.time(),
+            ))
+        applied.append(migration.version)
+    return applied
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description='执行数据库迁移')
+    parser.add_argument('--status', action='store_true', help='只显示当前版本和待执行的迁移')
+    parser.add_argument('--target', type=int, help='迁移到的版本，默认为最新版本')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.status:
+        print(f'当前版本：{current_version()}')
+        for migration in pending_migrations():
+            print(f'待执行：{migration.version} {migration.description}')
+        return
+    applied = upgrade(target=args.target)
+    print(f'执行了{len(applied)}个迁移，当前版本：{current_version()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+"""数据库迁移，每个迁移是一个模块，定义version、description和upgrade(conn)。
+新增迁移时添加vNNNN_xxx.py并加入MIGRATIONS末尾。upgrade应可重复执行（先检查再修改），
+以兼容引入迁移前由create_all创建、结构不完整的数据库"""
+from . import (
+    v0001_initial,
+    v0002_added_tables_and_columns,
+    v0003_hot_path_indexes,
+    v0004_blobs,
+    v0005_analysis_score,
+    v0006_webhook_logs,
+    v0007_webhook_event_job,
+)
+
+MIGRATIONS = [
+    v0001_initial,
+    v0002_added_tables_and_columns,
+    v0003_hot_path_indexes,
+    v0004_blobs,
+    v0005_analysis_score,
+    v0006_webhook_logs,
+    v0007_webhook_event_job,
+]
+assert all(a.version < b.version for a, b in zip(MIGRATIONS, MIGRATIONS[1:])), '迁移版本号必须递增'
+
+__all__ = ['MIGRATIONS']
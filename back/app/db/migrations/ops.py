@@ -0,0 +1,37 @@
+from sqlalchemy import Column, Connection, inspect, text
+from sqlalchemy.schema import CreateColumn
+
+__all__ = [
+    'add_column',
+    'drop_column',
+    'create_index',
+]
+
+
+def _quote(conn: Connection, name: str) -> str:
+    return conn.dialect.identifier_preparer.quote(name)
+
+
+def add_column(conn: Connection, table: str, column: Column):
+    """表中不存在该列时添加"""
+    if column.name in {c['name'] for c in inspect(conn).get_columns(table)}:
+        return
+    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+    conn.execute(text(f'ALTER TABLE {_quote(conn, table)} ADD COLUMN {ddl}'))
+
+
+def drop_column(conn: Connection, table: str, column: str):
+    """表中存在该列时删除（SQLite需3.35以上）"""
+    if column not in {c['name'] for c in inspect(conn).get_columns(table)}:
+        return
+    conn.execute(text(f'ALTER TABLE {_quote(conn, table)} DROP COLUMN {_quote(conn, column)}'))
+
+
+def create_index(conn: Connection, name: str, table: str, columns: list[str], unique: bool = False):
+    """表中不存在同名索引时创建"""
+    if name in {i['name'] for i in inspect(conn).get_indexes(table)}:
+        return
+    conn.execute(text(
+        f'CREATE {"UNIQUE " if unique else ""}INDEX {_quote(conn, name)} ON {_quote(conn, table)} '
+        f'({", ".join(_quote(conn, column) for column in columns)})'
+    ))
@@ -0,0 +1,108 @@
+from sqlalchemy import Boolean, Column, Connection, DateTime, Enum, Float, ForeignKey, Integer, MetaData, Table, Text, func
+from sqlmodel import AutoString
+
+version = 1
+description = '创建引入迁移前已发布版本中的表'
+
+# 引入迁移前已发布版本由create_all创建的表结构，不随模型变化。已存在的表不做修改，之后新增的列和表由后续迁移添加
+metadata = MetaData()
+_status = Enum('PENDING', 'COMPLETED', 'FAILED', name='reviewstatus')
+
+
+def _timestamps() -> list[Column]:
+    return [
+        Column('created_at', DateTime(timezone=True), server_default=func.now(), nullable=False),
+        Column('updated_at', DateTime(timezone=True), server_default=func.now(), nullable=False),
+    ]
+
+
+Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('username', AutoString(), nullable=False),
+    Column('email', AutoString(), nullable=False),
+    *_timestamps(),
+)
+Table(
+    'tokens', metadata,
+    Column('token', AutoString(), primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+    Column('exp', Integer, nullable=False),
+    *_timestamps(),
+)
+Table(
+    'repositories', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('analysis_id', Integer, ForeignKey('repository_analyses.id'), nullable=True),
+    Column('webhook_id', Integer, nullable=False),
+    *_timestamps(),
+)
+Table(
+    'repository_analyses', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('repo_id', Integer, ForeignKey('repositories.id'), nullable=False),
+    Column('status', _status, nullable=False),
+    Column('analysis_json', AutoString(), nullable=True),
+    *_timestamps(),
+)
+Table(
+    'repository_bindings', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+    Column('repo_id', Integer, ForeignKey('repositories.id', ondelete='CASCADE'), nullable=False),
+    *_timestamps(),
+)
+Table(
+    'repository_metrics', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('repo_id', Integer, ForeignKey('repositories.id'), nullable=False),
+    Column('quality_score', Float, nullable=False),
+    *_timestamps(),
+)
+Table(
+    'commit_reviews', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('repo_id', Integer, ForeignKey('repositories.id'), nullable=False),
+    Column('before_commit', AutoString(), nullable=False),
+    Column('after_commit', AutoString(), nullable=False, unique=True),
+    Column('status', _status, nullable=False),
+    Column('review_json', AutoString(), nullable=True),
+    *_timestamps(),
+)
+Table(
+    'commit_review_bindings', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('commit_id', AutoString(), nullable=False, unique=True),
+    Column('review_id', Integer, ForeignKey('commit_reviews.id'), nullable=False),
+    *_timestamps(),
+)
+Table(
+    'notification_settings', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, unique=True),
+    Column('notify_level', Integer, nullable=False),
+    Column('email_enabled', Boolean, nullable=False),
+    Column('webhook_enabled', Boolean, nullable=False),
+    Column('webhook_url', AutoString(), nullable=True),
+    Column('webhook_secret', AutoString(), nullable=True),
+    *_timestamps(),
+)
+Table(
+    'mr_reviews', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('repo_id', Integer, ForeignKey('repositories.id'), nullable=False),
+    Column('mr_iid', Integer, nullable=False),
+    Column('review_json', AutoString(), nullable=True),
+    Column('status', _status, nullable=False),
+    *_timestamps(),
+)
+Table(
+    'webhook_logs', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('data', Text, nullable=True),
+    *_timestamps(),
+)
+
+
+def upgrade(conn: Connection):
+    metadata.create_all(conn, checkfirst=True)
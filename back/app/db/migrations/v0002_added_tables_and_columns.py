@@ -0,0 +1,90 @@
+from sqlalchemy import Boolean, Column, Connection, DateTime, Enum, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text, func
+from sqlmodel import AutoString
+from .ops import *
+
+version = 2
+description = '为已发布版本中的表补齐新增的列，创建新增的表'
+
+# 新增的表结构，不随模型变化。外键引用的已有表只声明主键
+metadata = MetaData()
+for _name in ('repositories', 'commit_reviews', 'mr_reviews', 'repository_analyses'):
+    Table(_name, metadata, Column('id', Integer, primary_key=True))
+
+
+def _timestamps() -> list[Column]:
+    return [
+        Column('created_at', DateTime(timezone=True), server_default=func.now(), nullable=False),
+        Column('updated_at', DateTime(timezone=True), server_default=func.now(), nullable=False),
+    ]
+
+
+NEW_TABLES = [
+    Table(
+        'jobs', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('kind', AutoString(), nullable=False),
+        Column('key', AutoString(), nullable=True),
+        Column('payload', Text, nullable=False),
+        Column('status', Enum('PENDING', 'RUNNING', 'COMPLETED', 'FAILED', 'CANCELLED', name='jobstatus'), nullable=False),
+        Column('priority', Integer, nullable=False),
+        Column('attempts', Integer, nullable=False),
+        Column('max_attempts', Integer, nullable=False),
+        Column('run_after', Float, nullable=False),
+        Column('coalesce_until', Float, nullable=True),
+        Column('locked_until', Float, nullable=True),
+        Column('locked_by', AutoString(), nullable=True),
+        Column('llm_wait', Float, nullable=False),
+        Column('last_error', Text, nullable=True),
+        Column('cancel_requested', AutoString(), nullable=True),
+        *_timestamps(),
+        Index('ix_jobs_key', 'key'),
+    ),
+    Table(
+        'webhook_events', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('event_key', String(191), nullable=False, unique=True),
+        Column('received_at', Float, nullable=False),
+        Index('ix_webhook_events_received_at', 'received_at'),
+    ),
+    Table(
+        'review_events', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('subject', AutoString(), nullable=False),
+        Column('seq', Integer, nullable=False),
+        Column('type', AutoString(), nullable=False),
+        Column('data', Text, nullable=False),
+        Column('created_at', Float, nullable=False),
+        Index('ix_review_events_subject', 'subject'),
+    ),
+    Table(
+        'llm_usages', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('repo_id', Integer, ForeignKey('repositories.id'), nullable=False),
+        Column('commit_review_id', Integer, ForeignKey('commit_reviews.id'), nullable=True),
+        Column('mr_review_id', Integer, ForeignKey('mr_reviews.id'), nullable=True),
+        Column('analysis_id', Integer, ForeignKey('repository_analyses.id'), nullable=True),
+        Column('kind', AutoString(), nullable=False),
+        Column('model', AutoString(), nullable=False),
+        Column('prompt_tokens', Integer, nullable=False),
+        Column('completion_tokens', Integer, nullable=False),
+        Column('cached_tokens', Integer, nullable=False),
+        Column('turns', Integer, nullable=False),
+        Column('tool_calls', Integer, nullable=False),
+        Column('tool_names', Text, nullable=False),
+        Column('succeeded', Boolean, nullable=False),
+        *_timestamps(),
+        Index('ix_llm_usages_repo_id', 'repo_id'),
+        Index('ix_llm_usages_commit_review_id', 'commit_review_id'),
+        Index('ix_llm_usages_mr_review_id', 'mr_review_id'),
+        Index('ix_llm_usages_analysis_id', 'analysis_id'),
+    ),
+]
+
+
+def upgrade(conn: Connection):
+    add_column(conn, 'commit_reviews', Column('diff_hash', AutoString(), nullable=True))
+    create_index(conn, 'ix_commit_reviews_diff_hash', 'commit_reviews', ['diff_hash'])
+    add_column(conn, 'repository_analyses', Column('branch', AutoString(), nullable=True))
+    add_column(conn, 'repository_analyses', Column('commit_sha', AutoString(), nullable=True))
+    add_column(conn, 'repositories', Column('review_exclude', Text(), nullable=True))
+    metadata.create_all(conn, tables=NEW_TABLES, checkfirst=True)
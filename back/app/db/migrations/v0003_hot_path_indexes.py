@@ -0,0 +1,39 @@
+from sqlalchemy import Connection, text
+from .ops import *
+
+version = 3
+description = '为常用查询添加索引'
+
+
+def _dedupe(conn: Connection):
+    """唯一索引创建前删除并发写入的重复记录"""
+    # 同一merge request保留最新的评审，用量记录改为关联到保留的评审
+    conn.execute(text(
+        'UPDATE llm_usages SET mr_review_id = ('
+        ' SELECT MAX(b.id) FROM mr_reviews a, mr_reviews b'
+        ' WHERE a.id = llm_usages.mr_review_id AND b.repo_id = a.repo_id AND b.mr_iid = a.mr_iid'
+        ') WHERE mr_review_id IS NOT NULL'
+    ))
+    # MySQL不允许在子查询中直接引用被删除的表，需多包一层派生表
+    conn.execute(text(
+        'DELETE FROM mr_reviews WHERE id NOT IN ('
+        ' SELECT id FROM (SELECT MAX(id) AS id FROM mr_reviews GROUP BY repo_id, mr_iid) AS keep'
+        ')'
+    ))
+    conn.execute(text(
+        'DELETE FROM repository_bindings WHERE id NOT IN ('
+        ' SELECT id FROM (SELECT MIN(id) AS id FROM repository_bindings GROUP BY repo_id, user_id) AS keep'
+        ')'
+    ))
+
+
+def upgrade(conn: Connection):
+    _dedupe(conn)
+    create_index(conn, 'ix_mr_reviews_repo_id_mr_iid', 'mr_reviews', ['repo_id', 'mr_iid'], unique=True)
+    create_index(conn, 'ix_repository_metrics_repo_id_created_at', 'repository_metrics', ['repo_id', 'created_at'])
+    create_index(conn, 'ix_repository_analyses_repo_id_created_at', 'repository_analyses', ['repo_id', 'created_at'])
+    create_index(conn, 'ix_repository_bindings_user_id', 'repository_bindings', ['user_id'])
+    create_index(conn, 'ix_repository_bindings_repo_id_user_id', 'repository_bindings', ['repo_id', 'user_id'], unique=True)
+    create_index(conn, 'ix_tokens_exp', 'tokens', ['exp'])
+    create_index(conn, 'ix_jobs_status_run_after', 'jobs', ['status', 'run_after'])
+    create_index(conn, 'ix_jobs_status_locked_until', 'jobs', ['status', 'locked_until'])
@@ -0,0 +1,66 @@
+from sqlalchemy import Column, Connection, DateTime, Integer, LargeBinary, MetaData, String, Table, func, insert, inspect, select, table, column, update
+from .ops import *
+import hashlib, zstandard
+
+version = 4
+description = '评审和分析结果移至blobs表，压缩并去重'
+
+# 表 -> (原结果列, 内容哈希列)
+MOVED_COLUMNS = {
+    'commit_reviews': ('review_json', 'review_hash'),
+    'mr_reviews': ('review_json', 'review_hash'),
+    'repository_analyses': ('analysis_json', 'analysis_hash'),
+}
+CHUNK = 500
+ZSTD_LEVEL = 9
+# blobs表结构，不随模型变化
+blobs = Table(
+    'blobs',
+    MetaData(),
+    Column('hash', String(64), primary_key=True),
+    Column('codec', String(16), nullable=False),
+    Column('data', LargeBinary(length=2**32 - 1), nullable=False),
+    Column('size', Integer, nullable=False),
+    Column('stored_size', Integer, nullable=False),
+    Column('created_at', DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column('updated_at', DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
+
+
+def _move(conn: Connection, name: str, source: str, target: str):
+    """按id分批读取原结果，写入blobs表后记录哈希"""
+    rows = table(name, column('id'), column(source), column(target))
+    last_id = 0
+    while True:
+        chunk = conn.execute(
+            select(rows.c.id, rows.c[source])
+            .where(rows.c.id > last_id)
+            .where(rows.c[source] != None) # noqa: E711
+            .order_by(rows.c.id)
+            .limit(CHUNK)
+        ).all()
+        if not chunk:
+            return
+        for row_id, content in chunk:
+            raw = content.encode()
+            blob_hash = hashlib.sha256(raw).hexdigest()
+            if conn.execute(select(blobs.c.hash).where(blobs.c.hash == blob_hash)).first() is None:
+                data = zstandard.compress(raw, ZSTD_LEVEL)
+                conn.execute(insert(blobs).values(
+                    hash=blob_hash,
+                    codec='zstd',
+                    data=data,
+                    size=len(raw),
+                    stored_size=len(data),
+                ))
+            conn.execute(update(rows).where(rows.c.id == row_id).values({target: blob_hash}))
+        last_id = chunk[-1][0]
+
+
+def upgrade(conn: Connection):
+    blobs.create(conn, checkfirst=True)
+    for name, (source, target) in MOVED_COLUMNS.items():
+        add_column(conn, name, Column(target, String(64), nullable=True))
+        if source in {c['name'] for c in inspect(conn).get_columns(name)}:
+            _move(conn, name, source, target)
+            drop_column(conn, name, source)
@@ -0,0 +1,10 @@
+from sqlalchemy import Column, Connection, Float
+from .ops import *
+
+version = 5
+description = '分析记录保存得分，供分析历史摘要使用'
+
+
+def upgrade(conn: Connection):
+    # 此前的得分只记录在repository_metrics中，无法可靠对应到具体分析，保持为空
+    add_column(conn, 'repository_analyses', Column('score', Float(), nullable=True))
@@ -0,0 +1,64 @@
+from datetime import timezone
+from sqlalchemy import Column, Connection, DateTime, Float, Integer, LargeBinary, MetaData, Table, func, inspect, insert, select, table, column, text
+from .ops import *
+import zlib
+
+version = 6
+description = '重建webhook_logs表，日志改为压缩存储并记录大小和接收时间'
+
+CHUNK = 500
+# 重建后的表结构，不随模型变化
+webhook_logs = Table(
+    'webhook_logs_new',
+    MetaData(),
+    Column('id', Integer, primary_key=True),
+    Column('data', LargeBinary(length=2**24), nullable=False),
+    Column('size', Integer, nullable=False),
+    Column('stored_size', Integer, nullable=False),
+    Column('received_at', Float, nullable=False),
+    Column('created_at', DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column('updated_at', DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
+
+
+def _copy(conn: Connection):
+    """按id分批压缩并复制旧日志，接收时间取旧记录的创建时间"""
+    old = table('webhook_logs', column('id', Integer), column('data'), column('created_at', DateTime()))
+    last_id = 0
+    while True:
+        chunk = conn.execute(
+            select(old.c.id, old.c.data, old.c.created_at)
+            .where(old.c.id > last_id)
+            .order_by(old.c.id)
+            .limit(CHUNK)
+        ).all()
+        if not chunk:
+            return
+        rows = []
+        for log_id, data, created_at in chunk:
+            raw = (data or '').encode()
+            compressed = zlib.compress(raw)
+            if created_at.tzinfo is None:   # 数据库中保存的是UTC时间
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            rows.append({
+                'id': log_id,
+                'data': compressed,
+                'size': len(raw),
+                'stored_size': len(compressed),
+                'received_at': created_at.timestamp(),
+                'created_at': created_at,
+                'updated_at': created_at,
+            })
+        conn.execute(insert(webhook_logs), rows)
+        last_id = chunk[-1][0]
+
+
+def upgrade(conn: Connection):
+    if 'received_at' in {c['name'] for c in inspect(conn).get_columns('webhook_logs')}:
+        return
+    webhook_logs.drop(conn, checkfirst=True)    # 上次迁移中断（MySQL的DDL不会回滚）
+    webhook_logs.create(conn)
+    _copy(conn)
+    conn.execute(text('DROP TABLE webhook_logs'))
+    conn.execute(text('ALTER TABLE webhook_logs_new RENAME TO webhook_logs'))
+    create_index(conn, 'ix_webhook_logs_received_at', 'webhook_logs', ['received_at'])
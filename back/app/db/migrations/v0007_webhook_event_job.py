@@ -0,0 +1,9 @@
+from sqlalchemy import Column, Connection, Integer
+from .ops import *
+
+version = 7
+description = 'webhook去重键记录写入它的任务，任务重试时不视为重复投递'
+
+
+def upgrade(conn: Connection):
+    add_column(conn, 'webhook_events', Column('job_id', Integer(), nullable=True))
@@ -1,4 +1,6 @@
-from sqlmodel import select, and_
+from typing import Optional
+from sqlmodel import select, and_, exists
+from sqlalchemy.exc import IntegrityError
 from ..model.repositories import Repository
 from ..model.repository_bindings import RepositoryBinding
 from ..errors.repositories import *
@@ -7,9 +9,11 @@ from . import get_session
 __all__ = [
     'get_repo_by_id',
     'get_user_binded_repos',
+    'is_repo_binded',
     'add_repo_into_db',
     'bind_repo_with_user',
-    'unbind'
+    'unbind',
+    'update_review_exclude',
 ]
 
 
@@ -30,6 +34,16 @@ def get_user_binded_repos(user_id: int) -> list[Repository]:
         ).all())
 
 
+def is_repo_binded(user_id: int, repo_id: int) -> bool:
+    with get_session() as session:
+        return session.exec(
+            select(exists().where(
+                RepositoryBinding.repo_id == repo_id,
+                RepositoryBinding.user_id == user_id,
+            ))
+        ).one()
+
+
 def add_repo_into_db(repo: Repository):
     with get_session() as session:
         session.add(repo)
@@ -43,7 +57,10 @@ def bind_repo_with_user(repo_id: int, user_id: int):
             repo_id=repo_id,
             user_id=user_id
         ))
-        session.commit()
+        try:
+            session.commit()
+        except IntegrityError as e:    # 同一用户并发绑定
+            raise RepoAlreadyBinded from e
 
 
 def unbind(user_id: int, repo_id: int) -> bool:
@@ -72,3 +89,13 @@ def unbind(user_id: int, repo_id: int) -> bool:
             return True
         else:
             return False
+
+
+def update_review_exclude(repo_id: int, review_exclude: Optional[str]):
+    with get_session() as session:
+        repo = session.get(Repository, repo_id)
+        if repo is None:
+            raise RepoNotExist
+        repo.review_exclude = review_exclude
+        session.add(repo)
+        session.commit()
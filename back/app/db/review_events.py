@@ -0,0 +1,56 @@
+from sqlmodel import select, delete, func
+from ..model.review_events import ReviewEvent
+from . import get_session
+import json, time
+
+__all__ = [
+    'insert_events',
+    'list_events',
+    'last_seq',
+    'delete_events',
+]
+
+
+def insert_events(subject: str, events: list[tuple[int, str, dict]]):
+    """events: [(序号, 类型, 内容)]"""
+    now = time.time()
+    with get_session() as session:
+        session.add_all([
+            ReviewEvent(
+                subject=subject,
+                seq=seq,
+                type=type,
+                data=json.dumps(data, ensure_ascii=False, default=str),
+                created_at=now,
+            )
+            for seq, type, data in events
+        ])
+        session.commit()
+
+
+def list_events(subject: str, after_seq: int) -> list[ReviewEvent]:
+    with get_session() as session:
+        return list(session.exec(
+            select(ReviewEvent)
+            .where(ReviewEvent.subject == subject)
+            .where(ReviewEvent.seq > after_seq)
+            .order_by(ReviewEvent.seq) # pyright: ignore[reportArgumentType]
+        ).all())
+
+
+def last_seq(subject: str) -> int:
+    with get_session() as session:
+        seq = session.exec(
+            select(func.max(ReviewEvent.seq))
+            .where(ReviewEvent.subject == subject)
+        ).one()
+    return seq or 0
+
+
+def delete_events(subject: str):
+    with get_session() as session:
+        session.execute(
+            delete(ReviewEvent)
+            .where(ReviewEvent.subject == subject) # pyright: ignore[reportArgumentType]
+        )
+        session.commit()
@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import Any, Optional
+from sqlmodel import select, func
+from ..model.llm_usages import LlmUsage
+from . import get_session
+
+__all__ = [
+    'create_usage',
+    'get_usage_by_repo',
+    'get_usage_by_day',
+]
+
+
+def create_usage(usage: LlmUsage):
+    with get_session() as session:
+        session.add(usage)
+        session.commit()
+
+
+def _rollup(key: Any, since: datetime, repo_id: Optional[int]) -> list[dict]:
+    """按key汇总since之后的用量"""
+    statement = (
+        select(
+            key.label('key'),
+            func.count().label('jobs'),
+            func.sum(LlmUsage.prompt_tokens).label('prompt_tokens'),
+            func.sum(LlmUsage.completion_tokens).label('completion_tokens'),
+            func.sum(LlmUsage.cached_tokens).label('cached_tokens'),
+            func.sum(LlmUsage.turns).label('turns'),
+            func.sum(LlmUsage.tool_calls).label('tool_calls'),
+        )
+        .where(LlmUsage.created_at >= since) # pyright: ignore[reportAttributeAccessIssue]
+        .group_by(key)
+        .order_by(key)
+    )
+    if repo_id is not None:
+        statement = statement.where(LlmUsage.repo_id == repo_id)
+    with get_session() as session:
+        return [dict(row._mapping) for row in session.exec(statement).all()] # pyright: ignore[reportCallIssue, reportArgumentType]
+
+
+def get_usage_by_repo(since: datetime, repo_id: Optional[int] = None) -> list[dict]:
+    return _rollup(LlmUsage.repo_id, since, repo_id)
+
+
+def get_usage_by_day(since: datetime, repo_id: Optional[int] = None) -> list[dict]:
+    return _rollup(func.date(LlmUsage.created_at), since, repo_id) # pyright: ignore[reportArgumentType]
@@ -0,0 +1,45 @@
+from typing import Optional
+from sqlmodel import delete, col, select
+from sqlalchemy.exc import IntegrityError
+from ..model.webhook_events import WebhookEvent
+from . import get_session
+import time
+
+__all__ = [
+    'claim',
+    'delete_keys',
+    'prune',
+]
+
+
+def claim(event_key: str, job_id: int) -> Optional[int]:
+    """记录去重键，返回记录该键的任务id：首次出现时为job_id，否则为先前记录它的任务"""
+    with get_session() as session:
+        session.add(WebhookEvent(event_key=event_key, received_at=time.time(), job_id=job_id))
+        try:
+            session.commit()
+            return job_id
+        except IntegrityError:
+            session.rollback()
+        return session.exec(
+            select(WebhookEvent.job_id)
+            .where(WebhookEvent.event_key == event_key)
+        ).first()
+
+
+def delete_keys(event_keys: list[str]):
+    with get_session() as session:
+        session.execute(
+            delete(WebhookEvent)
+            .where(col(WebhookEvent.event_key).in_(event_keys))
+        )
+        session.commit()
+
+
+def prune(before: float):
+    with get_session() as session:
+        session.execute(
+            delete(WebhookEvent)
+            .where(WebhookEvent.received_at < before) # pyright: ignore[reportArgumentType]
+        )
+        session.commit()
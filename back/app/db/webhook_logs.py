@@ -0,0 +1,104 @@
+from typing import Iterable
+from sqlmodel import select, delete, desc
+from sqlalchemy import insert
+from ..model.webhook_logs import WebhookLog
+from . import get_session
+import zlib
+
+__all__ = [
+    'insert_logs',
+    'decode_log',
+    'prune_by_age',
+    'prune_by_rows',
+    'prune_by_bytes',
+]
+
+
+def insert_logs(logs: Iterable[tuple[float, bytes]]):
+    """批量写入(接收时间戳, 原始数据)"""
+    rows = []
+    for received_at, raw in logs:
+        data = zlib.compress(raw)
+        rows.append({
+            'data': data,
+            'size': len(raw),
+            'stored_size': len(data),
+            'received_at': received_at,
+        })
+    if not rows:
+        return
+    with get_session() as session:
+        session.execute(insert(WebhookLog), rows)
+        session.commit()
+
+
+def decode_log(log: WebhookLog) -> bytes:
+    return zlib.decompress(log.data)
+
+
+def prune_by_age(before: float, chunk: int) -> int:
+    """删除接收时间早于before的日志，返回删除条数"""
+    return _delete_in_chunks(
+        select(WebhookLog.id)
+        .where(WebhookLog.received_at < before),
+        chunk
+    )
+
+
+def prune_by_rows(max_rows: int, chunk: int) -> int:
+    """仅保留最新的max_rows条日志"""
+    with get_session() as session:
+        threshold = session.exec(
+            select(WebhookLog.id)
+            .order_by(desc(WebhookLog.id))
+            .offset(max_rows)
+            .limit(1)
+        ).first()
+    if threshold is None:
+        return 0
+    return _delete_in_chunks(
+        select(WebhookLog.id)
+        .where(WebhookLog.id <= threshold),
+        chunk
+    )
+
+
+def prune_by_bytes(max_bytes: int, chunk: int) -> int:
+    """从最新的日志开始累计压缩后大小，删除超出max_bytes的部分"""
+    total = 0
+    threshold = None
+    with get_session() as session:
+        rows = session.exec(
+            select(WebhookLog.id, WebhookLog.stored_size)
+            .order_by(desc(WebhookLog.id))
+            .execution_options(yield_per=chunk)
+        )
+        for log_id, stored_size in rows:
+            total += stored_size
+            if total > max_bytes:
+                threshold = log_id
+                break
+        rows.close()    # 提前结束遍历时需显式释放游标
+    if threshold is None:
+        return 0
+    return _delete_in_chunks(
+        select(WebhookLog.id)
+        .where(WebhookLog.id <= threshold),
+        chunk
+    )
+
+
+def _delete_in_chunks(id_query, chunk: int) -> int:
+    """每次删除至多chunk行并提交，避免长事务锁表"""
+    deleted = 0
+    while True:
+        with get_session() as session:
+            ids = session.exec(id_query.order_by(WebhookLog.id).limit(chunk)).all()
+            if not ids:
+                return deleted
+            session.execute(
+                delete(WebhookLog)
+                .where(WebhookLog.id.in_(ids)) # pyright: ignore[reportAttributeAccessIssue]
+            )
+            session.commit()
+        deleted += len(ids)
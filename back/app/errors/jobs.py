@@ -0,0 +1,19 @@
+from . import GitlabReviewerException
+
+
+class JobException(GitlabReviewerException):
+    code = 500
+    status = 8
+    info = "后台任务相关异常"
+
+
+class JobNotExist(JobException):
+    code = 404
+    status = 801
+    info = "任务不存在"
+
+
+class JobAlreadyFinished(JobException):
+    code = 409
+    status = 802
+    info = "任务已结束"
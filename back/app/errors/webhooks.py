@@ -0,0 +1,7 @@
+from . import GitlabReviewerException
+
+
+class WebhookException(GitlabReviewerException):
+    code = 500
+    status = 7
+    info = "webhook相关异常"
@@ -0,0 +1,13 @@
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Column, LargeBinary
+from . import TimestampMixin
+
+
+class Blob(TimestampMixin, SQLModel, table=True):
+    """按内容寻址的大对象（评审和分析结果），内容相同的结果只存一份"""
+    __tablename__ = "blobs" # pyright: ignore[reportAssignmentType]
+    hash: str = Field(primary_key=True, max_length=64, description='压缩前内容的sha256')
+    codec: str = Field(max_length=16, description='压缩方式')
+    data: bytes = Field(sa_column=Column(LargeBinary(length=2**32 - 1), nullable=False), description='压缩后的内容')
+    size: int = Field(description='压缩前的数据大小')
+    stored_size: int = Field(description='压缩后的数据大小')
@@ -10,4 +10,5 @@ class CommitReview(TimestampMixin, SQLModel, table=True):
     before_commit: str = Field(description='推送前的最后一个commit')
     after_commit: str = Field(unique=True, description='推送后的最后一个commit')
     status: ReviewStatus = Field(default=ReviewStatus.PENDING, description='commit评审状态')
-    review_json: Optional[str] = Field(default=None, description='commit评审结果')
+    review_hash: Optional[str] = Field(default=None, max_length=64, description='commit评审结果，存放于blobs表')
+    diff_hash: Optional[str] = Field(default=None, index=True, description='规范化后的差异哈希，差异相同的推送复用评审结果')
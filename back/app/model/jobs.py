@@ -0,0 +1,36 @@
+from enum import Enum
+from typing import Optional
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Column, Index, Text
+from . import TimestampMixin
+
+
+class JobStatus(str, Enum):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+
+class Job(TimestampMixin, SQLModel, table=True):
+    __tablename__ = "jobs" # pyright: ignore[reportAssignmentType]
+    __table_args__ = (  # 领取任务时按状态和到期时间查找
+        Index('ix_jobs_status_run_after', 'status', 'run_after'),
+        Index('ix_jobs_status_locked_until', 'status', 'locked_until'),
+    )
+    id: int = Field(default=None, primary_key=True, description='任务id')
+    kind: str = Field(description='任务类型')
+    key: Optional[str] = Field(default=None, index=True, description='合并键，相同键的待执行任务会被合并')
+    payload: str = Field(sa_column=Column(Text, nullable=False), description='任务参数json')
+    status: JobStatus = Field(default=JobStatus.PENDING, description='任务状态')
+    priority: int = Field(default=0, description='优先级，数值越小越先执行')
+    attempts: int = Field(default=0, description='已尝试次数')
+    max_attempts: int = Field(default=1, description='最大尝试次数')
+    run_after: float = Field(description='最早可执行的时间戳')
+    coalesce_until: Optional[float] = Field(default=None, description='合并任务时run_after最多推迟到的时间戳')
+    locked_until: Optional[float] = Field(default=None, description='租约到期时间戳，过期后可被其他worker重新领取')
+    locked_by: Optional[str] = Field(default=None, description='持有租约的worker')
+    llm_wait: float = Field(default=0, description='累计排队等待大模型调度的时间（秒）')
+    last_error: Optional[str] = Field(default=None, sa_column=Column(Text), description='最近一次失败原因')
+    cancel_requested: Optional[str] = Field(default=None, description='取消原因，不为空时执行中的任务会在下一个检查点停止')
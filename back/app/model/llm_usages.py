@@ -0,0 +1,22 @@
+from typing import Optional
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Column, Text
+from . import TimestampMixin
+
+
+class LlmUsage(TimestampMixin, SQLModel, table=True):
+    __tablename__ = "llm_usages" # pyright: ignore[reportAssignmentType]
+    id: int = Field(default=None, primary_key=True)
+    repo_id: int = Field(foreign_key="repositories.id", index=True, description='仓库id')
+    commit_review_id: Optional[int] = Field(default=None, foreign_key="commit_reviews.id", index=True, description='对应的commit评审')
+    mr_review_id: Optional[int] = Field(default=None, foreign_key="mr_reviews.id", index=True, description='对应的merge request评审')
+    analysis_id: Optional[int] = Field(default=None, foreign_key="repository_analyses.id", index=True, description='对应的仓库分析')
+    kind: str = Field(description='任务类型：commit_review、mr_review或repo_analysis')
+    model: str = Field(description='使用的模型')
+    prompt_tokens: int = Field(default=0, description='输入token数')
+    completion_tokens: int = Field(default=0, description='输出token数')
+    cached_tokens: int = Field(default=0, description='输入中命中缓存的token数')
+    turns: int = Field(default=0, description='请求轮数')
+    tool_calls: int = Field(default=0, description='函数调用次数')
+    tool_names: str = Field(default='{}', sa_column=Column(Text, nullable=False), description='各函数的调用次数json')
+    succeeded: bool = Field(default=True, description='任务是否成功')
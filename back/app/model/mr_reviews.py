@@ -1,12 +1,16 @@
 from typing import Optional
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from . import TimestampMixin, ReviewStatus
 
 
 class MrReview(TimestampMixin, SQLModel, table=True):
     __tablename__ = "mr_reviews" # pyright: ignore[reportAssignmentType]
+    __table_args__ = (
+        Index('ix_mr_reviews_repo_id_mr_iid', 'repo_id', 'mr_iid', unique=True),
+    )
     id: int = Field(default=None, primary_key=True)
     repo_id: int = Field(foreign_key="repositories.id")
     mr_iid: int = Field(description='项目内的merge request id')
-    review_json: Optional[str] = Field(default=None, description='评析结果')
+    review_hash: Optional[str] = Field(default=None, max_length=64, description='评析结果，存放于blobs表')
     status: ReviewStatus = Field(default=ReviewStatus.PENDING, description='评析状态')
@@ -1,6 +1,6 @@
 from typing import Optional
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import Column, Integer
+from sqlalchemy import Column, Integer, Text
 from sqlalchemy.orm import relationship
 from . import TimestampMixin
 from .repository_analyses import RepositoryAnalysis
@@ -31,3 +31,4 @@ class Repository(TimestampMixin, SQLModel, table=True):
         )
     )
     webhook_id: int = Field(description='webhook id')
+    review_exclude: Optional[str] = Field(default=None, sa_column=Column(Text), description='审查时跳过的文件glob，每行一个')
@@ -1,11 +1,18 @@
 from typing import Optional
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from . import TimestampMixin, ReviewStatus
 
 
 class RepositoryAnalysis(TimestampMixin, SQLModel, table=True):
     __tablename__ = "repository_analyses" # type: ignore
+    __table_args__ = (
+        Index('ix_repository_analyses_repo_id_created_at', 'repo_id', 'created_at'),
+    )
     id: int = Field(default=None, primary_key=True, description='仓库分析id')
     repo_id: int = Field(foreign_key="repositories.id", description='仓库id')
     status: ReviewStatus = Field(default=ReviewStatus.PENDING, description='仓库分析状态')
-    analysis_json: Optional[str] = Field(default=None, description='仓库分析结果', nullable=True)
+    analysis_hash: Optional[str] = Field(default=None, max_length=64, description='仓库分析结果，存放于blobs表')
+    branch: Optional[str] = Field(default=None, description='分析的分支')
+    commit_sha: Optional[str] = Field(default=None, description='分析时分支指向的commit，增量分析以此为基准')
+    score: Optional[float] = Field(default=None, description='分析得分，失败为-1')
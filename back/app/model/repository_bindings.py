@@ -1,10 +1,14 @@
 from sqlmodel import SQLModel, Field
-from sqlalchemy import Column, Integer, ForeignKey
+from sqlalchemy import Column, Integer, ForeignKey, Index
 from . import TimestampMixin
 
 
 class RepositoryBinding(TimestampMixin, SQLModel, table=True):
     __tablename__ = "repository_bindings" # type: ignore
+    __table_args__ = (
+        Index('ix_repository_bindings_user_id', 'user_id'),
+        Index('ix_repository_bindings_repo_id_user_id', 'repo_id', 'user_id', unique=True),
+    )
     id: int = Field(default=None, primary_key=True, description='仓库绑定记录id')
     user_id: int = Field(sa_column=Column(
         Integer,
@@ -1,9 +1,13 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from . import TimestampMixin
 
 
 class RepositoryMetric(TimestampMixin, SQLModel, table=True):
     __tablename__ = "repository_metrics" # type: ignore
+    __table_args__ = (
+        Index('ix_repository_metrics_repo_id_created_at', 'repo_id', 'created_at'),
+    )
     id: int = Field(default=None, primary_key=True, description='仓库指标记录id')
     repo_id: int = Field(foreign_key="repositories.id", description='仓库id')
     quality_score: float = Field(description='质量得分')
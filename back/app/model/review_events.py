@@ -0,0 +1,12 @@
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Column, Text
+
+
+class ReviewEvent(SQLModel, table=True):
+    __tablename__ = "review_events" # pyright: ignore[reportAssignmentType]
+    id: int = Field(default=None, primary_key=True)
+    subject: str = Field(index=True, description='事件所属的评审/分析，如commit_review:1')
+    seq: int = Field(description='同一subject内递增的序号')
+    type: str = Field(description='事件类型')
+    data: str = Field(sa_column=Column(Text, nullable=False), description='事件内容json')
+    created_at: float = Field(description='事件时间戳')
@@ -9,7 +9,7 @@ class Token(TimestampMixin, SQLModel, table=True):
     token: str = Field(primary_key=True, description="token")
     user_id: int = Field(foreign_key="users.id", description="用户id", ondelete="CASCADE")
     user: User = Relationship()
-    exp: int = Field(nullable=False, description="过期时间")
+    exp: int = Field(nullable=False, index=True, description="过期时间")
 
     @property
     def is_expired(self) -> bool:
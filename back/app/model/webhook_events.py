@@ -0,0 +1,10 @@
+from typing import Optional
+from sqlmodel import SQLModel, Field
+
+
+class WebhookEvent(SQLModel, table=True):
+    __tablename__ = "webhook_events" # pyright: ignore[reportAssignmentType]
+    id: int = Field(default=None, primary_key=True)
+    event_key: str = Field(max_length=191, unique=True, description='去重键，如事件UUID或推送的(仓库, before, after)')
+    received_at: float = Field(index=True, description='接收时间戳')
+    job_id: Optional[int] = Field(default=None, description='记录该键的webhook任务id，该任务重试时不视为重复投递')
@@ -1,9 +1,13 @@
 from sqlmodel import SQLModel, Field
-from sqlalchemy import Column, Text
+from sqlalchemy import Column, LargeBinary
 from . import TimestampMixin
 
 
 class WebhookLog(TimestampMixin, SQLModel, table=True):
+    # 早期版本的表只有未压缩的data(TEXT)列，由迁移v0006（app/db/migrations）重建为当前结构
     __tablename__ = "webhook_logs" # pyright: ignore[reportAssignmentType]
     id: int = Field(default=None, primary_key=True)
-    data: str = Field(sa_column=Column(Text), description='收到的webhook数据')
+    data: bytes = Field(sa_column=Column(LargeBinary(length=2**24), nullable=False), description='收到的webhook数据，zlib压缩')
+    size: int = Field(description='压缩前的数据大小')
+    stored_size: int = Field(description='压缩后的数据大小')
+    received_at: float = Field(index=True, description='接收时间戳')
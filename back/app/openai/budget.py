@@ -0,0 +1,129 @@
+from typing import Any, Optional
+from ..core import metrics
+from ..core.config import settings
+from ..core.execution import current_cancel_token
+from .chunking import count_tokens
+from .scheduler import estimate_tokens
+import json, logging
+
+__all__ = [
+    'TokenBudget',
+]
+logger = logging.getLogger(__name__)
+
+_usage_stats = {'prompt_tokens': 0, 'completion_tokens': 0, 'truncated': 0, 'deduplicated': 0, 'compacted': 0, 'limited': 0}
+metrics.register('llm_usage', lambda: _usage_stats)
+
+
+class TokenBudget:
+    """一次审查/分析任务的token预算和执行限制，负责控制函数调用结果的大小和对话历史的长度"""
+
+    def __init__(self, max_tokens: Optional[int] = None):
+        self.max_tokens = settings.llm_job_token_budget if max_tokens is None else max_tokens
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.turns = 0
+        self.tool_calls = 0
+        self._cancel_token = current_cancel_token()     # 任务的截止时间
+        self._results: dict[str, tuple[str, str]] = {}  # 函数调用 -> (tool_call_id, 结果)
+        self._compacted: set[str] = set()   # 结果已被压缩的tool_call_id
+
+    @property
+    def used(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def limit_reason(self) -> Optional[str]:
+        """已达到的限制，未达到任何限制时返回None"""
+        if self.max_tokens > 0 and self.used >= self.max_tokens:
+            return f'token预算（{self.max_tokens}）'
+        if settings.llm_max_turns > 0 and self.turns >= settings.llm_max_turns:
+            return f'最大请求轮数（{settings.llm_max_turns}）'
+        if settings.llm_max_tool_calls > 0 and self.tool_calls >= settings.llm_max_tool_calls:
+            return f'函数调用次数上限（{settings.llm_max_tool_calls}）'
+        if self._cancel_token is not None and self._cancel_token.expired:
+            return '任务执行时间上限'
+        return None
+
+    @property
+    def exhausted(self) -> bool:
+        return self.limit_reason is not None
+
+    def force_final(self, messages: list) -> str:
+        """达到限制后，要求模型不再调用函数，直接给出结果。返回达到的限制"""
+        reason = self.limit_reason or ''
+        logger.warning(f'已达到{reason}，要求模型直接给出结果')
+        _usage_stats['limited'] += 1
+        messages.append({'role': 'user', 'content': f'已达到{reason}，请不要再调用函数，根据已有信息按要求的格式直接给出最终结果。'})
+        return reason
+
+    def add_usage(self, usage: Any):
+        """累计一次请求的实际用量"""
+        self.turns += 1
+        if usage is None:
+            return
+        self.prompt_tokens += usage.prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+        _usage_stats['prompt_tokens'] += usage.prompt_tokens
+        _usage_stats['completion_tokens'] += usage.completion_tokens
+
+    @staticmethod
+    def call_key(name: str, arguments: str) -> str:
+        try:
+            arguments = json.dumps(json.loads(arguments), sort_keys=True)
+        except json.JSONDecodeError:
+            pass
+        return f'{name}:{arguments}'
+
+    def lookup(self, key: str) -> Optional[str]:
+        """相同的函数调用已执行过时，返回给模型的内容"""
+        if key not in self._results:
+            return None
+        tool_call_id, content = self._results[key]
+        if tool_call_id in self._compacted:     # 原结果已不在对话中，重新附上
+            return content
+        return self.reference(tool_call_id)
+
+    @staticmethod
+    def reference(tool_call_id: str) -> str:
+        _usage_stats['deduplicated'] += 1
+        return json.dumps({'note': f'与调用{tool_call_id}的参数相同，结果见前文'}, ensure_ascii=False)
+
+    def remember(self, key: str, tool_call_id: str, content: str):
+        self._results[key] = (tool_call_id, content)
+
+    def truncate(self, content: str) -> str:
+        """截断过大的函数调用结果"""
+        limit = settings.llm_tool_output_max_tokens
+        tokens = count_tokens(content)
+        if limit <= 0 or tokens <= limit:
+            return content
+        _usage_stats['truncated'] += 1
+        kept = content[:len(content) * limit // tokens]
+        return kept + f'\n...[结果过长已截断，原始结果约{tokens}个token，请缩小查询范围]'
+
+    def compact(self, messages: list):
+        """对话历史超过阈值时，将较早的函数调用结果替换为简短说明"""
+        threshold = settings.llm_compact_threshold
+        if threshold <= 0 or estimate_tokens(messages) <= threshold:
+            return
+        tool_messages = [m for m in messages if isinstance(m, dict) and m.get('role') == 'tool']
+        keep = settings.llm_compact_keep_recent
+        for message in tool_messages[:len(tool_messages) - keep] if keep > 0 else tool_messages:
+            if message['tool_call_id'] in self._compacted:
+                continue
+            message['content'] = json.dumps({'note': '较早的函数调用结果已省略，如仍需要请重新调用'}, ensure_ascii=False)
+            self._compacted.add(message['tool_call_id'])
+            _usage_stats['compacted'] += 1
+
+    def report(self) -> dict:
+        usage = {
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.used,
+            'budget': self.max_tokens,
+            'turns': self.turns,
+            'tool_calls': self.tool_calls,
+        }
+        logger.info(f'本次对话token用量：{usage}')
+        return usage
@@ -0,0 +1,174 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Optional
+from ..core import metrics
+from ..core.config import settings
+import functools, hashlib, inspect, json, logging, os, re, time
+
+__all__ = [
+    'ToolCache',
+    'tool_cache',
+    'cached',
+    'is_commit_sha',
+]
+logger = logging.getLogger(__name__)
+
+_SHA_RE = re.compile(r'^(?:[0-9a-f]{40}|[0-9a-f]{64})$')
+
+
+def is_commit_sha(ref: Any) -> bool:
+    """是否为完整的提交SHA。完整SHA指向的内容不会改变，分支名、标签名和短SHA则不然"""
+    return isinstance(ref, str) and _SHA_RE.match(ref) is not None
+
+
+class ToolCache:
+    """大模型函数调用结果的缓存。
+    以不可变SHA为键的结果永久有效，在内存中按LRU淘汰，淘汰时可写入磁盘；其余结果只缓存ttl秒"""
+
+    def __init__(self, max_bytes: int, spill_dir: str = '', spill_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self._entries: OrderedDict[str, tuple[bytes, float]] = OrderedDict()  # 键 -> (JSON, 过期时间)
+        self._bytes = 0
+        self._lock = Lock()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'spilled': 0}
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[0]
+                self._remove(key)
+        if (data := self._read_spilled(key)) is not None:
+            with self._lock:
+                self._stats['disk_hits'] += 1
+                self._put(key, data, float('inf'))
+            return data
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, key: str, data: bytes, ttl: Optional[float] = None):
+        """ttl为None表示永久有效"""
+        if len(data) > self.max_bytes:
+            return
+        expires_at = float('inf') if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            spilled = self._put(key, data, expires_at)
+        for spilled_key, spilled_data in spilled:
+            self._spill(spilled_key, spilled_data)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self._stats, 'entries': len(self._entries), 'bytes': self._bytes}
+
+    def _put(self, key: str, data: bytes, expires_at: float) -> list[tuple[str, bytes]]:
+        """写入内存并按LRU淘汰，返回需要写入磁盘的条目。调用时需持有锁"""
+        self._remove(key)
+        self._entries[key] = (data, expires_at)
+        self._bytes += len(data)
+        spilled = []
+        while self._bytes > self.max_bytes:
+            evicted_key, (evicted, evicted_expires_at) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._stats['evictions'] += 1
+            if evicted_expires_at == float('inf'):
+                spilled.append((evicted_key, evicted))
+        return spilled
+
+    def _remove(self, key: str):
+        if (entry := self._entries.pop(key, None)) is not None:
+            self._bytes -= len(entry[0])
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, hashlib.sha256(key.encode()).hexdigest())
+
+    def _spill(self, key: str, data: bytes):
+        if not self.spill_dir:
+            return
+        path = self._spill_path(key)
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            logger.exception('函数调用缓存写入磁盘失败')
+            return
+        with self._lock:
+            self._stats['spilled'] += 1
+        if self.spill_max_bytes > 0:
+            self._prune_spilled()
+
+    def _read_spilled(self, key: str) -> Optional[bytes]:
+        if not self.spill_dir:
+            return None
+        try:
+            with open(self._spill_path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _prune_spilled(self):
+        """磁盘缓存超出上限时，删除最早写入的文件"""
+        files = []
+        with os.scandir(self.spill_dir) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.spill_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+tool_cache = ToolCache(
+    settings.tool_cache_max_bytes,
+    settings.tool_cache_dir,
+    settings.tool_cache_dir_max_bytes,
+)
+metrics.register('tool_cache', tool_cache.snapshot)
+
+
+def cached(*sha_args: str):
+    """缓存gitlab查询函数的结果。sha_args中的参数均为完整SHA时结果永久缓存，否则只缓存tool_cache_ttl秒。
+    第一个参数gl不参与缓存键"""
+    def decorator(func: Callable[..., Any]):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            arguments.pop('gl', None)
+            key = f'{func.__name__}:' + json.dumps(arguments, sort_keys=True, default=str)
+            if (data := tool_cache.get(key)) is not None:
+                return json.loads(data)
+            result = func(*args, **kwargs)
+            immutable = bool(sha_args) and all(is_commit_sha(arguments[name]) for name in sha_args)
+            if immutable or settings.tool_cache_ttl > 0:
+                tool_cache.set(
+                    key,
+                    json.dumps(result, ensure_ascii=False, default=str).encode(),
+                    None if immutable else settings.tool_cache_ttl
+                )
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,101 @@
+from typing import Any, Optional
+from threading import Lock, Thread
+import json, logging, posixpath
+
+__all__ = [
+    'load_tokenizer',
+    'count_tokens',
+    'split_diffs',
+    'merge_reviews',
+]
+logger = logging.getLogger(__name__)
+
+_encoding: Optional[Any] = None
+_loader: Optional[Thread] = None
+_loader_lock = Lock()
+
+
+def _load_encoding():
+    global _encoding
+    try:
+        import tiktoken
+        _encoding = tiktoken.get_encoding('cl100k_base')
+    except Exception:   # 无法下载编码表时一直按字符数估算
+        logger.warning('无法加载tiktoken编码表，按字符数估算token数', exc_info=True)
+
+
+def load_tokenizer(wait: bool = False):
+    """在后台线程中加载编码表。首次加载需要下载，无法访问外网时可将编码表放在TIKTOKEN_CACHE_DIR中"""
+    global _loader
+    with _loader_lock:
+        if _loader is None:
+            _loader = Thread(target=_load_encoding, name='tokenizer-loader', daemon=True)
+            _loader.start()
+    if wait:
+        _loader.join()
+
+
+def count_tokens(text: str) -> int:
+    """估算文本的token数。编码表加载完成前按字符数估算，不阻塞调用方"""
+    if _encoding is None:
+        load_tokenizer()
+        return len(text) // 3
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def _diff_tokens(diff: dict) -> int:
+    return count_tokens(json.dumps(diff, ensure_ascii=False, default=str))
+
+
+def _directory(diff: dict) -> str:
+    return posixpath.dirname(diff.get('new_path') or diff.get('old_path') or '')
+
+
+def split_diffs(diffs: list[dict], max_tokens: int) -> list[list[dict]]:
+    """将compare结果中的文件差异按目录分组，再装箱为不超过max_tokens的若干块。
+    目录超出上限时按文件拆分，单个文件超出上限时独占一块"""
+    groups: dict[str, list[dict]] = {}
+    for diff in diffs:
+        groups.setdefault(_directory(diff), []).append(diff)
+
+    chunks: list[list[dict]] = []
+    current: list[dict] = []
+    current_tokens = 0
+
+    def add(items: list[dict], tokens: int):
+        nonlocal current, current_tokens
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.extend(items)
+        current_tokens += tokens
+
+    for group in groups.values():
+        sizes = [_diff_tokens(diff) for diff in group]
+        if sum(sizes) <= max_tokens:
+            add(group, sum(sizes))
+        else:
+            for diff, size in zip(group, sizes):
+                add([diff], size)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def merge_reviews(reviews: list[str]) -> tuple[list[str], dict, int]:
+    """合并各块的审查结果，返回(各块的info, 按文件合并的suggestion, 最高的level)"""
+    infos, suggestion, level = [], {}, 0
+    for review_json in reviews:
+        try:
+            review = json.loads(review_json)
+        except json.JSONDecodeError:
+            logger.warning('分块审查结果不是有效的JSON，作为概要处理')
+            review = {'info': review_json}
+        infos.append(str(review.get('info', '')))
+        if isinstance(review.get('suggestion'), dict):
+            suggestion.update(review['suggestion'])
+        try:
+            level = max(level, int(review.get('level', 0)))
+        except (TypeError, ValueError):
+            pass
+    return infos, suggestion, level
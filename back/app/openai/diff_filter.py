@@ -0,0 +1,166 @@
+"""
+审查前的差异过滤。
+依次检查每个文件的差异，去掉依赖锁文件、生成的代码、第三方代码和二进制文件，
+规则参考github linguist，仓库可在.gitattributes中用linguist-generated/linguist-vendored/binary标记或取消标记。
+过大的差异不会被去掉，只是不放入提示词，由模型按需通过函数调用查看
+"""
+from typing import Callable, Iterable, Optional, Sequence
+from ..core.config import settings
+from .chunking import count_tokens
+import re
+
+__all__ = [
+    'glob_to_regex',
+    'parse_gitattributes',
+    'filter_diffs',
+]
+
+# 依赖锁文件、压缩文件、protobuf/grpc等生成的文件
+GENERATED_PATHS = re.compile(r'''(?x)
+    (^|/)(package-lock\.json|npm-shrinkwrap\.json|yarn\.lock|pnpm-lock\.yaml|bun\.lockb|composer\.lock
+         |Gemfile\.lock|Cargo\.lock|poetry\.lock|Pipfile\.lock|uv\.lock|go\.sum|Podfile\.lock|pubspec\.lock
+         |mix\.lock|packages\.lock\.json|flake\.lock)$
+    | [.-]min\.(js|css)$ | \.(js|css)\.map$
+    | (_pb2(_grpc)?\.pyi?|\.pb(\.gw)?\.go|\.pb\.(cc|h)|_(grpc_)?pb\.(js|d\.ts))$
+    | \.(designer\.cs|g\.dart|freezed\.dart)$
+    | (^|/)__snapshots__/
+''')
+VENDORED_PATHS = re.compile(r'(^|/)(vendor|node_modules|third[_-]party|bower_components|Godeps)/')
+# 生成的代码文件开头常见的标记
+GENERATED_MARKERS = re.compile(
+    r'Code generated .* DO NOT EDIT|@generated|<auto-generated|automatically generated|autogenerated by',
+    re.IGNORECASE
+)
+_MARKER_LINES = 20
+_BINARY_MARKER = re.compile(r'(GIT binary patch|Binary files .* differ)$', re.MULTILINE)
+
+
+def glob_to_regex(pattern: str) -> re.Pattern:
+    """按.gitattributes/.gitignore的规则将glob转换为正则：不含/的模式匹配任意目录下的文件名，
+    **匹配任意层目录，*和?不匹配/，以/结尾的模式匹配目录下的所有文件"""
+    pattern = pattern.strip()
+    anchored = '/' in pattern.rstrip('/')
+    directory = pattern.endswith('/')
+    pattern = pattern.strip('/')
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    prefix = '^' if anchored else '(?:^|/)'
+    suffix = '/' if directory else '(?:$|/)'
+    return re.compile(prefix + regex + suffix)
+
+
+def parse_gitattributes(text: str) -> list[tuple[re.Pattern, str, bool]]:
+    """解析.gitattributes中的linguist-generated、linguist-vendored、binary和diff属性，返回[(路径正则, 属性, 是否设置)]"""
+    rules = []
+    for line in text.splitlines():
+        parts = line.split()
+        if not parts or parts[0].startswith('#'):
+            continue
+        for attr in parts[1:]:
+            name, _, value = attr.lstrip('-!').partition('=')
+            if name not in ('linguist-generated', 'linguist-vendored', 'binary', 'diff'):
+                continue
+            enabled = not attr.startswith(('-', '!')) and value.lower() not in ('false', '0')
+            rules.append((glob_to_regex(parts[0]), name, enabled))
+    return rules
+
+
+def _gitattribute(rules: list[tuple[re.Pattern, str, bool]], path: str, name: str) -> Optional[bool]:
+    """后面的规则覆盖前面的规则，没有匹配的规则时返回None"""
+    result = None
+    for regex, attr, enabled in rules:
+        if attr == name and regex.search(path):
+            result = enabled
+    return result
+
+
+def _path(diff: dict) -> str:
+    return diff.get('new_path') or diff.get('old_path') or ''
+
+
+def _added_head(diff: str) -> str:
+    """差异中新增内容的开头部分"""
+    lines = [line[1:] for line in diff.splitlines() if line.startswith('+')]
+    return '\n'.join(lines[:_MARKER_LINES])
+
+
+def filter_diffs(
+    diffs: list[dict],
+    exclude: Sequence[str] = (),
+    gitattributes: str = '',
+    max_file_tokens: Optional[int] = None,
+) -> tuple[list[dict], list[dict]]:
+    """过滤compare结果中的文件差异，返回(保留的差异, 被去掉的文件[{path, reason}])。
+    exclude为不审查的路径glob（全局配置和仓库配置），gitattributes为仓库.gitattributes的内容。
+    过大或gitlab未返回内容的差异仍然保留，但去掉差异内容并在omitted中说明原因"""
+    exclude_regexes = [glob_to_regex(pattern) for pattern in (*settings.review_exclude_globs, *exclude) if pattern.strip()]
+    attributes = parse_gitattributes(gitattributes)
+    max_tokens = settings.review_max_file_tokens if max_file_tokens is None else max_file_tokens
+
+    def excluded(diff: dict, path: str) -> Optional[str]:
+        if any(regex.search(path) for regex in exclude_regexes):
+            return '匹配排除规则'
+        return None
+
+    def binary(diff: dict, path: str) -> Optional[str]:
+        """只根据确切的证据判断，空差异（新建空文件、只修改权限、gitlab折叠的差异）不算二进制文件"""
+        text = diff.get('diff') or ''
+        if _gitattribute(attributes, path, 'binary') or _gitattribute(attributes, path, 'diff') is False:
+            return '二进制文件'
+        if _BINARY_MARKER.match(text) or '\0' in text:
+            return '二进制文件'
+        return None
+
+    def generated(diff: dict, path: str) -> Optional[str]:
+        marked = _gitattribute(attributes, path, 'linguist-generated')
+        if marked is not None:
+            return '生成的文件' if marked else None
+        if not settings.review_skip_generated:
+            return None
+        if diff.get('generated_file') or GENERATED_PATHS.search(path) or GENERATED_MARKERS.search(_added_head(diff.get('diff') or '')):
+            return '生成的文件'
+        return None
+
+    def vendored(diff: dict, path: str) -> Optional[str]:
+        marked = _gitattribute(attributes, path, 'linguist-vendored')
+        if marked is not None:
+            return '第三方代码' if marked else None
+        if settings.review_skip_generated and VENDORED_PATHS.search(path):
+            return '第三方代码'
+        return None
+
+    def omitted(diff: dict) -> Optional[str]:
+        if diff.get('too_large') or diff.get('collapsed'):
+            return 'gitlab未返回差异内容'
+        if max_tokens > 0 and (tokens := count_tokens(diff.get('diff') or '')) > max_tokens:
+            return f'差异过大（约{tokens}个token）'
+        return None
+
+    checks: Iterable[Callable[[dict, str], Optional[str]]] = (excluded, binary, generated, vendored)
+    kept, dropped = [], []
+    for diff in diffs:
+        path = _path(diff)
+        reason = next((reason for check in checks if (reason := check(diff, path)) is not None), None)
+        if reason is not None:
+            dropped.append({'path': path, 'reason': reason})
+        elif (reason := omitted(diff)) is not None:
+            kept.append({**diff, 'diff': '', 'omitted': f'{reason}，未放入提示词，请通过get_file_content等函数查看该文件'})
+        else:
+            kept.append(diff)
+    return kept, dropped
@@ -1,27 +1,36 @@
 import gitlab
+from .cache import cached
+from .projections import (
+    project_repo_info, project_branches, project_tree, project_commits, project_commit, project_compare, project_branch
+)
 
-def get_repo_info(gl: gitlab.Gitlab, project_id):
+@cached()
+def get_repo_info(gl: gitlab.Gitlab, project_id, verbose=False):
     """
     根据项目 ID 获取 GitLab 仓库的基本信息。
     """
     project = gl.projects.get(project_id)
-    return project.attributes
+    return project_repo_info(project.attributes, verbose)
 
-def get_repo_branches(gl: gitlab.Gitlab, project_id):
+@cached()
+def get_repo_branches(gl: gitlab.Gitlab, project_id, verbose=False):
     """
     根据项目 ID 获取 GitLab 仓库的分支列表。
     """
-    project = gl.projects.get(project_id)
-    return [branch.name for branch in project.branches.list(get_all=True)]
+    project = gl.projects.get(project_id, lazy=True)
+    return project_branches([branch.attributes for branch in project.branches.list(get_all=True)], verbose)
 
-def get_repo_tree(gl: gitlab.Gitlab, project_id, ref=None):
+@cached('ref')
+def get_repo_tree(gl: gitlab.Gitlab, project_id, ref=None, verbose=False):
     """
     根据项目 ID 获取 GitLab 仓库的文件树结构。
     可通过 ref 指定分支、标签或提交（默认为仓库默认分支）。
+    默认只返回文件路径列表。
     """
-    project = gl.projects.get(project_id)
-    return project.repository_tree(ref=ref, recursive=True, get_all=True) # type: ignore
+    project = gl.projects.get(project_id, lazy=True)
+    return project_tree(project.repository_tree(ref=ref, recursive=True, get_all=True), verbose) # type: ignore
 
+@cached('ref')
 def get_file_content(gl: gitlab.Gitlab, project_id, ref, file_path):
     """
     获取 GitLab 仓库中指定文件的内容。
@@ -31,12 +40,13 @@ def get_file_content(gl: gitlab.Gitlab, project_id, ref, file_path):
       - file_path: 仓库中文件的完整路径
     返回 UTF-8 解码后的文件内容字符串。
     """
-    project = gl.projects.get(project_id)
+    project = gl.projects.get(project_id, lazy=True)
     file = project.files.get(file_path = file_path, ref = ref)
     content_bytes = file.decode()
     return content_bytes.decode('utf-8') if isinstance(content_bytes, bytes) else content_bytes
 
-def get_project_commits(gl: gitlab.Gitlab, project_id, ref_name=None, per_page=20):
+@cached('ref_name')
+def get_project_commits(gl: gitlab.Gitlab, project_id, ref_name=None, per_page=20, verbose=False):
     """
     获取 GitLab 项目的提交列表。
     参数:
@@ -45,23 +55,14 @@ def get_project_commits(gl: gitlab.Gitlab, project_id, ref_name=None, per_page=2
       - per_page: 每页返回的提交数量（默认 20）
     返回提交的摘要信息列表。
     """
-    project = gl.projects.get(project_id)
+    project = gl.projects.get(project_id, lazy=True)
     # 'ref_name' 可以是分支名、标签名或 commit SHA
     # 使用 per_page 限制返回的提交数量，例如最近的 20 个
     commits = project.commits.list(ref_name=ref_name, per_page=per_page, get_all=False)
-    return [
-        {
-            "id": c.id,
-            "short_id": c.short_id,
-            "title": c.title,
-            "message": c.message,
-            "author_name": c.author_name,
-            "created_at": c.created_at,
-        }
-        for c in commits
-    ]
+    return project_commits([c.attributes for c in commits], verbose)
 
-def get_commit_details(gl: gitlab.Gitlab, project_id, commit_sha):
+@cached('commit_sha')
+def get_commit_details(gl: gitlab.Gitlab, project_id, commit_sha, verbose=False):
     """
     获取指定提交的详细信息。
     参数:
@@ -69,38 +70,38 @@ def get_commit_details(gl: gitlab.Gitlab, project_id, commit_sha):
       - commit_sha: 提交的 SHA 值
     返回包含提交详细信息的字典。
     """
-    project = gl.projects.get(project_id)
-    commit = project.commits.get(commit_sha)
-    return {
-        "id": commit.id,
-        "message": commit.message,
-        "author_name": commit.author_name,
-        "author_email": commit.author_email,
-        "created_at": commit.created_at,
-        "stats": commit.stats
-    }
+    project = gl.projects.get(project_id, lazy=True)
+    return project_commit(project.commits.get(commit_sha).attributes, verbose)
 
-def get_commit_compare(gl: gitlab.Gitlab, project_id, before_sha, after_sha):
+@cached('before_sha', 'after_sha')
+def get_commit_compare(gl: gitlab.Gitlab, project_id, before_sha, after_sha, verbose=False):
     """
     获取指定提交的差异信息。
     参数:
       - project_id: 项目 ID
       - before_sha: 提交的 SHA 值
       - after_sha: 提交的 SHA 值
+    默认只返回提交摘要和各文件的差异。
     """
-    project = gl.projects.get(project_id)
-    return project.repository_compare(before_sha, after_sha)
+    project = gl.projects.get(project_id, lazy=True)
+    return project_compare(project.repository_compare(before_sha, after_sha), verbose) # type: ignore
 
 def get_mr_compare(gl: gitlab.Gitlab, project_id: int, mr_iid: int):
     """
-    获取merge request的差异信息。
+    获取merge request最新版本的差异信息，格式与 get_commit_compare 相同，另含 head_commit_sha。
     参数:
       - project_id: 项目 ID
       - mr_iid: merge request 的内部 ID
     """
-    return gl.projects.get(project_id).mergerequests.get(mr_iid).diffs.list()
+    mr = gl.projects.get(project_id, lazy=True).mergerequests.get(mr_iid, lazy=True)
+    versions = mr.diffs.list(per_page=1, get_all=False)   # 最新的版本在前
+    if not versions:
+        return {"commits": [], "diffs": [], "head_commit_sha": None}
+    version = mr.diffs.get(versions[0].id).attributes
+    return {**project_compare(version), "head_commit_sha": version.get("head_commit_sha")}
 
-def get_branch(gl: gitlab.Gitlab, project_id, branch_name):
+@cached()
+def get_branch(gl: gitlab.Gitlab, project_id, branch_name, verbose=False):
     """
     获取指定分支的详细信息，包括最新提交信息。
     参数:
@@ -108,18 +109,8 @@ def get_branch(gl: gitlab.Gitlab, project_id, branch_name):
       - branch_name: 分支名称
     返回包含分支和最新提交信息的字典。
     """
-    project = gl.projects.get(project_id)
-    branch = project.branches.get(branch_name)
-    return {
-        "name": branch.name,
-        "commit": {
-            "id": branch.commit['id'],
-            "message": branch.commit['message'],
-            "author_name": branch.commit['author_name'],
-            "author_email": branch.commit['author_email'],
-            "created_at": branch.commit['created_at']
-        }
-    }
+    project = gl.projects.get(project_id, lazy=True)
+    return project_branch(project.branches.get(branch_name).attributes, verbose)
 
 function_map = {
     "get_repo_info": get_repo_info,
@@ -145,6 +136,11 @@ tools = [
                         "type": "integer",
                         "description": "GitLab项目的ID。",
                     },
+                    "verbose": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "为true时返回更多仓库信息（链接、统计等）。",
+                    },
                 },
                 "required": ["project_id"],
             },
@@ -162,6 +158,11 @@ tools = [
                         "type": "integer",
                         "description": "GitLab项目的ID。",
                     },
+                    "verbose": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "为true时返回分支的最新提交和保护状态。",
+                    },
                 },
                 "required": ["project_id"],
             },
@@ -183,6 +184,11 @@ tools = [
                         "type": "string",
                         "description": "分支、标签或提交的名称，用于指定仓库的版本。默认为默认分支。",
                     },
+                    "verbose": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "为true时返回目录和文件模式，否则只返回文件路径。",
+                    },
                 },
                 "required": ["project_id"],
             },
@@ -234,6 +240,11 @@ tools = [
                         "default": 20,
                         "description": "每页返回的提交数量。",
                     },
+                    "verbose": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "为true时返回完整提交信息和作者邮箱等。",
+                    },
                 },
                 "required": ["project_id"],
             },
@@ -255,6 +266,11 @@ tools = [
                         "type": "string",
                         "description": "提交的SHA值。",
                     },
+                    "verbose": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "为true时返回作者邮箱、父提交等更多信息。",
+                    },
                 },
                 "required": ["project_id", "commit_sha"],
             },
@@ -280,6 +296,11 @@ tools = [
                         "type": "string",
                         "description": "比较的结束提交SHA值。",
                     },
+                    "verbose": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "为true时返回完整提交信息和文件模式。",
+                    },
                 },
                 "required": ["project_id", "before_sha", "after_sha"],
             },
@@ -301,6 +322,11 @@ tools = [
                         "type": "string",
                         "description": '分支名称。',
                     },
+                    "verbose": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "为true时返回分支的保护、合并状态等。",
+                    },
                 },
                 'required': ['project_id', 'branch_name'],
             }
@@ -1,76 +1,356 @@
-from typing import Optional
-from openai import OpenAI
-from gitlab import Gitlab
+from typing import Any, Optional, Sequence
+from openai import RateLimitError
+from gitlab import Gitlab, GitlabGetError
 from .functions import *
 from .prompt import *
+from .scheduler import Priority, scheduler, estimate_tokens
+from .chunking import count_tokens, split_diffs, merge_reviews
+from .diff_filter import filter_diffs
+from .budget import TokenBudget
+from .usage import record_abandoned, record_completion, record_model, record_tool_calls
+from .providers import Provider, provider_pool
+from .sections import split_sections, affected_paths
+from ..core import loop, progress
+from ..core.execution import ExecutionLimitExceeded, check_cancelled
 from ..core.config import settings
-import json, logging
+import asyncio, inspect, json, logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-client = OpenAI(
-    base_url=settings.openai_base_url,
-    api_key=settings.openai_api_key,
-)
+def _assistant_message(content: Optional[str], tool_calls: list[dict]) -> dict:
+    message: dict = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    return message
 
-def function_call(messages: list, gl: Gitlab) -> str:
-    """
-    方便复用function call流程
-    """
-    while True:
-        resp = client.chat.completions.create(
-            model=settings.openai_model,
+async def _request(provider: Provider, messages: list, final: bool = False) -> tuple[dict, Any]:
+    """向provider发出一次请求，返回(assistant消息, 用量)。流式输出时将内容片段作为进度事件上报。
+    final为True时不允许模型调用函数"""
+    tool_choice = "none" if final else "auto"
+    if not settings.llm_stream:
+        resp = await provider.client.chat.completions.create(
+            model=provider.model,
             messages=messages,
             tools=tools, # type: ignore
-            tool_choice="auto",
+            tool_choice=tool_choice,
         )
         msg = resp.choices[0].message
+        tool_calls = [
+            {"id": tc.id, "type": "function", "function": {"name": tc.function.name, "arguments": tc.function.arguments}} # type: ignore
+            for tc in msg.tool_calls or []
+        ]
+        record_model(provider.model)
+        return _assistant_message(msg.content, tool_calls), resp.usage
+
+    stream = await provider.client.chat.completions.create(
+        model=provider.model,
+        messages=messages,
+        tools=tools, # type: ignore
+        tool_choice=tool_choice,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    content: list[str] = []
+    tool_calls: dict[int, dict] = {}
+    usage = None
+    async for chunk in stream:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content.append(delta.content)
+            progress.emit('content', delta=delta.content)
+        # 函数调用按index分片返回，需要拼接
+        for tc in delta.tool_calls or []:
+            call = tool_calls.setdefault(tc.index, {"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+            if tc.id:
+                call["id"] = tc.id
+            if tc.function is not None:
+                call["function"]["name"] += tc.function.name or ""
+                call["function"]["arguments"] += tc.function.arguments or ""
+    record_model(provider.model)
+    return _assistant_message("".join(content) or None, [tool_calls[i] for i in sorted(tool_calls)]), usage
+
+async def _send(provider: Provider, messages: list, final: bool) -> tuple[dict, Any]:
+    try:
+        return await _request(provider, messages, final)
+    except asyncio.CancelledError:  # 对冲请求中较慢的一个被取消，输入已被计费
+        record_abandoned(estimate_tokens(messages))
+        raise
+
+async def _send_hedge(provider: Provider, messages: list, priority: Priority, final: bool) -> tuple[dict, Any]:
+    """对冲请求另外占用调度器的名额，计入并发数和token速率限制"""
+    async with scheduler.aslot(priority, estimate_tokens(messages)) as slot:
+        message, usage = await _send(provider, messages, final)
+        if usage is not None:
+            slot.tokens = usage.total_tokens
+        return message, usage
+
+async def _create_completion(messages: list, priority: Priority, final: bool = False) -> tuple[dict, Any]:
+    """经全局调度器限流后发出请求。请求失败时由服务池换服务重试，所有服务都限流时暂停调度并重试。
+    merge request评审的请求较慢时发出对冲请求"""
+    attempt = 0
+    hedge_delay = settings.llm_hedge_delay if priority == Priority.MR_REVIEW else 0
+    while True:
+        async with scheduler.aslot(priority, estimate_tokens(messages)) as slot:
+            try:
+                message, usage = await provider_pool.call(
+                    lambda provider: _send(provider, messages, final),
+                    hedge_delay,
+                    lambda provider: _send_hedge(provider, messages, priority, final),
+                )
+            except RateLimitError as e:
+                if attempt >= settings.llm_rate_limit_retries:
+                    raise
+                retry_after = e.response.headers.get('retry-after', '')
+                delay = float(retry_after) if retry_after.isdigit() else 2 ** attempt
+                logger.warning(f"触发限流，{delay}秒后重试")
+                scheduler.pause(delay)
+                attempt += 1
+                continue
+            if usage is not None:
+                slot.tokens = usage.total_tokens
+            return message, usage
+
+async def _call_tool(gl: Gitlab, name: str, args: dict):
+    """gitlab函数都是阻塞的，放到有界线程池中执行"""
+    # 仅在函数参数中包含 'gl' 时才注入
+    if "gl" in inspect.signature(function_map[name]).parameters:
+        args["gl"] = gl
+    logger.info(f"调用函数: {name}, 参数: {args}")
+    result = await loop.run_blocking(function_map[name], **args)
+    logger.info(f"函数执行结果: \n{result}")
+    return result
+
+async def _run_tool_call(gl: Gitlab, tool_call: dict, semaphore: asyncio.Semaphore) -> tuple[str, bool]:
+    """执行一次函数调用，返回(结果, 是否成功)。出错时把错误信息返回给模型，而不是中断整个审查"""
+    name = tool_call["function"]["name"]
+    async with semaphore:
+        check_cancelled()
+        progress.emit('tool_call', id=tool_call["id"], name=name, arguments=tool_call["function"]["arguments"])
+        try:
+            if name not in function_map:
+                raise ValueError(f"未知的函数: {name}")
+            args = json.loads(tool_call["function"]["arguments"])
+            result = await _call_tool(gl, name, args)
+        except Exception as e:
+            logger.warning(f"函数{name}执行失败: {type(e).__name__}: {e}")
+            progress.emit('tool_result', id=tool_call["id"], name=name, ok=False)
+            return json.dumps({"error": f"{type(e).__name__}: {e}"}, ensure_ascii=False), False
+    progress.emit('tool_result', id=tool_call["id"], name=name, ok=True)
+    return json.dumps(result, ensure_ascii=False, default=str), True
+
+async def _run_tool_calls(gl: Gitlab, tool_calls: list[dict], semaphore: asyncio.Semaphore, budget: TokenBudget) -> list[dict]:
+    """并行执行一轮中的函数调用，相同的调用只执行一次，结果按tool_call_id的顺序返回"""
+    keys = [budget.call_key(tc["function"]["name"], tc["function"]["arguments"]) for tc in tool_calls]
+    contents: dict[str, str] = {}
+    pending = {}    # 调用 -> 本轮中第一次出现的tool_call
+    for key, tool_call in zip(keys, tool_calls):
+        if budget.exhausted:
+            contents[tool_call["id"]] = json.dumps({"error": f"已达到{budget.limit_reason}，请根据已有信息直接给出最终结果"}, ensure_ascii=False)
+        elif (content := budget.lookup(key)) is not None:
+            contents[tool_call["id"]] = content
+        elif key not in pending:
+            budget.tool_calls += 1
+            pending[key] = tool_call
+    results = await asyncio.gather(*(_run_tool_call(gl, tool_call, semaphore) for tool_call in pending.values()))
+    for (key, tool_call), (content, ok) in zip(pending.items(), results):
+        contents[tool_call["id"]] = content = budget.truncate(content)
+        if ok:
+            budget.remember(key, tool_call["id"], content)
+    for key, tool_call in zip(keys, tool_calls):
+        if tool_call["id"] not in contents:    # 与本轮中较早的调用相同
+            contents[tool_call["id"]] = TokenBudget.reference(pending[key]["id"])
+    return [
+        {"role": "tool", "tool_call_id": tool_call["id"], "content": contents[tool_call["id"]]}
+        for tool_call in tool_calls
+    ]
+
+async def afunction_call(
+    messages: list,
+    gl: Gitlab,
+    priority: Priority = Priority.COMMIT_REVIEW,
+    budget: Optional[TokenBudget] = None,
+    tool_semaphore: Optional[asyncio.Semaphore] = None
+) -> str:
+    """
+    方便复用function call流程。分块审查等并行调用时由调用方传入共用的budget和tool_semaphore
+    """
+    # 同一轮中的多个函数调用并行执行，限制单次审查（含其所有分块）的并发数
+    semaphore = tool_semaphore or asyncio.Semaphore(settings.llm_tool_concurrency)
+    report = budget is None     # 共用预算时由调用方汇报用量
+    budget = budget or TokenBudget()
+    while True:
+        check_cancelled()
+        budget.compact(messages)
+        # 达到轮数、函数调用次数、时间等限制后，最后请求一次，要求模型直接给出结果
+        limit = budget.force_final(messages) if budget.exhausted else None
+        if limit is not None:
+            progress.emit('limit_reached', reason=limit)
+            msg, usage = await _create_completion(messages, priority, final=True)
+            msg.pop("tool_calls", None)     # 个别服务商会忽略tool_choice
+        else:
+            msg, usage = await _create_completion(messages, priority)
+        budget.add_usage(usage)
+        record_completion(usage)
         messages.append(msg)
         # 模型要调用函数
-        if msg.tool_calls:
-            tool_calls = msg.tool_calls
-            for tool_call in tool_calls:
-                name = tool_call.function.name
-                args = json.loads(tool_call.function.arguments)
-
-                # 仅在函数参数中包含 'gl' 时才注入
-                if "gl" in function_map[name].__code__.co_varnames:
-                    args["gl"] = gl
-                logger.info(f"调用函数: {name}, 参数: {args}")
-                result = function_map[name](**args)
-                logger.info(f"函数执行结果: \n{result}")
-                # 把执行结果塞回对话
-                messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": json.dumps(result, ensure_ascii=False)
-                })
+        if msg.get("tool_calls") and limit is None:
+            record_tool_calls(msg["tool_calls"])
+            messages.extend(await _run_tool_calls(gl, msg["tool_calls"], semaphore, budget))
             continue
+        if limit is not None and not msg["content"]:
+            raise ExecutionLimitExceeded(f"已达到{limit}，模型未给出最终结果")
 
-        logger.info(f"消息内容: \n{msg.content}")
+        logger.info(f"消息内容: \n{msg['content']}")
         break
-    return msg.content or ""
+    if report:
+        budget.report()
+    return msg["content"] or ""
 
-def generate_repo_analysis(gl: Gitlab, project_id: int, ref: Optional[str] = None) -> str:
+async def agenerate_repo_analysis(gl: Gitlab, project_id: int, ref: Optional[str] = None) -> str:
     """
     Generate a detailed analysis of the GitLab repository.
     """
     messages = [{"role": "user", "content": repo_analysis_prompt.format(project_id=project_id, ref=ref)}]
-    return function_call(messages, gl)
+    return await afunction_call(messages, gl, Priority.REPO_ANALYSIS)
 
-def generate_commit_review(gl: Gitlab, project_id: int, before_sha: str, after_sha: str) -> str:
+async def aupdate_repo_analysis(gl: Gitlab, project_id: int, ref: str, analysis: str, changed: dict[str, str]) -> Optional[str]:
     """
-    为 GitLab 仓库中的提交差异生成详细审查。
+    增量更新仓库分析：只重新生成引用了变更文件的章节，其余章节原样保留。
+    changed为变更文件路径到差异的映射。需要变更的章节过多或无法拆分章节时返回None，由调用方重新完整分析。
     """
-    diff = get_commit_compare(gl, project_id, before_sha, after_sha)
+    head, sections = split_sections(analysis)
+    if not sections:
+        return None
+    changed_paths = set(changed)
+    affected = [i for i, section in enumerate(sections) if affected_paths(section, changed_paths)]
+    logger.info(f"{len(sections)}个章节中有{len(affected)}个需要更新")
+    if len(affected) > len(sections) * settings.analysis_incremental_max_ratio:
+        return None
+    semaphore = asyncio.Semaphore(settings.review_chunk_concurrency)
+    tool_semaphore = asyncio.Semaphore(settings.llm_tool_concurrency)
+    budget = TokenBudget()
+
+    async def update_section(section: str) -> str:
+        diff = {path: changed[path] for path in affected_paths(section, changed_paths)}
+        messages = [{"role": "user", "content": repo_section_update_prompt.format(
+            project_id=project_id, ref=ref, section=section, diff=diff
+        )}]
+        async with semaphore:
+            updated = await afunction_call(messages, gl, Priority.REPO_ANALYSIS, budget, tool_semaphore)
+        return updated.rstrip() + "\n\n"
+
+    for i, updated in zip(affected, await asyncio.gather(*(update_section(sections[i]) for i in affected))):
+        sections[i] = updated
+    if affected:
+        budget.report()
+    return head + "".join(sections)
+
+def _get_gitattributes(gl: Gitlab, project_id: int, ref: str) -> str:
+    try:
+        return get_file_content(gl, project_id, ref, ".gitattributes")
+    except GitlabGetError:
+        return ""
+
+async def _filter_diff(gl: Gitlab, project_id: int, diff: dict, ref: Optional[str], exclude: Sequence[str]) -> dict:
+    """去掉无需审查的文件差异，被去掉的文件及原因放在dropped中。过大的差异只保留路径，由模型按需查看"""
+    gitattributes = await loop.run_blocking(_get_gitattributes, gl, project_id, ref) if ref else ""
+    diffs, dropped = filter_diffs(diff.get("diffs", []), exclude, gitattributes)
+    if omitted := [d.get("new_path") or d.get("old_path") for d in diffs if "omitted" in d]:
+        logger.info(f"{len(omitted)}个文件的差异未放入提示词: {omitted}")
+    if dropped:
+        logger.info(f"跳过{len(dropped)}个无需审查的文件: {dropped}")
+        progress.emit("diff_filtered", dropped=dropped)
+    return {**diff, "diffs": diffs, "dropped": dropped}
+
+def _dropped_section(dropped: list[dict]) -> str:
+    if not dropped:
+        return ""
+    return "\n\n## 未审查的文件\n" + "\n".join(f"- `{d['path']}`：{d['reason']}" for d in dropped)
+
+def _skipped_review(dropped: list[dict]) -> str:
+    """所有文件都是排除的、生成的、第三方的或二进制文件时，不请求模型，直接生成审查结果"""
+    info = "# 摘要\n本次变更中没有需要审查的文件，已跳过审查。" + _dropped_section(dropped)
+    return json.dumps({"info": info, "suggestion": {}, "level": 0}, ensure_ascii=False)
+
+async def agenerate_commit_review(
+    gl: Gitlab,
+    project_id: int,
+    before_sha: str,
+    after_sha: str,
+    exclude: Sequence[str] = ()
+) -> str:
+    """
+    为 GitLab 仓库中的提交差异生成详细审查。exclude为仓库配置的不审查的文件glob
+    """
+    diff = await loop.run_blocking(get_commit_compare, gl, project_id, before_sha, after_sha)
+    diff = await _filter_diff(gl, project_id, diff, after_sha, exclude)
+    if not diff.get("diffs"):
+        return _skipped_review(diff.get("dropped", []))
+    diff_tokens = count_tokens(json.dumps(diff, ensure_ascii=False, default=str))
+    if diff_tokens > settings.review_chunk_tokens and len(diff.get('diffs', [])) > 1:
+        return await _map_reduce_commit_review(gl, project_id, diff)
     messages = [{"role": "user", "content": commit_review_prompt.format(project_id=project_id, diff=diff)}]
-    return function_call(messages, gl)
+    return await afunction_call(messages, gl, Priority.COMMIT_REVIEW)
 
-def generate_mr_review(gl: Gitlab, project_id: int, mr_iid: int, pipeline_result: dict) -> str:
+async def _map_reduce_commit_review(gl: Gitlab, project_id: int, diff: dict) -> str:
+    """差异过大时按文件/目录分块并行审查，再汇总为一份审查结果"""
+    chunks = split_diffs(diff['diffs'], settings.review_chunk_tokens)
+    logger.info(f"差异过大，拆分为{len(chunks)}块审查")
+    # 分块时只保留提交标题，避免每块重复携带完整的提交信息
+    commits = [{"id": c.get("id"), "title": c.get("title")} for c in diff.get('commits', [])]
+    semaphore = asyncio.Semaphore(settings.review_chunk_concurrency)
+    budget = TokenBudget()  # 各块和汇总共用一份预算和函数调用并发限制
+    tool_semaphore = asyncio.Semaphore(settings.llm_tool_concurrency)
+
+    async def review_chunk(chunk: list[dict]) -> str:
+        chunk_diff = {"commits": commits, "diffs": chunk}
+        messages = [{"role": "user", "content": commit_review_prompt.format(project_id=project_id, diff=chunk_diff)}]
+        async with semaphore:
+            return await afunction_call(messages, gl, Priority.COMMIT_REVIEW, budget, tool_semaphore)
+
+    infos, suggestion, level = merge_reviews(await asyncio.gather(*map(review_chunk, chunks)))
+    messages = [{"role": "user", "content": review_reduce_prompt.format(
+        project_id=project_id,
+        chunk_count=len(chunks),
+        infos="\n---\n".join(infos),
+    )}]
+    info = await afunction_call(messages, gl, Priority.COMMIT_REVIEW, budget, tool_semaphore)
+    info += _dropped_section(diff.get("dropped", []))    # 汇总时模型看不到被过滤的文件
+    budget.report()
+    return json.dumps({"info": info, "suggestion": suggestion, "level": level}, ensure_ascii=False)
+
+async def agenerate_mr_review(
+    gl: Gitlab,
+    project_id: int,
+    mr_iid: int,
+    pipeline_result: dict,
+    exclude: Sequence[str] = ()
+) -> str:
     """
-    为 GitLab 仓库中的 Merge Request 差异生成详细审查。
+    为 GitLab 仓库中的 Merge Request 差异生成详细审查。exclude为仓库配置的不审查的文件glob
     """
-    diff = get_mr_compare(gl, project_id, mr_iid)
+    diff = await loop.run_blocking(get_mr_compare, gl, project_id, mr_iid)
+    diff = await _filter_diff(gl, project_id, diff, diff.get("head_commit_sha"), exclude)
+    if not diff.get("diffs"):
+        return _skipped_review(diff.get("dropped", []))
     messages = [{"role": "user", "content": mr_review_prompt.format(project_id=project_id, diff=diff, pipeline_result=pipeline_result)}]
-    return function_call(messages, gl)
+    return await afunction_call(messages, gl, Priority.MR_REVIEW)
+
+# 以下为同步版本，在后台事件循环中执行对应的协程
+
+def function_call(messages: list, gl: Gitlab, priority: Priority = Priority.COMMIT_REVIEW) -> str:
+    return loop.run(afunction_call(messages, gl, priority))
+
+def generate_repo_analysis(gl: Gitlab, project_id: int, ref: Optional[str] = None) -> str:
+    return loop.run(agenerate_repo_analysis(gl, project_id, ref))
+
+def generate_commit_review(gl: Gitlab, project_id: int, before_sha: str, after_sha: str) -> str:
+    return loop.run(agenerate_commit_review(gl, project_id, before_sha, after_sha))
+
+def generate_mr_review(gl: Gitlab, project_id: int, mr_iid: int, pipeline_result: dict) -> str:
+    return loop.run(agenerate_mr_review(gl, project_id, mr_iid, pipeline_result))
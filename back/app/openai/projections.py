@@ -0,0 +1,99 @@
+"""
+函数调用结果的精简投影。
+默认只返回模型审查/分析时需要的字段，verbose为True时返回更多字段
+"""
+from typing import Any, Iterable
+
+__all__ = [
+    'project_repo_info',
+    'project_branches',
+    'project_tree',
+    'project_commits',
+    'project_commit',
+    'project_compare',
+    'project_branch',
+]
+
+REPO_INFO_FIELDS = (
+    'id', 'name', 'path_with_namespace', 'description', 'default_branch',
+    'visibility', 'topics', 'created_at', 'last_activity_at',
+)
+REPO_INFO_VERBOSE_FIELDS = REPO_INFO_FIELDS + (
+    'web_url', 'http_url_to_repo', 'archived', 'empty_repo', 'star_count', 'forks_count',
+    'open_issues_count', 'namespace', 'creator_id', 'readme_url', 'license',
+)
+COMMIT_FIELDS = ('id', 'title', 'author_name', 'created_at')
+COMMIT_VERBOSE_FIELDS = COMMIT_FIELDS + ('short_id', 'message', 'author_email', 'parent_ids', 'web_url')
+DIFF_FIELDS = ('old_path', 'new_path', 'diff')
+DIFF_FLAG_FIELDS = ('new_file', 'deleted_file', 'renamed_file', 'generated_file', 'too_large', 'collapsed')   # 仅在为True时保留
+DIFF_VERBOSE_FIELDS = DIFF_FIELDS + ('a_mode', 'b_mode', 'new_file', 'deleted_file', 'renamed_file', 'generated_file')
+
+
+def _pick(data: dict, fields: Iterable[str]) -> dict:
+    return {field: data[field] for field in fields if field in data}
+
+
+def project_repo_info(attributes: dict, verbose: bool = False) -> dict:
+    return _pick(attributes, REPO_INFO_VERBOSE_FIELDS if verbose else REPO_INFO_FIELDS)
+
+
+def project_branches(branches: list[dict], verbose: bool = False) -> list[Any]:
+    if not verbose:
+        return [branch['name'] for branch in branches]
+    return [
+        {
+            'name': branch['name'],
+            'commit_id': branch['commit']['id'],
+            'protected': branch.get('protected'),
+            'default': branch.get('default'),
+        }
+        for branch in branches
+    ]
+
+
+def project_tree(entries: list[dict], verbose: bool = False) -> list[Any]:
+    """默认只返回文件路径，目录可由路径推出"""
+    if not verbose:
+        return [entry['path'] for entry in entries if entry.get('type') == 'blob']
+    return [_pick(entry, ('path', 'type', 'mode')) for entry in entries]
+
+
+def project_commits(commits: list[dict], verbose: bool = False) -> list[dict]:
+    fields = COMMIT_VERBOSE_FIELDS if verbose else COMMIT_FIELDS
+    return [_pick(commit, fields) for commit in commits]
+
+
+def project_commit(commit: dict, verbose: bool = False) -> dict:
+    result = _pick(commit, COMMIT_VERBOSE_FIELDS if verbose else COMMIT_FIELDS + ('message',))
+    if 'stats' in commit:
+        result['stats'] = commit['stats']
+    return result
+
+
+def _project_diff(diff: dict, verbose: bool) -> dict:
+    if verbose:
+        return _pick(diff, DIFF_VERBOSE_FIELDS)
+    result = _pick(diff, DIFF_FIELDS)
+    result.update({flag: True for flag in DIFF_FLAG_FIELDS if diff.get(flag)})
+    return result
+
+
+def project_compare(compare: dict, verbose: bool = False) -> dict:
+    """去掉重复的head commit信息，提交只保留摘要"""
+    result: dict[str, Any] = {
+        'commits': project_commits(compare.get('commits', []), verbose),
+        'diffs': [_project_diff(diff, verbose) for diff in compare.get('diffs', [])],
+    }
+    if compare.get('compare_timeout'):
+        result['compare_timeout'] = True
+    return result
+
+
+def project_branch(branch: dict, verbose: bool = False) -> dict:
+    result = {
+        'name': branch['name'],
+        'commit': project_commit(branch['commit'], verbose),
+    }
+    if verbose:
+        result.update(_pick(branch, ('protected', 'default', 'merged', 'web_url')))
+    return result
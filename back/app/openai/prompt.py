@@ -83,6 +83,7 @@ commit_review_prompt = """
 你将获得：
 - Gitlab 仓库 project id: "{project_id}"
 - 已提供的 compare 结果（变更文件列表及对应 diff/片段）：{diff}
+- compare 结果中的 dropped 列出了未提供 diff 的文件及原因：生成的文件、第三方代码和二进制文件无需审查，差异过大的文件可按需通过函数获取内容
 - 可调用的函数来获取变更文件的完整内容或仓库中其他文件（AI 可自行决定是否调用）
 
 严格约束：
@@ -107,6 +108,7 @@ mr_review_prompt = """
 你将获得：
 - Gitlab 仓库 project id: "{project_id}"
 - 已提供的 compare 结果（变更文件列表及对应 diff/片段）：{diff}
+- compare 结果中的 dropped 列出了未提供 diff 的文件及原因：生成的文件、第三方代码和二进制文件无需审查，差异过大的文件可按需通过函数获取内容
 - `megalinter`和`semgrep`运行结果：{pipeline_result}
 - 可调用的函数来获取变更文件的完整内容或仓库中其他文件（AI 可自行决定是否调用）
 
@@ -120,3 +122,35 @@ mr_review_prompt = """
 示例输出格式（仅示范格式，实际输出中不得包含示例说明）：
 {{"info":"# 摘要\\n- 变更点：...  \\n来源: [src/foo.py:10-20]()","suggestion":{{\"src/main.py\": \"完整文件内容\"}},"level":0}}
 """
+
+review_reduce_prompt = """
+你是一位资深的代码审查专家。一次 push 的改动过大，已按文件和目录拆分为 {chunk_count} 个部分分别审查。下面是各部分的审查概要（Markdown 格式，以 --- 分隔）。请将它们合并为一份完整的审查概要。
+
+要求：
+- 直接输出 Markdown 正文，不要使用```markdown包裹，不要有正文外的任何解释说明，不要输出 JSON。
+- 先用一段话概括此次 push 的整体变更与主要风险，再按模块列出要点，合并重复内容。
+- 保留各部分中的来源引用（格式：来源: [path/to/file.ext:start_line-end_line]()），禁止新增未出现过的引用或推测性内容。
+- 语言：中文。
+
+Gitlab 仓库 project id: "{project_id}"
+
+各部分审查概要：
+{infos}
+"""
+
+repo_section_update_prompt = """
+你是一位资深的技术文档撰写专家和软件架构师。下面是 Gitlab 仓库（project id: "{project_id}"）技术 Wiki 页面中的一个章节，它引用的部分源文件在之后的提交中发生了变更。请根据变更后的源文件更新这个章节。
+
+要求：
+- 只输出更新后的章节正文（Markdown），必须以原章节相同的二级标题开头，不要使用```markdown包裹，不要有正文外的任何解释说明。
+- 使用函数读取 ref 为 "{ref}" 的源文件内容，仅基于源文件内容更新，不得推测或引入外部知识。
+- 保持原章节的结构、Mermaid 图表规范和表格形式；未受变更影响的内容原样保留。
+- 所有重要信息必须引用真实源文件及行号，格式：来源: [filename.ext:start_line-end_line]() 或 来源: [filename.ext:line_number]()，行号以变更后的文件为准。
+- 语言：中文。
+
+原章节：
+{section}
+
+变更的源文件及差异：
+{diff}
+"""
@@ -0,0 +1,214 @@
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Awaitable, Callable, Optional, TypeVar
+from openai import AsyncOpenAI, APIError, BadRequestError, RateLimitError, UnprocessableEntityError
+from ..core import metrics, progress
+from ..core.config import settings, LlmProvider
+import asyncio, logging, random, time
+
+__all__ = [
+    'Provider',
+    'ProviderPool',
+    'provider_pool',
+]
+logger = logging.getLogger(__name__)
+T = TypeVar('T')
+
+
+@dataclass
+class Provider:
+    """一个大模型服务（地址、密钥和模型），带熔断器和延迟统计"""
+    name: str
+    client: AsyncOpenAI
+    model: str
+    weight: float = 1
+    consecutive_failures: int = 0
+    opened_at: Optional[float] = None   # 熔断开始时间，为None时未熔断
+    probing: bool = False   # 熔断冷却后正在发出试探请求
+    rate_limited_until: float = 0
+    requests: int = 0
+    failures: int = 0
+    last_error: Optional[str] = None
+    latency: metrics.LatencyRecorder = field(default_factory=metrics.LatencyRecorder)
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= settings.llm_breaker_cooldown:
+            return 'half_open'
+        return 'open'
+
+    def available(self) -> bool:
+        if time.monotonic() < self.rate_limited_until:
+            return False
+        state = self.state
+        return state == 'closed' or (state == 'half_open' and not self.probing)
+
+
+def _should_failover(e: Exception) -> bool:
+    """请求本身有问题（如超出上下文长度）时换服务也没有用"""
+    return isinstance(e, APIError) and not isinstance(e, (BadRequestError, UnprocessableEntityError))
+
+
+class ProviderPool:
+    """多个大模型服务按权重分配请求。服务连续失败达到阈值后熔断，冷却后放行一个试探请求，
+    成功则恢复。请求失败时换一个服务重试"""
+
+    def __init__(self, providers: list[Provider]):
+        assert providers, '至少需要一个大模型服务'
+        self.providers = providers
+        self._lock = Lock()
+
+    @classmethod
+    def from_settings(cls) -> 'ProviderPool':
+        configs = settings.llm_providers or [LlmProvider(
+            name='default',
+            base_url=settings.openai_base_url,
+            api_key=settings.openai_api_key,
+            model=settings.openai_model,
+        )]
+        return cls([
+            Provider(
+                name=config.name or f'{config.model or settings.openai_model}@{config.base_url}',
+                client=AsyncOpenAI(
+                    base_url=config.base_url,
+                    api_key=config.api_key,
+                    timeout=settings.llm_request_timeout,
+                    # 只有一个服务时沿用客户端自带的重试，多个服务时由服务池换服务重试
+                    **({'max_retries': 0} if len(configs) > 1 else {}),
+                ),
+                model=config.model or settings.openai_model,
+                weight=config.weight,
+            )
+            for config in configs
+        ])
+
+    def _pick(self, tried: set[str]) -> Optional[Provider]:
+        """按权重随机选择一个可用且本次尚未尝试的服务。都不可用时选择最早熔断的服务，避免请求直接失败"""
+        with self._lock:
+            candidates = [p for p in self.providers if p.name not in tried]
+            available = [p for p in candidates if p.available()]
+            if available:
+                provider = random.choices(available, [p.weight for p in available])[0]
+            elif candidates:
+                provider = min(candidates, key=lambda p: (p.rate_limited_until, p.opened_at or 0))
+            else:
+                return None
+            if provider.state == 'half_open':
+                provider.probing = True
+            return provider
+
+    def _record_success(self, provider: Provider, seconds: float):
+        with self._lock:
+            provider.requests += 1
+            provider.consecutive_failures = 0
+            if provider.opened_at is not None:
+                logger.info(f'大模型服务{provider.name}已恢复')
+            provider.opened_at = None
+            provider.probing = False
+        provider.latency.record(seconds)
+
+    def _record_failure(self, provider: Provider, e: Exception):
+        with self._lock:
+            provider.requests += 1
+            provider.last_error = f'{type(e).__name__}: {e}'
+            provider.probing = False
+            if isinstance(e, RateLimitError):   # 限流不代表服务不可用，只是暂时避开
+                retry_after = e.response.headers.get('retry-after', '')
+                provider.rate_limited_until = time.monotonic() + (float(retry_after) if retry_after.isdigit() else 1)
+                return
+            provider.failures += 1
+            provider.consecutive_failures += 1
+            if provider.opened_at is not None or provider.consecutive_failures >= settings.llm_breaker_threshold:
+                logger.warning(f'大模型服务{provider.name}连续失败{provider.consecutive_failures}次，熔断{settings.llm_breaker_cooldown}秒')
+                provider.opened_at = time.monotonic()
+
+    async def _attempt(self, provider: Provider, request: Callable[[Provider], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        try:
+            result = await request(provider)
+        except Exception as e:
+            if _should_failover(e):
+                self._record_failure(provider, e)
+            raise
+        except asyncio.CancelledError:  # 对冲请求中较慢的一个被取消
+            with self._lock:
+                provider.probing = False
+            raise
+        self._record_success(provider, time.monotonic() - start)
+        return result
+
+    async def call(
+        self,
+        request: Callable[[Provider], Awaitable[T]],
+        hedge_delay: float = 0,
+        hedge_request: Optional[Callable[[Provider], Awaitable[T]]] = None
+    ) -> T:
+        """用一个服务执行request，失败时换其他服务重试，所有服务都失败时抛出最后一个异常。
+        hedge_delay大于0时，请求超过此时间未完成则用hedge_request（默认为request）同时向另一个服务发出相同的请求，
+        采用先完成的结果。对冲请求需要单独限流时由hedge_request负责"""
+        tried: set[str] = set()
+        error: Optional[Exception] = None
+        while (provider := self._pick(tried)) is not None:
+            tried.add(provider.name)
+            try:
+                if hedge_delay > 0:
+                    return await self._hedged(provider, request, hedge_request or request, hedge_delay, tried)
+                return await self._attempt(provider, request)
+            except Exception as e:
+                if not _should_failover(e):
+                    raise
+                error = e
+                logger.warning(f'大模型服务{provider.name}请求失败，尝试其他服务: {type(e).__name__}: {e}')
+                progress.emit('provider_failover', provider=provider.name, error=type(e).__name__)
+        assert error is not None
+        raise error
+
+    async def _hedged(
+        self,
+        provider: Provider,
+        request: Callable[[Provider], Awaitable[T]],
+        hedge_request: Callable[[Provider], Awaitable[T]],
+        delay: float,
+        tried: set[str]
+    ) -> T:
+        primary = asyncio.create_task(self._attempt(provider, request))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or (backup_provider := self._pick(tried)) is None:
+            return await primary
+        tried.add(backup_provider.name)
+        logger.info(f'大模型服务{provider.name}超过{delay}秒未响应，向{backup_provider.name}发出对冲请求')
+        with progress.use_sink(None):   # 对冲请求不重复上报输出片段
+            backup = asyncio.create_task(self._attempt(backup_provider, hedge_request))
+        pending = {primary, backup}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            return await primary    # 两个请求都失败，抛出主请求的异常
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                provider.name: {
+                    'model': provider.model,
+                    'weight': provider.weight,
+                    'state': provider.state,
+                    'requests': provider.requests,
+                    'failures': provider.failures,
+                    'consecutive_failures': provider.consecutive_failures,
+                    'last_error': provider.last_error,
+                    'latency': provider.latency.snapshot(),
+                }
+                for provider in self.providers
+            }
+
+
+provider_pool = ProviderPool.from_settings()
+metrics.register('llm_providers', lambda: provider_pool.stats())
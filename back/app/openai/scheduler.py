@@ -0,0 +1,194 @@
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from threading import Lock, Timer
+from typing import AsyncIterator, Callable, Iterator, Optional
+from ..core import metrics
+from ..core.config import settings
+import asyncio, heapq, itertools, json, time
+
+__all__ = [
+    'Priority',
+    'LlmScheduler',
+    'scheduler',
+    'estimate_tokens',
+    'track_wait',
+]
+
+
+class Priority(IntEnum):
+    """LLM请求优先级，数值越小越优先"""
+    MR_REVIEW = 0
+    COMMIT_REVIEW = 1
+    REPO_ANALYSIS = 2
+
+
+class _Usage:
+    """速率窗口中的一条记录，请求完成后用实际token数修正预估值"""
+    def __init__(self, at: float, tokens: int):
+        self.at = at
+        self.tokens = tokens
+
+
+class _Waiter:
+    def __init__(self, priority: Priority, seq: int, tokens: int, notify: Callable[[], None]):
+        self.key = (int(priority), seq)
+        self.tokens = tokens
+        self.notify = notify
+        self.usage: Optional[_Usage] = None
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return self.key < other.key
+
+
+class LlmScheduler:
+    """全局LLM请求调度器：限制并发数和每分钟请求数/token数，按优先级放行等待中的请求。
+    不同线程的事件循环中的协程都可以在此排队"""
+
+    def __init__(self, max_in_flight: int, rpm: int = 0, tpm: int = 0, window: float = 60):
+        self.max_in_flight = max_in_flight
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window    # 速率限制的统计窗口（秒）
+        self.in_flight = 0
+        self._window: deque[_Usage] = deque()
+        self._waiters: list[_Waiter] = []  # 小顶堆
+        self._seq = itertools.count()
+        self._paused_until = 0.
+        self._timer: Optional[Timer] = None
+        self._lock = Lock()
+
+    async def aacquire(self, priority: Priority, tokens: int) -> tuple[_Usage, float]:
+        """等待直到可以发出请求，返回(速率窗口记录, 排队时间)"""
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        waiter = _Waiter(
+            priority, next(self._seq), tokens,
+            lambda: loop.call_soon_threadsafe(_set_result, granted)
+        )
+        self._enqueue(waiter)
+        try:
+            await granted
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.usage is None:    # 仍在排队
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+            if waiter.usage is not None:    # 已放行但还未被唤醒
+                self.release(waiter.usage)
+            raise
+        assert waiter.usage is not None
+        return waiter.usage, time.monotonic() - start
+
+    def release(self, usage: _Usage, actual_tokens: Optional[int] = None):
+        with self._lock:
+            self.in_flight -= 1
+            if actual_tokens is not None:
+                usage.tokens = actual_tokens
+            self._dispatch()
+
+    def pause(self, seconds: float):
+        """收到429后暂停放行新请求"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    @asynccontextmanager
+    async def aslot(self, priority: Priority, tokens: int) -> AsyncIterator[_Usage]:
+        usage, waited = await self.aacquire(priority, tokens)
+        _record_wait(waited)
+        try:
+            yield usage
+        finally:
+            self.release(usage)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                'in_flight': self.in_flight,
+                'waiting': len(self._waiters),
+                'requests_last_minute': len(self._window),
+                'tokens_last_minute': sum(u.tokens for u in self._window),
+            }
+
+    def _enqueue(self, waiter: _Waiter):
+        with self._lock:
+            heapq.heappush(self._waiters, waiter)
+            self._dispatch()
+
+    def _dispatch(self):
+        """按优先级放行排队中的请求，调用时需持有锁"""
+        while self._waiters and self.in_flight < self.max_in_flight:
+            waiter = self._waiters[0]
+            if (delay := self._delay(waiter.tokens)) > 0:
+                self._wake_after(delay)
+                return
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            waiter.usage = _Usage(time.monotonic(), waiter.tokens)
+            self._window.append(waiter.usage)
+            waiter.notify()
+
+    def _delay(self, tokens: int) -> float:
+        """队首请求因暂停或速率限制需要等待的时间"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._expire(now)
+        if self.rpm and len(self._window) >= self.rpm:
+            return self._window[0].at + self.window - now
+        if self.tpm and self._window and sum(u.tokens for u in self._window) + tokens > self.tpm:
+            return self._window[0].at + self.window - now
+        return 0
+
+    def _wake_after(self, delay: float):
+        if self._timer is not None and self._timer.is_alive():
+            return
+        self._timer = Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._dispatch()
+
+    def _expire(self, now: float):
+        while self._window and self._window[0].at + self.window <= now:
+            self._window.popleft()
+
+
+def _set_result(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+def estimate_tokens(messages: list) -> int:
+    """粗略估算请求的token数"""
+    return len(json.dumps(messages, ensure_ascii=False, default=str)) // 3
+
+
+_waited: ContextVar[Optional[list[float]]] = ContextVar('llm_waited', default=None)
+
+
+def _record_wait(waited: float):
+    queue_wait.record(waited)
+    if (total := _waited.get()) is not None:
+        total[0] += waited
+
+
+@contextmanager
+def track_wait() -> Iterator[list[float]]:
+    """统计当前上下文（线程或协程）中LLM排队时间的总和，结果保存在返回列表的第一个元素"""
+    total = [0.]
+    token = _waited.set(total)
+    try:
+        yield total
+    finally:
+        _waited.reset(token)
+
+
+queue_wait = metrics.latency('llm_queue_wait')
+scheduler = LlmScheduler(settings.llm_max_in_flight, settings.llm_rpm, settings.llm_tpm)
+metrics.register('llm_scheduler', scheduler.snapshot)
@@ -0,0 +1,42 @@
+import posixpath, re
+
+__all__ = [
+    'split_sections',
+    'cited_files',
+    'affected_paths',
+]
+
+_CITATION_RE = re.compile(r'\[([^\[\]\s:]+)(?::[\d\s,\-]+)?\]\(\)')
+
+
+def split_sections(markdown: str) -> tuple[str, list[str]]:
+    """按二级标题拆分Wiki页面，返回(第一个二级标题前的内容, 各章节)。代码块中的#不视为标题"""
+    head: list[str] = []
+    sections: list[list[str]] = []
+    in_code = False
+    for line in markdown.splitlines(keepends=True):
+        if line.lstrip().startswith('```'):
+            in_code = not in_code
+        if not in_code and line.startswith('## '):
+            sections.append([])
+        (sections[-1] if sections else head).append(line)
+    return ''.join(head), [''.join(section) for section in sections]
+
+
+def _normalize(path: str) -> str:
+    path = path.strip().removeprefix('./').lstrip('/')
+    return posixpath.normpath(path) if path else ''
+
+
+def cited_files(section: str) -> set[str]:
+    """章节中以 来源: [path:start-end]() 格式引用的源文件"""
+    return {_normalize(path) for path in _CITATION_RE.findall(section)} - {''}
+
+
+def affected_paths(section: str, changed_paths: set[str]) -> set[str]:
+    """变更文件中被章节引用的部分。模型有时只写文件名，因此也按路径后缀匹配"""
+    cited = cited_files(section)
+    return {
+        changed for changed in changed_paths
+        if any(changed == path or changed.endswith('/' + path) for path in cited)
+    }
@@ -0,0 +1,76 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional
+
+__all__ = [
+    'JobUsage',
+    'track_usage',
+    'record_completion',
+    'record_abandoned',
+    'record_model',
+    'record_tool_calls',
+]
+
+
+@dataclass
+class JobUsage:
+    """一次评审/分析任务中所有模型请求的用量"""
+    model: str = ''     # 使用过的模型，多个时以逗号分隔
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    turns: int = 0
+    tool_calls: dict[str, int] = field(default_factory=dict)    # 函数名 -> 调用次数
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+_current: ContextVar[Optional[JobUsage]] = ContextVar('job_usage', default=None)
+
+
+@contextmanager
+def track_usage() -> Iterator[JobUsage]:
+    """在此上下文（包括其中创建的协程和线程池任务）中发出的模型请求，用量都累计到返回的JobUsage"""
+    job_usage = JobUsage()
+    token = _current.set(job_usage)
+    try:
+        yield job_usage
+    finally:
+        _current.reset(token)
+
+
+def record_completion(usage: Any):
+    """记录一轮请求，usage为接口返回的用量，可能为None"""
+    if (job_usage := _current.get()) is None:
+        return
+    job_usage.turns += 1
+    if usage is None:
+        return
+    job_usage.prompt_tokens += usage.prompt_tokens
+    job_usage.completion_tokens += usage.completion_tokens
+    details = getattr(usage, 'prompt_tokens_details', None)
+    job_usage.cached_tokens += getattr(details, 'cached_tokens', None) or 0
+
+
+def record_abandoned(prompt_tokens: int):
+    """记录被取消的请求（如对冲请求中较慢的一个）。服务端已按输入计费，但拿不到用量，按估算的输入token数记录"""
+    if (job_usage := _current.get()) is None:
+        return
+    job_usage.prompt_tokens += prompt_tokens
+
+
+def record_model(model: str):
+    if (job_usage := _current.get()) is None or model in job_usage.model.split(','):
+        return
+    job_usage.model = f'{job_usage.model},{model}' if job_usage.model else model
+
+
+def record_tool_calls(tool_calls: list[dict]):
+    if (job_usage := _current.get()) is None:
+        return
+    for tool_call in tool_calls:
+        name = tool_call["function"]["name"]
+        job_usage.tool_calls[name] = job_usage.tool_calls.get(name, 0) + 1
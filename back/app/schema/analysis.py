@@ -6,6 +6,7 @@ class PostAnalysisInput(BaseModel):
     """ 提交分析的输入参数"""
     repo_id: int = Field(description="待分析的仓库id")
     branch: Optional[str] = Field(default=None, description="待分析的分支，为空则分析默认分支")
+    full: bool = Field(default=False, description="是否重新完整分析，默认只更新上次分析后变更涉及的章节")
 
 
 class GetAnalysisOutput(BaseModel):
@@ -15,6 +16,18 @@ class GetAnalysisOutput(BaseModel):
     analyze_time: int = Field(description="分析时间戳")
 
 
+class AnalysisSummary(BaseModel):
+    """分析历史中的一条分析"""
+    id: int = Field(description="分析id")
+    status: str = Field(description="分析状态：pending/completed/failed")
+    analyze_time: int = Field(description="分析时间戳")
+    branch: Optional[str] = Field(description="分析的分支")
+    score: Optional[float] = Field(description="分析得分，未完成时为空")
+    size: Optional[int] = Field(description="分析结果大小（字节），未完成时为空")
+
+
 class GetAnalysisHistoryOutput(BaseModel):
-    """获取分析历史输入参数"""
-    analysis_history: list[int] = Field(description="历史分析id，按照时间逆序排列")
+    """获取分析历史输出参数"""
+    analysis_history: list[int] = Field(description="本页的历史分析id，按照时间逆序排列")
+    items: list[AnalysisSummary] = Field(description="本页的历史分析摘要，与analysis_history顺序一致")
+    next_cursor: Optional[int] = Field(description="获取下一页时传入的cursor，没有更多记录时为空")
@@ -5,8 +5,14 @@ class GetRepositoriesOutput(BaseModel):
     """获取用户绑定仓库列表的单个仓库输出"""
     id: int = Field(description="仓库id")
     analysis_id: int = Field(description="仓库对应的分析id")
+    review_exclude: list[str] = Field(default=[], description="审查时跳过的文件glob")
 
 
 class AddRepositoryInput(BaseModel):
     """绑定新仓库输入"""
     repo_id: int = Field(description="待绑定的仓库id")
+
+
+class SetReviewExcludeInput(BaseModel):
+    """设置审查时跳过的文件输入"""
+    patterns: list[str] = Field(description="文件glob（.gitattributes语法），如docs/**、*.snap")
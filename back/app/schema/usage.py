@@ -0,0 +1,25 @@
+from pydantic import BaseModel, Field
+
+
+class UsageRollup(BaseModel):
+    """一组任务的模型用量合计"""
+    jobs: int = Field(description="任务数")
+    prompt_tokens: int = Field(description="输入token数")
+    completion_tokens: int = Field(description="输出token数")
+    cached_tokens: int = Field(description="输入中命中缓存的token数")
+    turns: int = Field(description="请求轮数")
+    tool_calls: int = Field(description="函数调用次数")
+
+
+class RepoUsage(UsageRollup):
+    repo_id: int = Field(description="仓库id")
+
+
+class DayUsage(UsageRollup):
+    day: str = Field(description="日期，如2025-01-01（UTC）")
+
+
+class GetUsageOutput(BaseModel):
+    """获取模型用量输出参数"""
+    by_repo: list[RepoUsage] = Field(description="按仓库汇总")
+    by_day: list[DayUsage] = Field(description="按天汇总")
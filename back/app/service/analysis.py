@@ -1,83 +1,149 @@
-from threading import Thread
-from typing import Optional
+from typing import AsyncIterator, Optional
 from gitlab import Gitlab
+from ..core.loop import run_blocking
 from ..model import ReviewStatus
 from ..model.tokens import Token
 from ..model.repository_analyses import RepositoryAnalysis
-from ..db import analysis as db
+from ..db import analysis as db, blobs
+from ..db.aio import analysis as aio_db, blobs as aio_blobs
 from ..errors.review import *
-from ..openai import openai
-from . import auth
-import traceback
+from ..openai import openai, functions
+from ..openai.scheduler import Priority
+from . import auth, jobs, progress
+from .usage import record_usage
+import gitlab.exceptions, logging
 
 __all__ = [
     "analyze",
     "get_analysis",
     "get_analysis_history",
     "get_score",
+    "stream_analysis_events",
 ]
 
 
-def analyze(token: Token, repo_id: int, branch: Optional[str] = None):
-    """进行分析"""
+def analyze(token: Token, repo_id: int, branch: Optional[str] = None, full: bool = False):
+    """进行分析。默认在该分支上次分析的基础上增量更新，full为True时重新完整分析"""
     auth.check_repo_permission(token.user_id, repo_id)
     gl = auth.get_root_gitlab_obj()
     if branch is None:
         branch = _get_default_branch(gl, repo_id)
-    _create_analysis(repo_id)
-    Thread(target=_analyze_thread, args=(gl, repo_id, branch)).start()  # XXX: 线程不安全
-    Thread(target=_score_thread, args=(gl, repo_id, branch)).start()    # XXX: 线程不安全
+    analysis = _create_analysis(repo_id, branch)
+    jobs.enqueue('repo_analysis', repo_id=repo_id, branch=branch, analysis_id=analysis.id, full=full)
 
 
-def get_analysis(token: Token, analysis_id: int) -> RepositoryAnalysis:
-    """根据分析id获取分析结果"""
-    analysis = db.get_analysis(analysis_id)
-    auth.check_repo_permission(token.user.id, analysis.repo_id)
+async def get_analysis(token: Token, analysis_id: int) -> tuple[RepositoryAnalysis, str]:
+    """根据分析id获取分析记录和分析结果"""
+    analysis = await aio_db.get_analysis(analysis_id)
+    await auth.acheck_repo_permission(token.user.id, analysis.repo_id)
     match analysis.status:
         case ReviewStatus.COMPLETED:
-            return analysis
+            analysis_json = await aio_blobs.get(analysis.analysis_hash)
+            assert analysis_json is not None
+            return analysis, analysis_json
         case ReviewStatus.PENDING:
             raise PendingReview
         case ReviewStatus.FAILED:
             raise FailedReview
 
 
-def get_analysis_history(token: Token, repo_id: int) -> list[int]:
-    """获取仓库历史分析id"""
-    auth.check_repo_permission(token.user.id, repo_id)
-    return db.get_analysis_history(repo_id)
+async def stream_analysis_events(token: Token, analysis_id: int, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+    """以SSE格式推送分析进度和最终结果"""
+    analysis = await aio_db.get_analysis(analysis_id)
+    await auth.acheck_repo_permission(token.user.id, analysis.repo_id)
+    return progress.stream(
+        _progress_subject(analysis_id),
+        lambda: progress.final_event(*_get_analysis_state(analysis_id)),
+        last_event_id
+    )
 
 
-def get_score(token: Token, repo_id: int):
-    """获取仓库分数"""
-    auth.check_repo_permission(token.user.id, repo_id)
-    return db.get_score(repo_id)
+def _progress_subject(analysis_id: int) -> str:
+    return f'analysis:{analysis_id}'
 
 
-def _create_analysis(repo_id: int) -> RepositoryAnalysis:
-    return db.create_analysis(repo_id)
+def _get_analysis_state(analysis_id: int) -> tuple[ReviewStatus, Optional[str]]:
+    analysis = db.get_analysis(analysis_id)
+    return analysis.status, blobs.get(analysis.analysis_hash)
 
 
-def _analyze_thread(gl: Gitlab, repo_id: int, branch: str):
-    """进行分析的线程"""
-    try:
-        analysis_json = openai.generate_repo_analysis(gl, repo_id, branch)
-    except Exception:
-        db.fail_analysis(repo_id)   # XXX: 需要给出错误信息
-        traceback.print_exc()   # XXX: 建议改为log
-    else:
-        db.update_analysis(repo_id, analysis_json)
+async def get_analysis_history(token: Token, repo_id: int, limit: int, cursor: Optional[int] = None) -> tuple[list[dict], Optional[int]]:
+    """按时间逆序分页获取仓库历史分析摘要，返回(本页摘要, 下一页的cursor)"""
+    await auth.acheck_repo_permission(token.user.id, repo_id)
+    history = await aio_db.get_analysis_history(repo_id, limit, cursor)
+    for row in history:
+        row['analyze_time'] = int(row.pop('created_at').timestamp())
+    return history, history[-1]['id'] if len(history) == limit else None
 
 
-def _score_thread(gl: Gitlab, repo_id: int, branch: str):
+async def get_score(token: Token, repo_id: int):
+    """获取仓库分数"""
+    await auth.acheck_repo_permission(token.user.id, repo_id)
+    return await aio_db.get_score(repo_id)
+
+
+def _create_analysis(repo_id: int, branch: Optional[str] = None) -> RepositoryAnalysis:
+    return db.create_analysis(repo_id, branch)
+
+
+def _on_analysis_job_failed(repo_id: int, branch: str, analysis_id: int, full: bool = False):
+    db.fail_analysis(analysis_id)   # XXX: 需要给出错误信息
+    db.save_score(repo_id, -1, analysis_id)
+
+
+@jobs.handler('repo_analysis', on_failure=_on_analysis_job_failed, priority=Priority.REPO_ANALYSIS)
+async def _analysis_job(repo_id: int, branch: str, analysis_id: int, full: bool = False):
+    """进行分析的任务"""
+    async with progress.track(_progress_subject(analysis_id)), \
+            record_usage('repo_analysis', repo_id, analysis_id=analysis_id):
+        gl = await run_blocking(auth.get_root_gitlab_obj)
+        # 固定分析时的commit，作为下次增量分析的基准
+        head = await run_blocking(_get_branch_head, gl, repo_id, branch)
+        analysis_json = None
+        if not full:
+            analysis_json = await _update_previous_analysis(gl, repo_id, branch, head)
+        if analysis_json is None:
+            analysis_json = await openai.agenerate_repo_analysis(gl, repo_id, head)
+        # 同一仓库的多个分析可能同时进行，按id更新本任务的分析
+        await run_blocking(db.update_analysis, analysis_id, analysis_json, head)
+        await run_blocking(db.save_score, repo_id, _get_score(gl, repo_id, branch), analysis_id)
+        progress.emit('completed', result=analysis_json)
+
+
+async def _update_previous_analysis(gl: Gitlab, repo_id: int, branch: str, head: str) -> Optional[str]:
+    """在该分支上次分析的基础上只更新变更涉及的章节。无法增量更新时返回None"""
+    previous = await run_blocking(db.get_last_completed_analysis, repo_id, branch)
+    if previous is None or previous.analysis_hash is None:
+        return None
+    if (previous_json := await run_blocking(blobs.get, previous.analysis_hash)) is None:
+        return None
+    if previous.commit_sha == head:
+        return previous_json
     try:
-        ##raise NotImplementedError   # TODO
-        score = -1
-    except Exception:
-        db.fail_analysis(repo_id)
-        db.save_score(repo_id, -1)
-    else:
-        db.save_score(repo_id, score)
+        changed = await run_blocking(_get_changed_files, gl, repo_id, previous.commit_sha, head)
+    except gitlab.exceptions.GitlabError:  # 上次分析的commit已不存在（如强制推送）
+        logging.exception(f'无法比较{previous.commit_sha}和{head}，重新完整分析')
+        return None
+    return await openai.aupdate_repo_analysis(gl, repo_id, head, previous_json, changed)
+
+
+def _get_changed_files(gl: Gitlab, repo_id: int, before: str, after: str) -> dict[str, str]:
+    """变更文件路径（包括重命名前的路径）到差异的映射"""
+    compare = functions.get_commit_compare(gl, repo_id, before, after)
+    changed = {}
+    for diff in compare.get('diffs', []):
+        for path in {diff.get('old_path'), diff.get('new_path')} - {None}:
+            changed[path] = diff.get('diff', '')
+    return changed
+
+
+def _get_branch_head(gl: Gitlab, repo_id: int, branch: str) -> str:
+    return gl.projects.get(repo_id, lazy=True).branches.get(branch).commit['id']
+
+
+def _get_score(gl: Gitlab, repo_id: int, branch: str) -> float:
+    ##raise NotImplementedError   # TODO
+    return -1
 
 
 def _get_default_branch(gl: Gitlab, repo_id: int) -> str:
@@ -2,12 +2,18 @@ from urllib.parse import urljoin
 from httpx import AsyncClient
 from gitlab import Gitlab
 from fastapi import Request
+from requests import Response
+from threading import Lock, RLock
+from typing import Optional
 from ..errors.auth import *
-from ..core.config import settings
+from ..core import metrics
+from ..core.loop import run_blocking
+from ..core.config import settings, gitlab_session, root_gitlab_session
 from ..schema.auth import GitlabToken
 from ..model.tokens import Token
 from ..errors.auth import InvalidGitlabToken
 from ..db import auth as db
+from ..db.aio import auth as aio_db, repositories as aio_repositories
 from . import repositories, notifications
 import time, gitlab.exceptions
 
@@ -15,10 +21,14 @@ __all__ = [
     'get_token_from_callback_code',
     'verify_gitlab_token',
     'get_root_gitlab_obj',
+    'invalidate_root_gitlab_obj',
     'login',
     'logout',
     'get_token_from_cookie',
     'check_repo_permission',
+    'acheck_repo_permission',
+    'invalidate_repo_permission',
+    'verify_admin_token',
     'OAUTH_REDIRECT_URL',
 ]
 OAUTH_REDIRECT_URL = settings.gitlab_oauth_redirect_url#urljoin(settings.self_url, '/_/auth/callback')
@@ -46,7 +56,7 @@ async def get_token_from_callback_code(code: str) -> GitlabToken:
 
 
 def verify_gitlab_token(token: str) -> Gitlab:
-    gl = Gitlab(settings.gitlab_url, oauth_token=token)
+    gl = Gitlab(settings.gitlab_url, oauth_token=token, session=gitlab_session)
     try:
         gl.auth()
     except gitlab.exceptions.GitlabAuthenticationError as e:
@@ -54,20 +64,49 @@ def verify_gitlab_token(token: str) -> Gitlab:
     return gl
 
 
+_root_gl: Optional[Gitlab] = None
+_root_gl_lock = RLock()  # 验证时收到401会在同一线程中调用invalidate_root_gitlab_obj
+
+
 def get_root_gitlab_obj() -> Gitlab:
-    root_token = settings.gitlab_root_private_token
-    gl = Gitlab(settings.gitlab_url, private_token=root_token)
-    try:
-        gl.auth()
-    except gitlab.exceptions.GitlabAuthenticationError as e:
-        raise InvalidGitlabToken(info='gitlab root private token无效') from e
-    return gl
+    """获取进程内共享的root用户Gitlab实例。仅在首次调用或root token被gitlab拒绝后重新验证"""
+    global _root_gl
+    with _root_gl_lock:
+        if _root_gl is None:
+            gl = Gitlab(
+                settings.gitlab_url,
+                private_token=settings.gitlab_root_private_token,
+                session=root_gitlab_session
+            )
+            try:
+                gl.auth()
+            except gitlab.exceptions.GitlabAuthenticationError as e:
+                raise InvalidGitlabToken(info='gitlab root private token无效') from e
+            _root_gl = gl
+        return _root_gl
+
+
+def invalidate_root_gitlab_obj():
+    """下次获取root用户Gitlab实例时重新验证"""
+    global _root_gl
+    with _root_gl_lock:
+        _root_gl = None
+
+
+def _on_gitlab_response(resp: Response, *args, **kwargs):
+    """root token收到401（被吊销或过期）时，让共享实例失效"""
+    if resp.status_code == 401 and \
+            resp.request.headers.get('PRIVATE-TOKEN') == settings.gitlab_root_private_token:
+        invalidate_root_gitlab_obj()
+
+
+root_gitlab_session.hooks['response'].append(_on_gitlab_response)
 
 
 async def login(code: str) -> Token:
     # 从gitlab获取token
     gl_token = await get_token_from_callback_code(code)
-    gl = verify_gitlab_token(gl_token.token)
+    gl = await run_blocking(verify_gitlab_token, gl_token.token)
 
     # 从gitlab获取用户信息
     assert gl.user
@@ -76,44 +115,95 @@ async def login(code: str) -> Token:
     email = gl.user.email
 
     # 向数据库更新用户信息
-    registered = db.save_userinfo(uid, username, email)
+    registered = await aio_db.save_userinfo(uid, username, email)
     if not registered:
-        notifications.create_default_notification_settings(uid)
+        await notifications.create_default_notification_settings(uid)
 
     # 保存token到数据库
     exp = int(time.time()) + gl_token.token_age
-    token_obj = db.save_token(gl_token.token, uid, exp)
+    token_obj = await aio_db.save_token(gl_token.token, uid, exp)
     return token_obj
 
 
-def logout(token: Token):
-    _delete_token_from_db(token)
+async def logout(token: Token):
+    await aio_db.delete_token(token)
 
 
-def get_token_from_cookie(request: Request) -> Token:
+async def get_token_from_cookie(request: Request) -> Token:
     token_str = request.cookies.get('token')
     if token_str is None:
         raise InvalidGitlabToken(info='未登录')
-    token = _get_token_obj_from_db(token_str)
+    token = await aio_db.get_token_obj(token_str)
     if token.is_expired:
-        _delete_token_from_db(token)
+        await aio_db.delete_token(token)
         raise InvalidGitlabToken(info='登录已过期')
     return token
 
 
+_permission_cache: dict[int, tuple[float, dict[int, bool]]] = {}   # 用户id -> (过期时间, {仓库id: 是否绑定})
+_permission_cache_lock = Lock()
+_permission_generation = 0  # 每次清除缓存时递增，避免清除前发出的查询把旧结果写回缓存
+_PERMISSION_CACHE_SWEEP_SIZE = 1024  # 缓存的用户数达到此值时清理过期的缓存
+_permission_stats = {'hits': 0, 'misses': 0}
+metrics.register('repo_permission_cache', lambda: {**_permission_stats, 'users': len(_permission_cache)})
+
+
 def check_repo_permission(user_id: int, repo_id: int):
-    """验证用户是否绑定analysis对应的仓库"""
-    # XXX: 建议进行压测，在用户绑定的仓库数量很多时
-    for repo in repositories.get_user_binded_repos(user_id):
-        if repo.id == repo_id:
-            break
-    else:
+    """验证用户是否绑定了仓库"""
+    binded, generation = _get_cached_permission(user_id, repo_id)
+    if binded is None:
+        binded = repositories.is_repo_binded(user_id, repo_id)
+        _cache_permission(user_id, repo_id, binded, generation)
+    if not binded:
         raise PermissionDenied
 
 
-def _delete_token_from_db(token: Token) -> None:
-    db.delete_token(token)
+async def acheck_repo_permission(user_id: int, repo_id: int):
+    """check_repo_permission的异步版本，供API使用"""
+    binded, generation = _get_cached_permission(user_id, repo_id)
+    if binded is None:
+        binded = await aio_repositories.is_repo_binded(user_id, repo_id)
+        _cache_permission(user_id, repo_id, binded, generation)
+    if not binded:
+        raise PermissionDenied
 
 
-def _get_token_obj_from_db(token: str) -> Token:
-    return db.get_token_obj(token)
+def invalidate_repo_permission(user_id: int):
+    """用户绑定/解绑仓库后清除其权限缓存"""
+    global _permission_generation
+    with _permission_cache_lock:
+        _permission_cache.pop(user_id, None)
+        _permission_generation += 1
+
+
+def _get_cached_permission(user_id: int, repo_id: int) -> tuple[Optional[bool], int]:
+    """返回(缓存的结果，未缓存时为None, 当前缓存版本)"""
+    with _permission_cache_lock:
+        expires, repos = _permission_cache.get(user_id, (0, {}))
+        if expires > time.monotonic() and repo_id in repos:
+            _permission_stats['hits'] += 1
+            return repos[repo_id], _permission_generation
+        _permission_stats['misses'] += 1
+        return None, _permission_generation
+
+
+def _cache_permission(user_id: int, repo_id: int, binded: bool, generation: int):
+    if settings.permission_cache_ttl <= 0:
+        return
+    now = time.monotonic()
+    with _permission_cache_lock:
+        if generation != _permission_generation:
+            return
+        expires, repos = _permission_cache.get(user_id, (0, {}))
+        if expires <= now:
+            if len(_permission_cache) >= _PERMISSION_CACHE_SWEEP_SIZE:
+                for expired in [uid for uid, (exp, _) in _permission_cache.items() if exp <= now]:
+                    del _permission_cache[expired]
+            expires, repos = now + settings.permission_cache_ttl, {}
+            _permission_cache[user_id] = (expires, repos)
+        repos[repo_id] = binded
+
+
+def verify_admin_token(token: str|None):
+    if not settings.admin_token or token != settings.admin_token:
+        raise PermissionDenied(info='无效的管理令牌')
@@ -1,23 +1,30 @@
-from threading import Thread
+from typing import AsyncIterator, Optional
 from ..core.config import settings
+from ..core.loop import run_blocking
 from ..errors.auth import InvalidGitlabWebhookToken
 from ..errors.review import *
 from ..model import ReviewStatus
 from ..model.tokens import Token
 from ..model.commit_reviews import CommitReview
-from . import auth, notifications
-from ..db import commits as db
-from ..openai import openai
-import logging, json
+from . import auth, notifications, jobs, progress, repositories
+from .usage import record_usage
+from ..db import commits as db, blobs
+from ..db.aio import commits as aio_db, blobs as aio_blobs
+from ..openai import openai, functions
+from ..openai.scheduler import Priority
+import gitlab.exceptions, hashlib, logging, json, re
 
 __all__ = [
     'RiskLevel',
     'verify_gitlab_webhook_token',
     'review_commit',
     'get_review_by_commit',
+    'stream_review_events',
     'apply_commit_suggestions',
-    'record_webhook_received',
 ]
+NULL_SHA = '0' * 40
+BRANCH_REF_PREFIX = 'refs/heads/'
+_HUNK_HEADER_RE = re.compile(r'^@@ -\d+(?:,\d+)? \+\d+(?:,\d+)? @@', re.MULTILINE)
 
 
 class RiskLevel:
@@ -53,32 +60,112 @@ def verify_gitlab_webhook_token(token: str|None):
         raise InvalidGitlabWebhookToken
 
 
-def review_commit(repo_id: int, before: str, after: str):
-    Thread(target=_review_thread, args=(repo_id, before, after)).start()
-
-
-def get_review_by_commit(token: Token, commit_id: str) -> CommitReview:
-    review = db.get_review_by_commit_id(commit_id)
-    auth.check_repo_permission(token.user_id, review.repo_id)
+def review_commit(repo_id: int, ref: str, before: str, after: str):
+    """评审一次推送。同一分支在合并窗口内的多次推送会合并为一次评审"""
+    if after == NULL_SHA:   # 删除分支
+        return
+    jobs.enqueue_coalesced(
+        'commit_review',
+        key=f'{repo_id}:{ref}',
+        merge=_merge_pushes,
+        delay=settings.push_coalesce_window,
+        max_delay=settings.push_coalesce_max_delay,
+        supersede=True,     # 正在评审的旧推送没有必要继续，其差异并入新的评审
+        repo_id=repo_id,
+        ref=ref,
+        before=before,
+        after=after,
+    )
+
+
+async def get_review_by_commit(token: Token, commit_id: str) -> tuple[CommitReview, str]:
+    """获取评审记录和评审结果"""
+    review = await aio_db.get_review_by_commit_id(commit_id)
+    await auth.acheck_repo_permission(token.user_id, review.repo_id)
     match review.status:
         case ReviewStatus.PENDING:
             raise PendingReview
         case ReviewStatus.FAILED:
             raise FailedReview
         case ReviewStatus.COMPLETED:
-            return review
+            review_json = await aio_blobs.get(review.review_hash)
+            assert review_json is not None
+            return review, review_json
+
+
+async def stream_review_events(token: Token, commit_id: str, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+    """以SSE格式推送评审进度和最终结果"""
+    review = await aio_db.get_review_by_commit_id(commit_id)
+    await auth.acheck_repo_permission(token.user_id, review.repo_id)
+    return progress.stream(
+        _progress_subject(review.id),
+        lambda: progress.final_event(*_get_review_state(review.id)),
+        last_event_id
+    )
+
+
+def _progress_subject(review_id: int) -> str:
+    return f'commit_review:{review_id}'
+
+
+def _get_review_state(review_id: int) -> tuple[ReviewStatus, Optional[str]]:
+    review = db.get_review(review_id)
+    return review.status, blobs.get(review.review_hash)
 
 
 def apply_commit_suggestions(token: Token, commit_id: str):
     raise NotImplementedError   # TODO
 
 
-def record_webhook_received(data: str):
-    db.record_webhook_received(data)
+def _merge_pushes(queued: dict, new: dict) -> dict:
+    """合并同一分支的连续推送：从最早的before比较到最新的after"""
+    return {**new, 'before': queued['before']}
 
 
-def _create_pending_review(repo_id: int, before: str, after: str) -> CommitReview:
-    return db.create_review(repo_id, before, after)
+def _get_branch_head(repo_id: int, ref: str) -> Optional[str]:
+    """分支当前指向的commit。分支已被删除时评审已无意义，取消任务而不是重试"""
+    if not ref.startswith(BRANCH_REF_PREFIX):
+        return None
+    gl = auth.get_root_gitlab_obj()
+    try:
+        branch = gl.projects.get(repo_id, lazy=True).branches.get(ref.removeprefix(BRANCH_REF_PREFIX))
+    except gitlab.exceptions.GitlabGetError as e:
+        if e.response_code == 404:
+            raise jobs.JobCancelled(f'{ref}已被删除') from e
+        raise
+    return branch.commit['id']
+
+
+def _get_diff_hash(repo_id: int, before: str, after: str) -> Optional[str]:
+    """对compare结果中的文件路径和差异内容（去掉行号）做哈希，与SHA无关。
+    cherry-pick、rebase或推送到其他分支产生的相同差异哈希相同。没有文件变更时返回None"""
+    gl = auth.get_root_gitlab_obj()
+    compare = functions.get_commit_compare(gl, repo_id, before, after)
+    diffs = sorted(
+        (diff.get('old_path') or '', diff.get('new_path') or '', _HUNK_HEADER_RE.sub('@@', diff.get('diff') or ''))
+        for diff in compare.get('diffs', [])
+    )
+    if not diffs:
+        return None
+    return hashlib.sha256(json.dumps(diffs, ensure_ascii=False).encode()).hexdigest()
+
+
+def _get_existing_review(after: str) -> Optional[CommitReview]:
+    try:    # 任务重试，或该commit已被推送到其他分支
+        return db.get_review_by_commit_id(after)
+    except ReviewNotExist:
+        return None
+
+
+def _reuse_review(repo_id: int, after: str, diff_hash: Optional[str], existing: Optional[CommitReview]) -> Optional[CommitReview]:
+    """差异相同的评审已完成时直接复用，返回被复用的评审"""
+    if diff_hash is None or (cached := db.get_completed_review_by_diff_hash(repo_id, diff_hash)) is None:
+        return None
+    if existing is None:
+        db.bind_review(after, cached)
+    else:   # 重试前已创建了待评审记录，与被复用的评审引用同一份结果
+        db.update_review_result(existing, cached)
+    return cached
 
 
 def _finish_review(review: CommitReview, review_json: str):
@@ -94,15 +181,34 @@ def _verify_review_json_validity(review_json: str):
     assert 'info' in review_dict and 'suggestion' in review_dict and 'level' in review_dict
 
 
-def _review_thread(repo_id: int, before: str, after: str):
-    review = _create_pending_review(repo_id, before, after)
-    gl = auth.get_root_gitlab_obj()
-    try:
-        review_json = openai.generate_commit_review(gl, repo_id, before, after)
-        _verify_review_json_validity(review_json)
-    except Exception as e:
-        logging.error(f"Failed to generate commit review: {e}")
+def _on_review_job_failed(repo_id: int, before: str, after: str, ref: Optional[str] = None):
+    logging.error(f"Failed to generate commit review for {after}")
+    review = _get_existing_review(after) or db.create_review(repo_id, before, after)
+    if review.status != ReviewStatus.COMPLETED:  # 不影响被复用的评审
         _fail_review(review)
-    else:
-        _finish_review(review, review_json)
-        notifications.NotifyMethod.send_all(repo_id, review_json)
+
+
+@jobs.handler('commit_review', on_failure=_on_review_job_failed, priority=Priority.COMMIT_REVIEW)
+async def _review_job(repo_id: int, before: str, after: str, ref: Optional[str] = None):
+    if ref is not None and (head := await run_blocking(_get_branch_head, repo_id, ref)) not in (None, after):
+        raise jobs.JobCancelled(f'{ref}已更新到{head}，跳过对{after}的评审')
+    review = await run_blocking(_get_existing_review, after)
+    if review is not None and review.status == ReviewStatus.COMPLETED:
+        return
+    diff_hash = await run_blocking(_get_diff_hash, repo_id, before, after)
+    if (cached := await run_blocking(_reuse_review, repo_id, after, diff_hash, review)) is not None:
+        logging.info(f"{after}的差异与已有评审{cached.id}相同，直接复用")
+        review_json = await run_blocking(blobs.get, cached.review_hash)
+        await run_blocking(notifications.NotifyMethod.send_all, repo_id, review_json)
+        return
+    if review is None:
+        review = await run_blocking(db.create_review, repo_id, before, after, diff_hash)
+    async with progress.track(_progress_subject(review.id)), \
+            record_usage('commit_review', repo_id, commit_review_id=review.id):
+        gl = await run_blocking(auth.get_root_gitlab_obj)
+        exclude = await run_blocking(repositories.get_review_exclude, repo_id)
+        review_json = await openai.agenerate_commit_review(gl, repo_id, before, after, exclude)
+        _verify_review_json_validity(review_json)
+        await run_blocking(_finish_review, review, review_json)
+        progress.emit('completed', result=review_json)
+    await run_blocking(notifications.NotifyMethod.send_all, repo_id, review_json)
\ No newline at end of file
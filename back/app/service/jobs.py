@@ -0,0 +1,278 @@
+from concurrent.futures import Future, wait
+from contextvars import ContextVar
+from dataclasses import dataclass
+from threading import Thread, Event, Lock
+from typing import Any, Callable, Optional
+from ..core import loop
+from ..core.config import settings
+from ..core.execution import Cancelled, CancelToken, ExecutionLimitExceeded, use_cancel_token
+from ..errors.jobs import JobNotExist, JobAlreadyFinished
+from ..model.jobs import Job
+from ..db import jobs as db
+from ..openai.scheduler import track_wait
+import inspect, json, logging, os, socket, time
+
+__all__ = [
+    'JobCancelled',
+    'handler',
+    'enqueue',
+    'enqueue_coalesced',
+    'current_job_id',
+    'will_retry',
+    'cancel_job',
+    'start_workers',
+    'stop_workers',
+]
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Cancelled):
+    """任务处理函数抛出此异常表示任务已无需执行（如已被新的任务取代），不会重试"""
+
+
+@dataclass
+class JobHandler:
+    func: Callable[..., Any]    # 可以是协程函数，同步函数会在阻塞线程池中执行
+    on_failure: Optional[Callable[..., None]] = None    # 重试耗尽后调用，参数与func相同
+    priority: int = 0   # 数值越小越先被领取
+
+
+_handlers: dict[str, JobHandler] = {}
+_current_job: ContextVar[Optional[Job]] = ContextVar('current_job', default=None)
+
+
+def handler(kind: str, on_failure: Optional[Callable[..., None]] = None, priority: int = 0):
+    """注册任务处理函数。任务参数以关键字参数的形式传入"""
+    def decorator(func: Callable[..., Any]):
+        _handlers[kind] = JobHandler(func, on_failure, priority)
+        return func
+    return decorator
+
+
+def current_job_id() -> Optional[int]:
+    """当前正在执行的任务id，不在任务中执行时为None。任务重试时id不变"""
+    job = _current_job.get()
+    return job.id if job is not None else None
+
+
+def will_retry(error: BaseException) -> bool:
+    """当前任务因error失败后是否会重试，不在任务中执行时为False"""
+    job = _current_job.get()
+    return job is not None and _retryable(job, error)
+
+
+def _retryable(job: Job, error: BaseException) -> bool:
+    # 取消和超出执行限制不重试，重试同样会超出限制
+    return not isinstance(error, (Cancelled, ExecutionLimitExceeded)) and job.attempts < job.max_attempts
+
+
+def enqueue(kind: str, delay: float = 0, **payload) -> Job:
+    """将任务写入任务表，由worker池异步执行"""
+    assert kind in _handlers, f'未注册的任务类型：{kind}'
+    job = db.enqueue(kind, payload, _handlers[kind].priority, settings.job_max_attempts, delay)
+    if _pool is not None:
+        _pool.wake()
+    return job
+
+
+def enqueue_coalesced(
+    kind: str,
+    key: str,
+    merge: Callable[[dict, dict], dict],
+    delay: float,
+    max_delay: float,
+    supersede: bool = False,
+    **payload
+) -> Job:
+    """入队一个延迟delay秒执行的任务。期间相同key的任务会通过merge(旧参数, 新参数)合并为一个，
+    并重新计时，但最多推迟到首次入队后max_delay秒。
+    supersede为True时取消相同key的执行中任务，并将其参数合并到新任务中"""
+    assert kind in _handlers, f'未注册的任务类型：{kind}'
+    job = db.coalesce(
+        kind, key, payload, merge,
+        _handlers[kind].priority, settings.job_max_attempts, delay, max_delay
+    )
+    if supersede and (superseded := db.supersede_running(kind, key, job.id, f'已被任务{job.id}取代')):
+        merged = json.loads(job.payload)
+        for queued in superseded:
+            merged = merge(queued, merged)
+        if db.update_payload(job.id, merged):
+            job.payload = json.dumps(merged, ensure_ascii=False)
+    if _pool is not None:
+        _pool.wake()
+    return job
+
+
+def cancel_job(job_id: int, reason: str = '管理员取消'):
+    """取消任务。执行中的任务在下一个检查点（请求大模型或执行函数调用前）停止"""
+    if not db.request_cancel(job_id, reason):
+        raise JobAlreadyFinished if db.exists(job_id) else JobNotExist
+
+
+class WorkerPool:
+    """从任务表中领取任务，在后台事件循环中并发执行，同时执行的任务数不超过size"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self._running: dict[int, Future] = {}
+        self._tokens: dict[int, CancelToken] = {}
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._stopped = Event()
+        self._poller = Thread(target=self._poll_loop, name='job-poller', daemon=True)
+        self._last_heartbeat = 0.
+
+    def start(self):
+        self._poller.start()
+
+    def stop(self):
+        """停止领取新任务，并等待执行中的任务结束"""
+        self._stopped.set()
+        self._wakeup.set()
+        self._poller.join()
+        with self._lock:
+            running = list(self._running.values())
+        wait(running)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _poll_loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            claimed = 0
+            try:
+                claimed = self._claim()
+                self._heartbeat()
+                self._check_cancelled()
+            except Exception:
+                logger.exception('领取任务失败')
+            if not claimed:
+                self._wakeup.wait(settings.job_poll_interval)
+
+    def _claim(self) -> int:
+        with self._lock:
+            free = self.size - len(self._running)
+        if free <= 0:
+            return 0
+        jobs = db.claim(self.worker_id, free, settings.job_visibility_timeout)
+        for job in jobs:
+            token = CancelToken(settings.job_timeout)
+            with self._lock:
+                self._tokens[job.id] = token
+                self._running[job.id] = future = loop.submit(_execute(job, token))
+            future.add_done_callback(lambda _, job_id=job.id: self._done(job_id))
+        return len(jobs)
+
+    def _heartbeat(self):
+        now = time.time()
+        if now - self._last_heartbeat < settings.job_visibility_timeout / 3:
+            return
+        self._last_heartbeat = now
+        with self._lock:
+            running = list(self._running)
+        db.heartbeat(running, self.worker_id, settings.job_visibility_timeout)
+
+    def _check_cancelled(self):
+        """将其他进程（如管理接口、新的推送）发出的取消请求传递给执行中的任务"""
+        with self._lock:
+            running = list(self._tokens)
+        for job_id, reason in db.list_cancel_requested(running):
+            with self._lock:
+                token = self._tokens.get(job_id)
+            if token is not None:
+                token.cancel(reason)
+
+    def _done(self, job_id: int):
+        with self._lock:
+            self._running.pop(job_id, None)
+            self._tokens.pop(job_id, None)
+        self.wake()
+
+
+async def _call(func: Callable[..., Any], payload: dict):
+    if inspect.iscoroutinefunction(func):
+        return await func(**payload)
+    return await loop.run_blocking(func, **payload)
+
+
+async def _execute(job: Job, token: Optional[CancelToken] = None):
+    token = token or CancelToken(settings.job_timeout)
+    worker_id = job.locked_by or ''
+    _current_job.set(job)   # 每个任务在独立的协程上下文中执行
+    job_handler = _handlers.get(job.kind)
+    payload = json.loads(job.payload)
+    if job_handler is None:
+        await loop.run_blocking(db.fail, job.id, worker_id, f'未注册的任务类型：{job.kind}')
+        return
+    if job.attempts > job.max_attempts:    # 上次执行时worker崩溃，且重试次数已耗尽
+        await _give_up(job, job_handler, payload, job.last_error or 'worker执行超时')
+        return
+    if job.cancel_requested:    # 上次执行时worker崩溃，之后被请求取消
+        if await loop.run_blocking(db.cancel, job.id, worker_id, job.cancel_requested):
+            await _on_failure(job, job_handler, payload)
+        return
+    logger.info(f'执行任务{job.id}（{job.kind}），第{job.attempts}次尝试')
+    with track_wait() as llm_wait, use_cancel_token(token):
+        try:
+            await _call(job_handler.func, payload)
+        except Cancelled as e:
+            logger.info(f'任务{job.id}（{job.kind}）已取消：{e}')
+            cancelled = await loop.run_blocking(db.cancel, job.id, worker_id, str(e))
+            if cancelled and token.cancelled:     # 执行中被取消，需要收尾（如将评审标记为失败）
+                await _on_failure(job, job_handler, payload)
+        except ExecutionLimitExceeded as e:
+            logger.error(f'任务{job.id}（{job.kind}）超出执行限制：{e}')
+            await _give_up(job, job_handler, payload, str(e))  # 重试同样会超出限制
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            logger.exception(f'任务{job.id}（{job.kind}）执行失败：{error}')
+            if _retryable(job, e):
+                await loop.run_blocking(db.retry, job.id, worker_id, error, _backoff(job.attempts))
+            else:
+                await _give_up(job, job_handler, payload, error)
+        else:
+            if not await loop.run_blocking(db.complete, job.id, worker_id):
+                logger.warning(f'任务{job.id}（{job.kind}）的租约已失效，执行结果未记录')
+    if llm_wait[0]:
+        await loop.run_blocking(db.add_llm_wait, job.id, llm_wait[0])
+
+
+async def _give_up(job: Job, job_handler: JobHandler, payload: dict, error: str):
+    if await loop.run_blocking(db.fail, job.id, job.locked_by or '', error):
+        await _on_failure(job, job_handler, payload)
+
+
+async def _on_failure(job: Job, job_handler: JobHandler, payload: dict):
+    if job_handler.on_failure is not None:
+        try:
+            await _call(job_handler.on_failure, payload)
+        except Exception:
+            logger.exception(f'任务{job.id}（{job.kind}）的失败回调执行失败')
+
+
+def _backoff(attempts: int) -> float:
+    return min(
+        settings.job_retry_backoff * 2 ** (attempts - 1),
+        settings.job_retry_backoff_max
+    )
+
+
+_pool: Optional[WorkerPool] = None
+
+
+def start_workers():
+    global _pool
+    if _pool is not None or settings.job_workers <= 0:
+        return
+    _pool = WorkerPool(settings.job_workers)
+    _pool.start()
+
+
+def stop_workers():
+    global _pool
+    if _pool is None:
+        return
+    _pool.stop()
+    _pool = None
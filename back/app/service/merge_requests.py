@@ -1,16 +1,21 @@
-from threading import Thread
-from ..db import merge_requests as db
+from typing import AsyncIterator, Optional
+from ..core.loop import run_blocking
+from ..db import merge_requests as db, blobs
+from ..db.aio import merge_requests as aio_db, blobs as aio_blobs
 from ..model import ReviewStatus
 from ..model.tokens import Token
 from ..model.mr_reviews import MrReview
-from . import auth, notifications
+from . import auth, notifications, jobs, progress, repositories
+from .usage import record_usage
 from ..openai import openai
+from ..openai.scheduler import Priority
 from ..errors.review import *
 import json, logging, io
 
 __all__ = [
     "handle_pipeline_event",
     "get_mr_review",
+    "stream_mr_review_events",
 ]
 JOBS = {    # job name -> files
     'megalinter': ['megalinter-reports/copy-paste/html/jscpd-report.json'],
@@ -19,13 +24,25 @@ JOBS = {    # job name -> files
 
 
 def handle_pipeline_event(data: dict):
-    """从流水线中获取代码检查结果，并交给AI进行评析"""
+    """将流水线事件交给后台任务处理"""
     logging.info("收到流水线事件")
+    if data['object_attributes'].get('status') not in (None, 'success', 'failed'):
+        logging.info("跳过未完成的流水线")
+        return
+    jobs.enqueue(
+        'mr_pipeline',
+        repo_id=data['project']['id'],
+        pipeline_id=data['object_attributes']['id'],
+    )
+
 
+@jobs.handler('mr_pipeline', priority=Priority.MR_REVIEW)
+def _pipeline_job(repo_id: int, pipeline_id: int):
+    """从流水线中获取代码检查结果，并交给AI进行评析"""
     # 获取流水线信息
     gl = auth.get_root_gitlab_obj()
-    project = gl.projects.get(data['project']['id'])
-    pipeline = project.pipelines.get(data['object_attributes']['id'])
+    project = gl.projects.get(repo_id)
+    pipeline = project.pipelines.get(pipeline_id)
     if pipeline.status not in ['success', 'failed']:
         logging.info("跳过未完成的流水线")
         return
@@ -35,10 +52,10 @@ def handle_pipeline_event(data: dict):
     else:
         logging.warning("没有找到对应的merge request")
         return
-    jobs = pipeline.jobs.list()
+    pipeline_jobs = pipeline.jobs.list()
     # 处理流水线结果
     job_results: dict[str, dict[str, str]] = {}
-    for pipeline_job in jobs:
+    for pipeline_job in pipeline_jobs:
         if pipeline_job.name not in JOBS:
             logging.info(f'跳过未知的流水线任务：{pipeline_job.name}')
             continue
@@ -55,23 +72,52 @@ def handle_pipeline_event(data: dict):
     logging.debug(job_results)
 
     # 生成代码检查结果
-    Thread(target=_review_thread, args=(project.id, mr_iid, job_results)).start()
+    jobs.enqueue('mr_review', repo_id=project.id, mr_iid=mr_iid, pipeline_result=job_results)
 
 
-def get_mr_review(token: Token, repo_id: int, merge_request_id: int) -> MrReview:
-    auth.check_repo_permission(token.user.id, repo_id)
-    review = db.get_mr_review(repo_id, merge_request_id)
+async def get_mr_review(token: Token, repo_id: int, merge_request_id: int) -> tuple[MrReview, str]:
+    """获取评审记录和评审结果"""
+    await auth.acheck_repo_permission(token.user.id, repo_id)
+    review = await aio_db.get_mr_review(repo_id, merge_request_id)
     match review.status:
         case ReviewStatus.PENDING:
             raise PendingReview
         case ReviewStatus.FAILED:
             raise FailedReview
         case ReviewStatus.COMPLETED:
-            return review
+            review_json = await aio_blobs.get(review.review_hash)
+            assert review_json is not None
+            return review, review_json
+
+
+async def stream_mr_review_events(token: Token, repo_id: int, merge_request_id: int, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+    """以SSE格式推送评审进度和最终结果"""
+    await auth.acheck_repo_permission(token.user.id, repo_id)
+    review = await aio_db.get_mr_review(repo_id, merge_request_id)
+    return progress.stream(
+        _progress_subject(review.id),
+        lambda: progress.final_event(*_get_review_state(repo_id, merge_request_id)),
+        last_event_id
+    )
+
 
+def _progress_subject(review_id: int) -> str:
+    return f'mr_review:{review_id}'
 
-def _create_pending_review(repo_id: int, mr_iid: int) -> MrReview:
-    return db.create_review(repo_id, mr_iid)
+
+def _get_review_state(repo_id: int, mr_iid: int) -> tuple[ReviewStatus, Optional[str]]:
+    review = db.get_mr_review(repo_id, mr_iid)
+    return review.status, blobs.get(review.review_hash)
+
+
+def _get_or_create_pending_review(repo_id: int, mr_iid: int) -> MrReview:
+    try:    # 任务重试或同一merge request的新流水线，复用已有评审记录
+        review = db.get_mr_review(repo_id, mr_iid)
+    except ReviewNotExist:
+        return db.create_review(repo_id, mr_iid)
+    if review.status != ReviewStatus.PENDING:
+        db.update_review(review, ReviewStatus.PENDING)
+    return review
 
 
 def _finish_review(review: MrReview, review_json: str):
@@ -87,15 +133,20 @@ def _verify_review_json_validity(review_json: str):
     assert 'info' in review_dict and 'suggestion' in review_dict and 'level' in review_dict
 
 
-def _review_thread(repo_id: int, mr_iid: int, pipeline_result: dict):
-    review = _create_pending_review(repo_id, mr_iid)
-    gl = auth.get_root_gitlab_obj()
-    try:
-        review_json = openai.generate_mr_review(gl, repo_id, mr_iid, pipeline_result)
+def _on_review_job_failed(repo_id: int, mr_iid: int, pipeline_result: dict):
+    logging.error(f"Failed to generate merge request review for {repo_id}!{mr_iid}")
+    _fail_review(db.get_mr_review(repo_id, mr_iid))
+
+
+@jobs.handler('mr_review', on_failure=_on_review_job_failed, priority=Priority.MR_REVIEW)
+async def _review_job(repo_id: int, mr_iid: int, pipeline_result: dict):
+    review = await run_blocking(_get_or_create_pending_review, repo_id, mr_iid)
+    async with progress.track(_progress_subject(review.id)), \
+            record_usage('mr_review', repo_id, mr_review_id=review.id):
+        gl = await run_blocking(auth.get_root_gitlab_obj)
+        exclude = await run_blocking(repositories.get_review_exclude, repo_id)
+        review_json = await openai.agenerate_mr_review(gl, repo_id, mr_iid, pipeline_result, exclude)
         _verify_review_json_validity(review_json)
-    except Exception as e:
-        logging.error(f"Failed to generate commit review: {e}")
-        _fail_review(review)
-    else:
-        _finish_review(review, review_json)
-        notifications.NotifyMethod.send_all(repo_id, review_json)
+        await run_blocking(_finish_review, review, review_json)
+        progress.emit('completed', result=review_json)
+    await run_blocking(notifications.NotifyMethod.send_all, repo_id, review_json)
@@ -4,6 +4,7 @@ from ..sdk import email as sdk_email
 from ..model.notification_settings import NotificationSettings
 from ..schema.notifications import NotificationSettings as NotificationSettingsSchema
 from ..db import notifications as db
+from ..db.aio import notifications as aio_db
 from ..core.config import settings
 from .commits import RiskLevel
 import json
@@ -64,11 +65,11 @@ class WebhookMethod(NotifyMethod):
                 )
 
 
-def get_notification_settings(user_id: int) -> NotificationSettings:
-    return db.get_notification_settings(user_id)
+async def get_notification_settings(user_id: int) -> NotificationSettings:
+    return await aio_db.get_notification_settings(user_id)
 
 
-def update_notification_settings(user_id: int, settings: NotificationSettingsSchema):
+async def update_notification_settings(user_id: int, settings: NotificationSettingsSchema):
     model = NotificationSettings(
         user_id=user_id,
         notify_level=settings.notify_level,
@@ -77,9 +78,9 @@ def update_notification_settings(user_id: int, settings: NotificationSettingsSch
         webhook_url=settings.webhook.url,
         webhook_secret=settings.webhook.secret
     )
-    db.update_notification_settings(model)
+    await aio_db.update_notification_settings(model)
 
 
-def create_default_notification_settings(user_id: int):
+async def create_default_notification_settings(user_id: int):
     model = NotificationSettings(user_id=user_id)
-    db.update_notification_settings(model)
+    await aio_db.update_notification_settings(model)
@@ -0,0 +1,148 @@
+from contextlib import asynccontextmanager
+from threading import Lock
+from typing import AsyncIterator, Callable, Optional
+from ..core import loop
+from ..core.progress import emit, use_sink
+from ..core.config import settings
+from ..model import ReviewStatus
+from ..db import review_events as db
+from . import jobs
+import asyncio, json, logging, time
+
+__all__ = [
+    'FINAL_EVENTS',
+    'emit',
+    'track',
+    'stream',
+    'final_event',
+]
+logger = logging.getLogger(__name__)
+
+FINAL_EVENTS = ('completed', 'failed')
+
+
+class _Reporter:
+    """收集一个评审/分析任务的进度事件，批量写入数据库后通知本进程中的订阅者。
+    其他进程中的订阅者通过轮询数据库获取"""
+
+    def __init__(self, subject: str, seq: int):
+        self.subject = subject
+        self._seq = seq
+        self._buffer: list[tuple[str, dict]] = []
+        self._lock = Lock()
+        self._flush_lock = Lock()   # 保证事件按序号顺序写入
+
+    def emit(self, type: str, data: dict):
+        with self._lock:
+            # 连续的输出片段合并为一个事件
+            if type == 'content' and self._buffer and self._buffer[-1][0] == 'content':
+                self._buffer[-1][1]['delta'] += data['delta']
+            else:
+                self._buffer.append((type, dict(data)))
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                buffer, self._buffer = self._buffer, []
+                events = []
+                for type, data in buffer:
+                    self._seq += 1
+                    events.append((self._seq, type, data))
+            if not events:
+                return
+            db.insert_events(self.subject, events)
+        _publish(self.subject)
+
+
+async def _flush_periodically(reporter: _Reporter):
+    while True:
+        await asyncio.sleep(settings.progress_flush_interval)
+        try:
+            await loop.run_blocking(reporter.flush)
+        except Exception:
+            logger.exception(f'写入{reporter.subject}的进度事件失败')
+
+
+@asynccontextmanager
+async def track(subject: str) -> AsyncIterator[None]:
+    """在此上下文中上报的进度事件归属于subject。正常结束后清理事件，此后订阅者直接从评审记录中获取结果。
+    出错时任务会重试则上报retrying，否则上报最终的failed事件"""
+    reporter = _Reporter(subject, await loop.run_blocking(db.last_seq, subject))
+    reporter.emit('started', {})
+    flusher = asyncio.create_task(_flush_periodically(reporter))
+    try:
+        with use_sink(reporter.emit):
+            yield
+    except Exception as e:
+        reporter.emit('retrying' if jobs.will_retry(e) else 'failed', {'error': f'{type(e).__name__}: {e}'})
+        raise
+    finally:
+        flusher.cancel()
+        await loop.run_blocking(reporter.flush)
+    await loop.run_blocking(db.delete_events, subject)
+
+
+_subscribers: dict[str, set[tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+_subscribers_lock = Lock()
+
+
+def _publish(subject: str):
+    with _subscribers_lock:
+        subscribers = list(_subscribers.get(subject, ()))
+    for event_loop, wakeup in subscribers:
+        event_loop.call_soon_threadsafe(wakeup.set)
+
+
+def _format(type: str, data: str, seq: Optional[int] = None) -> str:
+    id_line = f'id: {seq}\n' if seq is not None else ''
+    return f'{id_line}event: {type}\ndata: {data}\n\n'
+
+
+def final_event(status: ReviewStatus, result: Optional[str]) -> Optional[tuple[str, dict]]:
+    """根据评审/分析记录的状态生成最终事件，尚未结束时返回None"""
+    match status:
+        case ReviewStatus.COMPLETED:
+            return 'completed', {'result': result}
+        case ReviewStatus.FAILED:
+            return 'failed', {}
+    return None
+
+
+async def stream(
+    subject: str,
+    get_result: Callable[[], Optional[tuple[str, dict]]],
+    last_event_id: Optional[str] = None
+) -> AsyncIterator[str]:
+    """以SSE格式推送subject的进度事件，直到评审结束。
+    get_result是阻塞函数，在共用的有界线程池中执行，评审已结束时返回最终事件(类型, 内容)，否则返回None。
+    last_event_id为客户端重连时Last-Event-ID请求头的值"""
+    wakeup = asyncio.Event()
+    subscriber = (asyncio.get_running_loop(), wakeup)
+    with _subscribers_lock:
+        _subscribers.setdefault(subject, set()).add(subscriber)
+    try:
+        seq = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+        last_sent = time.monotonic()
+        while True:
+            wakeup.clear()
+            for event in await loop.run_blocking(db.list_events, subject, seq):
+                seq = event.seq
+                last_sent = time.monotonic()
+                yield _format(event.type, event.data, event.seq)
+                if event.type in FINAL_EVENTS:
+                    return
+            if (result := await loop.run_blocking(get_result)) is not None:
+                type, data = result
+                yield _format(type, json.dumps(data, ensure_ascii=False))
+                return
+            try:
+                await asyncio.wait_for(wakeup.wait(), settings.progress_poll_interval)
+            except TimeoutError:
+                if time.monotonic() - last_sent >= 15:    # 防止代理因空闲断开连接
+                    last_sent = time.monotonic()
+                    yield ': keep-alive\n\n'
+    finally:
+        with _subscribers_lock:
+            _subscribers[subject].discard(subscriber)
+            if not _subscribers[subject]:
+                del _subscribers[subject]
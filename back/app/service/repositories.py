@@ -4,6 +4,7 @@ from ..model.repositories import Repository
 from ..model.tokens import Token
 from ..service import analysis
 from ..db import repositories as db
+from ..db.aio import repositories as aio_db
 from ..errors.auth import PermissionDenied
 from ..errors.repositories import *
 from ..core.config import settings
@@ -11,13 +12,20 @@ import gitlab.exceptions
 
 __all__ = [
     'get_user_binded_repos',
+    'is_repo_binded',
     'bind_repo',
-    'unbind_repo'
+    'unbind_repo',
+    'get_review_exclude',
+    'set_review_exclude',
 ]
 
 
-def get_user_binded_repos(user_id: int) -> list[Repository]:
-    return db.get_user_binded_repos(user_id)
+async def get_user_binded_repos(user_id: int) -> list[Repository]:
+    return await aio_db.get_user_binded_repos(user_id)
+
+
+def is_repo_binded(user_id: int, repo_id: int) -> bool:
+    return db.is_repo_binded(user_id, repo_id)
 
 
 def bind_repo(token: Token, repo_id: int):
@@ -29,9 +37,8 @@ def bind_repo(token: Token, repo_id: int):
         raise RepoNotExist from e
 
     # 检查仓库是否被该用户绑定过
-    for repo in get_user_binded_repos(token.user.id):
-        if repo.id == repo_id:
-            raise RepoAlreadyBinded
+    if is_repo_binded(token.user.id, repo_id):
+        raise RepoAlreadyBinded
 
     # 添加仓库
     try:
@@ -43,19 +50,23 @@ def bind_repo(token: Token, repo_id: int):
             webhook_id=webhook_id,
         )
         _add_repo_into_db(repo)
-    _bind_repo_with_user(repo.id, token.user.id)
+    try:
+        _bind_repo_with_user(repo.id, token.user.id)
+    finally:
+        auth.invalidate_repo_permission(token.user.id)
 
     # 进行分析
     analysis.analyze(token, repo_id)
 
 
 def unbind_repo(token: Token, repo_id: int):
-    for repo in get_user_binded_repos(token.user_id):
-        if repo.id == repo_id:
-            break
-    else:
+    if not is_repo_binded(token.user_id, repo_id):
         raise PermissionDenied(info='这不是你的仓库')
-    is_to_delete = db.unbind(token.user_id, repo_id)
+    repo = _get_repo_by_id(repo_id)
+    try:
+        is_to_delete = db.unbind(token.user_id, repo_id)
+    finally:
+        auth.invalidate_repo_permission(token.user_id)
     if is_to_delete:    # 删除webhook
         gl = auth.verify_gitlab_token(token.token)
         try:    # 防止提前手动删除后出现bug
@@ -64,6 +75,21 @@ def unbind_repo(token: Token, repo_id: int):
             pass
 
 
+def get_review_exclude(repo_id: int) -> list[str]:
+    """仓库配置的审查时跳过的文件glob"""
+    try:
+        repo = _get_repo_by_id(repo_id)
+    except RepoNotExist:
+        return []
+    return (repo.review_exclude or '').splitlines()
+
+
+def set_review_exclude(token: Token, repo_id: int, patterns: list[str]):
+    auth.check_repo_permission(token.user_id, repo_id)
+    patterns = [pattern.strip() for pattern in patterns if pattern.strip()]
+    db.update_review_exclude(repo_id, '\n'.join(patterns) or None)
+
+
 def _get_repo_by_id(repo_id: int) -> Repository:
     return db.get_repo_by_id(repo_id)
 
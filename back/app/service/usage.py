@@ -0,0 +1,60 @@
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional
+from ..core.loop import run_blocking
+from ..model.llm_usages import LlmUsage
+from ..db import usage as db
+from ..openai.usage import JobUsage, track_usage
+import json, logging
+
+__all__ = [
+    'record_usage',
+    'get_usage_summary',
+]
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def record_usage(
+    kind: str,
+    repo_id: int,
+    *,
+    commit_review_id: Optional[int] = None,
+    mr_review_id: Optional[int] = None,
+    analysis_id: Optional[int] = None,
+) -> AsyncIterator[JobUsage]:
+    """统计此上下文中模型请求的用量，结束时（包括失败时）写入数据库"""
+    succeeded = False
+    with track_usage() as job_usage:
+        try:
+            yield job_usage
+            succeeded = True
+        finally:
+            if job_usage.turns:     # 复用评审等未请求模型的情况不记录
+                usage = LlmUsage(
+                    repo_id=repo_id,
+                    commit_review_id=commit_review_id,
+                    mr_review_id=mr_review_id,
+                    analysis_id=analysis_id,
+                    kind=kind,
+                    model=job_usage.model,
+                    prompt_tokens=job_usage.prompt_tokens,
+                    completion_tokens=job_usage.completion_tokens,
+                    cached_tokens=job_usage.cached_tokens,
+                    turns=job_usage.turns,
+                    tool_calls=sum(job_usage.tool_calls.values()),
+                    tool_names=json.dumps(job_usage.tool_calls),
+                    succeeded=succeeded,
+                )
+                try:
+                    await run_blocking(db.create_usage, usage)
+                except Exception:   # 用量记录失败不影响评审结果
+                    logger.exception(f'记录{kind}的模型用量失败')
+
+
+def get_usage_summary(days: int, repo_id: Optional[int] = None) -> tuple[list[dict], list[dict]]:
+    """最近days天的用量，返回(按仓库汇总, 按天汇总)"""
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    by_repo = [{**row, 'repo_id': row.pop('key')} for row in db.get_usage_by_repo(since, repo_id)]
+    by_day = [{**row, 'day': str(row.pop('key'))} for row in db.get_usage_by_day(since, repo_id)]
+    return by_repo, by_day
@@ -0,0 +1,105 @@
+from queue import Queue, Full, Empty
+from threading import Thread, Event
+from typing import Optional
+from ..core import metrics
+from ..core.config import settings
+from ..db import webhook_logs as db
+import logging, time
+
+__all__ = [
+    'record',
+    'start',
+    'stop',
+]
+logger = logging.getLogger(__name__)
+
+_buffer: Queue[tuple[float, bytes]] = Queue(maxsize=settings.webhook_log_buffer_size)
+_stats = {'written': 0, 'dropped': 0, 'pruned': 0}
+metrics.register('webhook_logs', lambda: {**_stats, 'buffered': _buffer.qsize()})
+
+
+def record(raw: bytes):
+    """缓冲一条webhook日志，由后台线程批量写入"""
+    try:
+        _buffer.put_nowait((time.time(), raw))
+    except Full:    # 日志仅用于排查问题，宁可丢弃也不阻塞webhook处理
+        _stats['dropped'] += 1
+
+
+def _flush(batch: list[tuple[float, bytes]]):
+    try:
+        db.insert_logs(batch)
+    except Exception:
+        logger.exception(f'写入{len(batch)}条webhook日志失败')
+        _stats['dropped'] += len(batch)
+    else:
+        _stats['written'] += len(batch)
+
+
+def _prune():
+    chunk = settings.webhook_log_prune_chunk
+    pruned = 0
+    if settings.webhook_log_max_age_days > 0:
+        pruned += db.prune_by_age(time.time() - settings.webhook_log_max_age_days * 86400, chunk)
+    if settings.webhook_log_max_rows > 0:
+        pruned += db.prune_by_rows(settings.webhook_log_max_rows, chunk)
+    if settings.webhook_log_max_bytes > 0:
+        pruned += db.prune_by_bytes(settings.webhook_log_max_bytes, chunk)
+    if pruned:
+        logger.info(f'清理了{pruned}条webhook日志')
+    _stats['pruned'] += pruned
+
+
+class _Writer(Thread):
+    """按批量大小或时间间隔组提交日志，并定期按保留策略清理"""
+
+    def __init__(self):
+        super().__init__(name='webhook-log-writer', daemon=True)
+        self.stopped = Event()
+        self._next_prune = 0.
+
+    def run(self):
+        while not (self.stopped.is_set() and _buffer.empty()):
+            batch = self._collect()
+            if batch:
+                _flush(batch)
+            if time.time() >= self._next_prune and not self.stopped.is_set():
+                self._next_prune = time.time() + settings.webhook_log_prune_interval
+                try:
+                    _prune()
+                except Exception:
+                    logger.exception('清理webhook日志失败')
+
+    def _collect(self) -> list[tuple[float, bytes]]:
+        batch = []
+        deadline = time.monotonic() + settings.webhook_log_flush_interval
+        while len(batch) < settings.webhook_log_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(_buffer.get(timeout=timeout))
+            except Empty:
+                break
+        return batch
+
+
+_writer: Optional[_Writer] = None
+
+
+def start():
+    global _writer
+    if _writer is not None:
+        return
+    _writer = _Writer()
+    _writer.start()
+
+
+def stop():
+    """停止前写入缓冲区中剩余的日志"""
+    global _writer
+    if _writer is None:
+        return
+    _writer.stopped.set()
+    _writer.join()
+    _writer = None
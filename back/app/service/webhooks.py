@@ -0,0 +1,156 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+from ..core import metrics
+from ..core.config import settings
+from ..db import webhook_events as db
+from . import commits, jobs, merge_requests, webhook_logs
+import json, logging, time
+
+__all__ = [
+    'accept',
+    'ack_latency',
+]
+logger = logging.getLogger(__name__)
+
+ack_latency = metrics.latency('webhook_ack')
+_KEPT_HEADERS = ('x-gitlab-event', 'x-gitlab-event-uuid', 'x-gitlab-instance')
+
+
+def accept(body: bytes, headers: dict[str, str]):
+    """将原始webhook请求写入任务表后再响应，进程崩溃或重启不会丢失gitlab认为已送达的事件。
+    只保存处理所需的请求头，不保存X-Gitlab-Token"""
+    webhook_logs.record(body)
+    jobs.enqueue(
+        'webhook',
+        body=body.decode(errors='replace'),
+        headers={name: headers[name] for name in _KEPT_HEADERS if name in headers},
+    )
+
+
+class _RecentKeys:
+    """最近出现过的去重键及记录它的任务id，有界LRU"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._keys: OrderedDict[str, Optional[int]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str, default: Optional[int]) -> Optional[int]:
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return self._keys[key]
+            return default
+
+    def add(self, key: str, job_id: Optional[int]):
+        with self._lock:
+            self._keys[key] = job_id
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+
+    def discard(self, key: str):
+        with self._lock:
+            self._keys.pop(key, None)
+
+
+_recent_keys = _RecentKeys(settings.webhook_dedup_cache_size)
+_dedup_stats = {'duplicates': 0}
+metrics.register('webhook_dedup', lambda: _dedup_stats)
+
+
+def _event_keys(event: str | None, data: dict, headers: dict[str, str]) -> list[str]:
+    keys = []
+    if uuid := headers.get('x-gitlab-event-uuid'):
+        keys.append(f'uuid:{uuid}')
+    match event:
+        case 'push':
+            keys.append(f'push:{data["project_id"]}:{data["before"]}:{data["after"]}')
+        case 'pipeline':
+            attributes = data['object_attributes']
+            keys.append(f'pipeline:{attributes["id"]}:{attributes.get("status")}')
+    return keys
+
+
+def _claim_keys(keys: list[str], job_id: int) -> Optional[list[str]]:
+    """先查本地缓存，再通过数据库唯一键跨副本去重。重复投递时返回None，否则返回本次记录的键。
+    键由同一任务记录时不算重复：记录键后、后续任务入队前worker崩溃或租约过期，重试的任务仍需处理该事件"""
+    if any(_recent_keys.get(key, job_id) != job_id for key in keys):
+        return None
+    duplicate = False
+    claimed = []
+    for key in keys:
+        owner = db.claim(key, job_id)
+        if owner == job_id:
+            claimed.append(key)
+        else:
+            duplicate = True
+        _recent_keys.add(key, owner)
+    return None if duplicate else claimed
+
+
+def _release_keys(keys: list[str]):
+    """处理失败时删除本次记录的去重键，使重试的投递不会被当作重复而忽略"""
+    for key in keys:
+        _recent_keys.discard(key)
+    if keys:
+        db.delete_keys(keys)
+
+
+_prune_lock = Lock()
+_next_prune = 0.
+
+
+def _prune_dedup_keys():
+    """每小时清理一次过期的去重键"""
+    global _next_prune
+    with _prune_lock:
+        if time.time() < _next_prune:
+            return
+        _next_prune = time.time() + 3600
+    try:
+        db.prune(time.time() - settings.webhook_dedup_retention_days * 86400)
+    except Exception:
+        logger.exception('清理webhook去重记录失败')
+
+
+@jobs.handler('webhook', priority=-1)   # 只是分发为其他任务，先于评审任务领取
+def _webhook_job(body: str, headers: dict[str, str]):
+    _prune_dedup_keys()
+    job_id = jobs.current_job_id()
+    assert job_id is not None
+    _dispatch(body, headers, job_id)
+
+
+def _dispatch(body: str, headers: dict[str, str], job_id: int):
+    data: dict = json.loads(body)
+    event = data.get('event_name') or data.get('object_kind')
+    if (keys := _claim_keys(_event_keys(event, data, headers), job_id)) is None:
+        logger.info(f'忽略重复投递的{event}事件')
+        _dedup_stats['duplicates'] += 1
+        return
+    try:
+        _handle(event, data)
+    except BaseException:
+        _release_keys(keys)
+        raise
+
+
+def _handle(event: str | None, data: dict):
+    # 解析webhook数据
+    match event:
+        case 'push':
+            logger.info(f'Received push event from repo {data["project_id"]}')
+            repo_id = data['project_id']
+            before = data['before']
+            after = data['after']
+            commits.review_commit(repo_id, data['ref'], before, after)
+        # case 'merge_request':
+        #     logging.info(f'Received merge request event from repo {data["project"]["id"]}')
+        #     repo_id = data['project']['id']
+        #     mr_iid = data['object_attributes']['iid']
+        #     review_merge_request(repo_id, mr_iid)
+        case 'pipeline':
+            logger.info(f'Received pipeline event from repo {data["project"]["id"]}')
+            merge_requests.handle_pipeline_event(data)
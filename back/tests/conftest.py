@@ -0,0 +1,8 @@
+from app.db import engine, migrate
+from app.openai import chunking
+
+
+def pytest_sessionstart(session):
+    """测试前将测试数据库迁移到最新版本，并等待编码表加载完成，使token数在测试中保持一致"""
+    migrate.upgrade(engine)
+    chunking.load_tokenizer(wait=True)
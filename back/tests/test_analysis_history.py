@@ -0,0 +1,87 @@
+from unittest import TestCase
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import patch
+from sqlalchemy import event, update
+from app.core import loop
+from app.db import engine, get_session
+from app.db import analysis as db, repositories as db_repositories
+from app.model.repositories import Repository
+from app.model.repository_analyses import RepositoryAnalysis
+from app.model import ReviewStatus
+from app.openai import openai
+from app.service import analysis, auth
+import random
+
+
+class TestAnalysisHistory(TestCase):
+    def setUp(self) -> None:
+        self.repo_id, self.user_id = random.randint(10 ** 8, 10 ** 9), random.randint(10 ** 8, 10 ** 9)
+        with get_session() as session:
+            session.add(Repository(id=self.repo_id, webhook_id=1))
+            session.commit()
+        db_repositories.bind_repo_with_user(self.repo_id, self.user_id)
+        self.ids = []
+        for i in range(7):
+            self.ids.append(db.create_analysis(self.repo_id, 'main').id)
+            if i % 2 == 0:
+                db.update_analysis(self.ids[-1], f'# 分析{i}' * 100, 'sha')
+                db.save_score(self.repo_id, i, self.ids[-1])
+        with get_session() as session:  # 同一时间创建的分析按id排序
+            for i, analysis_id in enumerate(self.ids):
+                session.execute(
+                    update(RepositoryAnalysis)
+                    .where(RepositoryAnalysis.id == analysis_id) # pyright: ignore[reportArgumentType]
+                    .values(created_at=datetime(2024, 1, 1 + i // 3))
+                )
+            session.commit()
+        self.token = SimpleNamespace(user_id=self.user_id, user=SimpleNamespace(id=self.user_id))
+
+    def test_pages(self):
+        pages, cursor = [], None
+        while True:
+            history, cursor = loop.run(analysis.get_analysis_history(self.token, self.repo_id, 3, cursor)) # type: ignore
+            pages.append([row['id'] for row in history])
+            if cursor is None:
+                break
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), self.ids[::-1])
+
+        oldest, newest = history[-1], db.get_analysis_history(self.repo_id, 1)[0]
+        self.assertEqual((oldest['score'], oldest['status'], oldest['branch']), (0, 'completed', 'main'))
+        self.assertEqual(oldest['size'], len(('# 分析0' * 100).encode()))
+        self.assertEqual(oldest['analyze_time'], int(datetime(2024, 1, 1).timestamp()))
+        self.assertEqual((newest['id'], newest['score'], newest['size']), (self.ids[6], 6, len(('# 分析6' * 100).encode())))
+        pending = db.get_analysis_history(self.repo_id, 1, self.ids[2])[0]
+        self.assertEqual((pending['id'], pending['status'], pending['score'], pending['size']), (self.ids[1], 'pending', None, None))
+
+    def test_result_not_loaded(self):
+        statements = []
+        capture = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', capture)
+        try:
+            db.get_analysis_history(self.repo_id, 20)
+        finally:
+            event.remove(engine, 'before_cursor_execute', capture)
+        self.assertTrue(statements)
+        self.assertFalse([statement for statement in statements if 'blobs.data' in statement])
+
+    def test_overlapping_jobs(self):
+        """同一仓库的多个分析同时进行时，每个任务只更新自己的分析"""
+        first = db.create_analysis(self.repo_id, 'main').id
+        second = db.create_analysis(self.repo_id, 'dev').id
+
+        async def generate(gl, repo_id, ref=None):
+            return '# 分析'
+
+        with patch.object(auth, 'get_root_gitlab_obj', lambda: None), \
+                patch.object(analysis, '_get_branch_head', lambda gl, repo_id, branch: 'sha'), \
+                patch.object(analysis, '_get_score', lambda gl, repo_id, branch: 80), \
+                patch.object(openai, 'agenerate_repo_analysis', generate):
+            loop.run(analysis._analysis_job(self.repo_id, 'main', first, full=True))
+        self.assertEqual((db.get_analysis(first).status, db.get_analysis(first).score), (ReviewStatus.COMPLETED, 80))
+        self.assertEqual(db.get_analysis(second).status, ReviewStatus.PENDING)
+
+        analysis._on_analysis_job_failed(self.repo_id, 'main', first)
+        self.assertEqual(db.get_analysis(first).status, ReviewStatus.FAILED)
+        self.assertEqual((db.get_analysis(second).status, db.get_analysis(second).score), (ReviewStatus.PENDING, None))
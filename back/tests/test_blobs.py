@@ -0,0 +1,44 @@
+from unittest import TestCase
+from app.core import loop
+from app.db import get_session
+from app.db import blobs, commits as db, repositories as db_repositories
+from app.db.aio import blobs as aio_blobs
+from app.model import ReviewStatus
+from app.model.blobs import Blob
+from app.model.repositories import Repository
+from app.service import commits
+from types import SimpleNamespace
+import json, random, uuid
+
+
+class TestBlobs(TestCase):
+    def test_put_deduplicates(self):
+        content = json.dumps({'info': uuid.uuid4().hex * 100, 'level': 0})
+        blob_hash = blobs.put(content)
+        self.assertEqual(blobs.put(content), blob_hash)
+        with get_session() as session:
+            blob = session.get(Blob, blob_hash)
+        assert blob is not None
+        self.assertEqual(blob.size, len(content.encode()))
+        self.assertLess(blob.stored_size, blob.size)
+        self.assertEqual(blobs.get(blob_hash), content)
+        self.assertEqual(loop.run(aio_blobs.get(blob_hash)), content)
+        self.assertIsNone(blobs.get(None))
+
+    def test_review_result(self):
+        repo_id, user_id = random.randint(10 ** 8, 10 ** 9), random.randint(10 ** 8, 10 ** 9)
+        with get_session() as session:
+            session.add(Repository(id=repo_id, webhook_id=1))
+            session.commit()
+        after = uuid.uuid4().hex
+        review = db.create_review(repo_id, uuid.uuid4().hex, after)
+        review_id = review.id
+        review_json = json.dumps({'info': '评审', 'suggestion': {}, 'level': 1}, ensure_ascii=False)
+        db.update_review(review, ReviewStatus.COMPLETED, review_json)
+
+        # 读取评审记录时不加载结果
+        self.assertEqual(db.get_review_by_commit_id(after).review_hash, blobs.put(review_json))
+        token = SimpleNamespace(user_id=user_id, user=SimpleNamespace(id=user_id))
+        db_repositories.bind_repo_with_user(repo_id, user_id)
+        loaded, result = loop.run(commits.get_review_by_commit(token, after)) # type: ignore
+        self.assertEqual((loaded.id, result), (review_id, review_json))
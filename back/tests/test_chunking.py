@@ -0,0 +1,52 @@
+from unittest import TestCase
+from unittest.mock import patch
+from app.core.config import settings
+from app.core import loop
+from app.openai import openai
+from app.openai.chunking import count_tokens, split_diffs, merge_reviews
+import json
+
+
+def _diff(path: str, size: int) -> dict:
+    return {'old_path': path, 'new_path': path, 'diff': 'x' * size}
+
+
+class TestChunking(TestCase):
+    def test_split_by_directory(self):
+        diffs = [_diff('a/1.py', 300), _diff('b/1.py', 300), _diff('a/2.py', 300), _diff('c/big.py', 3000)]
+        chunks = split_diffs(diffs, count_tokens('x' * 1000))
+        paths = [[d['new_path'] for d in chunk] for chunk in chunks]
+        self.assertEqual(paths, [['a/1.py', 'a/2.py'], ['b/1.py'], ['c/big.py']])
+
+    def test_merge_reviews(self):
+        infos, suggestion, level = merge_reviews([
+            json.dumps({'info': 'a', 'suggestion': {'a.py': '1'}, 'level': 1}),
+            json.dumps({'info': 'b', 'suggestion': {}, 'level': 3}),
+            'not json',
+        ])
+        self.assertEqual(infos, ['a', 'b', 'not json'])
+        self.assertEqual(suggestion, {'a.py': '1'})
+        self.assertEqual(level, 3)
+
+    def test_map_reduce_commit_review(self):
+        compare = {'commits': [{'id': '1', 'title': 't'}], 'diffs': [_diff(f'd{i}/f.py', 600) for i in range(4)]}
+        prompts, semaphores = [], set()
+
+        async def function_call(messages, gl, priority, budget=None, tool_semaphore=None):
+            prompts.append(messages[0]['content'])
+            semaphores.add(id(tool_semaphore))
+            if '各部分审查概要' in messages[0]['content']:
+                return '汇总'
+            return json.dumps({'info': 'part', 'suggestion': {f'{len(prompts)}.py': ''}, 'level': len(prompts) % 3})
+
+        self.addCleanup(setattr, settings, 'review_chunk_tokens', settings.review_chunk_tokens)
+        settings.review_chunk_tokens = count_tokens('x' * 1000)
+        with patch.object(openai, 'get_commit_compare', lambda *args: compare), \
+                patch.object(openai, '_get_gitattributes', lambda *args: ''), \
+                patch.object(openai, 'afunction_call', function_call):
+            review = json.loads(loop.run(openai.agenerate_commit_review(None, 1, 'a', 'b')))   # type: ignore
+        self.assertEqual(len(prompts), 5)   # 4块 + 汇总
+        self.assertEqual(len(semaphores), 1)    # 各块共用函数调用的并发限制
+        self.assertEqual(review['info'], '汇总')
+        self.assertEqual(len(review['suggestion']), 4)
+        self.assertEqual(review['level'], 2)
@@ -0,0 +1,75 @@
+from unittest import TestCase
+from unittest.mock import patch
+from types import SimpleNamespace
+from app.core import loop
+from app.db import commits as db
+from app.service import commits, auth, jobs, notifications
+from app.openai import openai
+import gitlab.exceptions, json, uuid
+
+
+def _sha() -> str:
+    return uuid.uuid4().hex + uuid.uuid4().hex[:8]
+
+
+def _compare(start: int, content: str) -> dict:
+    return {'commits': [{'id': _sha()}], 'diffs': [
+        {'old_path': 'a.py', 'new_path': 'a.py', 'diff': f'@@ -{start},2 +{start},2 @@\n-old\n+{content}\n'},
+    ]}
+
+
+class TestCommitReviewCache(TestCase):
+    def setUp(self) -> None:
+        self.compares: dict[str, dict] = {}
+        self.reviews = 0
+
+        async def generate(gl, repo_id, before, after, exclude=()):
+            self.reviews += 1
+            return json.dumps({'info': 'ok', 'suggestion': {}, 'level': 0})
+
+        for patcher in (
+            patch.object(commits.functions, 'get_commit_compare', lambda gl, repo_id, before, after: self.compares[after]),
+            patch.object(auth, 'get_root_gitlab_obj', lambda: None),
+            patch.object(openai, 'agenerate_commit_review', generate),
+            patch.object(notifications.NotifyMethod, 'send_all', lambda repo_id, review_json: None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _push(self, compare: dict) -> str:
+        after = _sha()
+        self.compares[after] = compare
+        loop.run(commits._review_job(repo_id=1, before=_sha(), after=after))
+        return after
+
+    def test_diff_hash_ignores_shas_and_line_numbers(self):
+        content = uuid.uuid4().hex
+        first, second = _sha(), _sha()
+        self.compares[first] = _compare(1, content)
+        self.compares[second] = _compare(40, content)
+        self.assertEqual(commits._get_diff_hash(1, _sha(), first), commits._get_diff_hash(1, _sha(), second))
+        self.compares[second] = _compare(1, content + 'x')
+        self.assertNotEqual(commits._get_diff_hash(1, _sha(), first), commits._get_diff_hash(1, _sha(), second))
+
+    def test_reuse_identical_diff(self):
+        content = uuid.uuid4().hex
+        first = self._push(_compare(1, content))
+        cherry_pick = self._push(_compare(10, content))
+        self.assertEqual(self.reviews, 1)
+        self.assertEqual(db.get_review_by_commit_id(first).id, db.get_review_by_commit_id(cherry_pick).id)
+        self._push(_compare(1, content + 'x'))
+        self.assertEqual(self.reviews, 2)
+
+    def test_deleted_branch_cancels_review(self):
+        """排队中的评审所在分支被删除时取消任务，不重试"""
+        class Branches:
+            def get(self, name):
+                raise gitlab.exceptions.GitlabGetError('404 Branch Not Found', 404)
+
+        project = SimpleNamespace(branches=Branches())
+        gl = SimpleNamespace(projects=SimpleNamespace(get=lambda repo_id, lazy=False: project))
+        after = _sha()
+        with patch.object(auth, 'get_root_gitlab_obj', lambda: gl):
+            with self.assertRaises(jobs.JobCancelled):
+                loop.run(commits._review_job(repo_id=1, before=_sha(), after=after, ref='refs/heads/gone'))
+        self.assertEqual(self.reviews, 0)
@@ -0,0 +1,67 @@
+from unittest import TestCase
+from unittest.mock import patch
+from types import SimpleNamespace
+from app.core import loop, metrics
+from app.db import get_session
+from app.db import auth as db_auth, repositories as db_repositories
+from app.db.aio import auth as aio_auth, repositories as aio_repositories, notifications as aio_notifications
+from app.errors.auth import PermissionDenied
+from app.model.repositories import Repository
+from app.model.notification_settings import NotificationSettings
+from app.schema.auth import GitlabToken
+from app.service import auth
+import random, time, uuid
+
+
+class TestAsyncDb(TestCase):
+    def setUp(self) -> None:
+        self.user_id, self.repo_id, self.other_repo_id = (random.randint(10 ** 8, 10 ** 9) for _ in range(3))
+        self.token = uuid.uuid4().hex
+        db_auth.save_userinfo(self.user_id, 'async', 'async@example.com')
+        db_auth.save_token(self.token, self.user_id, int(time.time()) + 3600)
+        with get_session() as session:
+            session.add(Repository(id=self.repo_id, webhook_id=1))
+            session.add(Repository(id=self.other_repo_id, webhook_id=1))
+            session.commit()
+        db_repositories.bind_repo_with_user(self.repo_id, self.user_id)
+
+    def test_reads(self):
+        token = loop.run(aio_auth.get_token_obj(self.token))
+        self.assertEqual(token.user.username, 'async')  # 关联的用户已预先加载
+        repos = loop.run(aio_repositories.get_user_binded_repos(self.user_id))
+        self.assertEqual([repo.id for repo in repos], [self.repo_id])
+        loop.run(auth.acheck_repo_permission(self.user_id, self.repo_id))
+        with self.assertRaises(PermissionDenied):
+            loop.run(auth.acheck_repo_permission(self.user_id, self.other_repo_id))
+
+    def test_writes(self):
+        loop.run(aio_notifications.update_notification_settings(NotificationSettings(user_id=self.user_id, notify_level=2)))
+        loop.run(aio_notifications.update_notification_settings(NotificationSettings(user_id=self.user_id, notify_level=3)))
+        self.assertEqual(loop.run(aio_notifications.get_notification_settings(self.user_id)).notify_level, 3)
+
+        loop.run(aio_auth.delete_token(loop.run(aio_auth.get_token_obj(self.token))))
+        with self.assertRaises(Exception):
+            loop.run(aio_auth.get_token_obj(self.token))
+
+    def test_login(self):
+        """登录时在事件循环中不执行阻塞的数据库读写和gitlab请求"""
+        uid, token = random.randint(10 ** 8, 10 ** 9), uuid.uuid4().hex
+        gl = SimpleNamespace(user=SimpleNamespace(id=uid, username='new', email='new@example.com'))
+
+        async def get_token(code):
+            return GitlabToken(token=token, token_age=3600)
+
+        with patch.object(auth, 'get_token_from_callback_code', get_token), \
+                patch.object(auth, 'verify_gitlab_token', lambda token: gl), \
+                patch.object(db_auth, 'get_session', side_effect=AssertionError('同步数据库会话')):
+            token_obj = loop.run(auth.login('code'))
+        self.assertEqual((token_obj.token, token_obj.user_id), (token, uid))
+        self.assertEqual(loop.run(aio_auth.get_token_obj(token)).user.username, 'new')
+        self.assertEqual(loop.run(aio_notifications.get_notification_settings(uid)).notify_level, 0)
+
+    def test_pool_metrics(self):
+        loop.run(aio_repositories.is_repo_binded(self.user_id, self.repo_id))
+        stats = metrics.collect()['db_pool_async']
+        self.assertEqual(stats['in_use'], 0)
+        self.assertGreater(stats['checkout_wait']['count'], 0)
+        self.assertIn('in_use', metrics.collect()['db_pool'])
@@ -20,7 +20,7 @@ class TestSqlRepoAnalysisGetter(TestCase):
     #     self.assertTrue(input('请手动评判 >'))
 
     def test_get_analysis_history(self):
-        res = get_analysis_history(repo_id=REPO_ID)
+        res = [row['id'] for row in get_analysis_history(repo_id=REPO_ID, limit=100)]
         self.assertEqual(len(res), 11)
         pprint(res)
         for i in res:
@@ -0,0 +1,101 @@
+from unittest import TestCase
+from unittest.mock import patch
+from pathlib import Path
+from app.core import loop
+from app.openai import openai, projections
+from app.openai.diff_filter import glob_to_regex, filter_diffs
+import json
+
+
+def _diff(path: str, content: str = '+print(1)\n', **flags) -> dict:
+    return {'old_path': path, 'new_path': path, 'diff': f'@@ -0,0 +1 @@\n{content}', **flags}
+
+
+class TestDiffFilter(TestCase):
+    def test_glob(self):
+        cases = [
+            ('*.snap', 'a/b/c.snap', True),
+            ('docs/', 'docs/a.md', True),
+            ('docs/', 'src/docs/a.md', True),
+            ('/docs/*.md', 'docs/a.md', True),
+            ('/docs/*.md', 'docs/x/a.md', False),
+            ('src/**/gen_*.py', 'src/a/b/gen_x.py', True),
+            ('src/**/gen_*.py', 'src/gen_x.py', True),
+            ('src/*.py', 'lib/src/a.py', False),
+        ]
+        for pattern, path, matched in cases:
+            self.assertEqual(bool(glob_to_regex(pattern).search(path)), matched, (pattern, path))
+
+    def test_filter(self):
+        diffs = [
+            _diff('app/main.py'),
+            _diff('package-lock.json'),
+            _diff('web/dist/app.min.js'),
+            _diff('proto/user_pb2.py'),
+            _diff('vendor/github.com/x/y.go'),
+            {'old_path': 'static/logo.png', 'new_path': 'static/logo.png', 'diff': 'Binary files a/static/logo.png and b/static/logo.png differ\n'},
+            _diff('assets/model.dat', 'x'),
+            _diff('api/client.go', '+// Code generated by protoc-gen-go. DO NOT EDIT.\n+package api\n'),
+            _diff('docs/guide.md'),
+            _diff('app/big.py', '+x = 1\n' * 3000),
+            _diff('gen/keep.py'),
+            {'old_path': 'app/__init__.py', 'new_path': 'app/__init__.py', 'diff': '', 'new_file': True},
+            {'old_path': 'run.sh', 'new_path': 'run.sh', 'diff': '', 'a_mode': '100644', 'b_mode': '100755'},
+            {'old_path': 'app/huge.py', 'new_path': 'app/huge.py', 'diff': '', 'collapsed': True},
+        ]
+        gitattributes = 'gen/** linguist-generated\ngen/keep.py -linguist-generated\n*.dat binary\n'
+        kept, dropped = filter_diffs(diffs, ['docs/'], gitattributes, max_file_tokens=1000)
+        self.assertEqual(
+            [d['new_path'] for d in kept],
+            ['app/main.py', 'app/big.py', 'gen/keep.py', 'app/__init__.py', 'run.sh', 'app/huge.py']
+        )
+        reasons = {d['path']: d['reason'] for d in dropped}
+        self.assertEqual(reasons['package-lock.json'], '生成的文件')
+        self.assertEqual(reasons['vendor/github.com/x/y.go'], '第三方代码')
+        self.assertEqual(reasons['static/logo.png'], '二进制文件')
+        self.assertEqual(reasons['assets/model.dat'], '二进制文件')
+        self.assertEqual(reasons['api/client.go'], '生成的文件')
+        self.assertEqual(reasons['docs/guide.md'], '匹配排除规则')
+        # 过大的差异和gitlab折叠的差异保留路径，由模型按需查看
+        omitted = {d['new_path']: d for d in kept if 'omitted' in d}
+        self.assertEqual(set(omitted), {'app/big.py', 'app/huge.py'})
+        self.assertIn('差异过大', omitted['app/big.py']['omitted'])
+        self.assertEqual(omitted['app/big.py']['diff'], '')
+
+    def test_filter_projected_compare(self):
+        """评审时过滤的是投影后的compare结果，gitlab标记的生成文件不能在投影中丢失"""
+        raw = json.loads((Path(__file__).parent / 'fixtures' / 'gitlab' / 'compare.json').read_text(encoding='utf-8'))
+        raw['diffs'][0]['generated_file'] = True
+        kept, dropped = filter_diffs(projections.project_compare(raw)['diffs'])
+        self.assertEqual(dropped, [{'path': raw['diffs'][0]['new_path'], 'reason': '生成的文件'}])
+        self.assertEqual([d['new_path'] for d in kept], [d['new_path'] for d in raw['diffs'][1:]])
+
+    def test_review_oversized_file(self):
+        compare = {'commits': [], 'diffs': [_diff('app/big.py', '+x = 1\n' * 30000)]}
+        prompts = []
+
+        async def function_call(messages, *args, **kwargs):
+            prompts.append(messages[0]['content'])
+            return json.dumps({'info': 'ok', 'suggestion': {}, 'level': 2})
+
+        with patch.object(openai, 'get_commit_compare', lambda *args: compare), \
+                patch.object(openai, '_get_gitattributes', lambda *args: ''), \
+                patch.object(openai, 'afunction_call', function_call):
+            review = json.loads(loop.run(openai.agenerate_commit_review(None, 1, 'a', 'b')))   # type: ignore
+        self.assertEqual(review['level'], 2)
+        self.assertEqual(len(prompts), 1)
+        self.assertIn('app/big.py', prompts[0])
+        self.assertNotIn('x = 1', prompts[0])
+
+    def test_skip_review_without_reviewable_files(self):
+        compare = {'commits': [], 'diffs': [_diff('yarn.lock'), _diff('node_modules/a/index.js')]}
+
+        async def function_call(*args, **kwargs):
+            raise AssertionError('不应请求模型')
+
+        with patch.object(openai, 'get_commit_compare', lambda *args: compare), \
+                patch.object(openai, '_get_gitattributes', lambda *args: ''), \
+                patch.object(openai, 'afunction_call', function_call):
+            review = json.loads(loop.run(openai.agenerate_commit_review(None, 1, 'a', 'b')))   # type: ignore
+        self.assertEqual(review['level'], 0)
+        self.assertIn('yarn.lock', review['info'])
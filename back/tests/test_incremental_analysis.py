@@ -0,0 +1,63 @@
+from unittest import TestCase
+from unittest.mock import patch
+from app.core import loop
+from app.openai import openai
+from app.openai.sections import split_sections, cited_files
+
+WIKI = """# 项目
+简介。来源: [README.md]()
+
+## 接口
+接口说明。来源: [app/api/commits.py:1-20]()
+
+```python
+## 代码块中的注释不是标题
+```
+
+## 数据库
+表结构。来源: [app/db/commits.py:5-9](), [./app/model/jobs.py:1]()
+
+## 部署
+来源: [Dockerfile:1-3]()
+"""
+
+
+class TestSections(TestCase):
+    def test_split_sections(self):
+        head, sections = split_sections(WIKI)
+        self.assertTrue(head.startswith('# 项目'))
+        self.assertEqual([s.splitlines()[0] for s in sections], ['## 接口', '## 数据库', '## 部署'])
+        self.assertEqual(head + ''.join(sections), WIKI)
+
+    def test_cited_files(self):
+        _, sections = split_sections(WIKI)
+        self.assertEqual(cited_files(sections[1]), {'app/db/commits.py', 'app/model/jobs.py'})
+
+
+class TestIncrementalAnalysis(TestCase):
+    def _update(self, changed: dict[str, str]):
+        prompts = []
+
+        async def function_call(messages, gl, priority, budget=None, tool_semaphore=None):
+            prompts.append(messages[0]['content'])
+            return '## 数据库\n新的表结构。来源: [app/db/commits.py:5-12]()'
+
+        with patch.object(openai, 'afunction_call', function_call):
+            result = loop.run(openai.aupdate_repo_analysis(None, 1, 'b' * 40, WIKI, changed))   # type: ignore
+        return result, prompts
+
+    def test_only_changed_sections(self):
+        result, prompts = self._update({'app/db/commits.py': '@@ -1 +1 @@\n-a\n+b\n', 'other.txt': ''})
+        self.assertEqual(len(prompts), 1)
+        self.assertIn('@@ -1 +1 @@', prompts[0])
+        self.assertNotIn('other.txt', prompts[0])
+        assert result is not None
+        self.assertIn('新的表结构', result)
+        self.assertIn('接口说明', result)
+        self.assertIn('## 部署', result)
+        self.assertNotIn('\n表结构', result)
+
+    def test_too_many_changes(self):
+        result, prompts = self._update({'app/api/commits.py': '', 'app/db/commits.py': '', 'Dockerfile': ''})
+        self.assertIsNone(result)
+        self.assertEqual(prompts, [])
@@ -0,0 +1,143 @@
+from unittest import TestCase
+from app.core.config import settings
+from app.core.execution import check_cancelled
+from app.service import jobs
+from app.errors.jobs import JobNotExist, JobAlreadyFinished
+from app.db import get_session, jobs as db
+from app.model.jobs import Job, JobStatus
+import asyncio, time
+
+calls = []
+
+
+@jobs.handler('test_ok')
+def _ok_job(x: int):
+    calls.append(('ok', x))
+
+
+@jobs.handler('test_bad', on_failure=lambda x: calls.append(('failed', x)))
+def _bad_job(x: int):
+    raise RuntimeError('boom')
+
+
+@jobs.handler('test_coalesce')
+def _coalesce_job(before: str, after: str):
+    calls.append(('coalesce', before, after))
+
+
+@jobs.handler('test_async')
+async def _async_job(x: int):
+    await asyncio.sleep(0.1)
+    calls.append(('async', x))
+
+
+@jobs.handler('test_cancellable', on_failure=lambda before, after: calls.append(('cancelled', after)))
+async def _cancellable_job(before: str, after: str):
+    calls.append(('cancellable', before, after))
+    while after == 'b':    # 模拟一直在调用大模型的任务
+        check_cancelled()
+        await asyncio.sleep(0.05)
+
+
+class TestJobQueue(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        settings.job_poll_interval = 0.1
+        settings.job_retry_backoff = 0.1
+        jobs.start_workers()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        jobs.stop_workers()
+
+    def _wait(self, job_id: int) -> Job:
+        for _ in range(100):
+            with get_session() as session:
+                job = session.get(Job, job_id)
+            assert job is not None
+            if job.status in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED):
+                return job
+            time.sleep(0.1)
+        self.fail('任务未在限定时间内结束')
+
+    def test_complete(self):
+        job = self._wait(jobs.enqueue('test_ok', x=1).id)
+        self.assertEqual(job.status, JobStatus.COMPLETED)
+        self.assertIn(('ok', 1), calls)
+
+    def test_async_handler(self):
+        ids = [jobs.enqueue('test_async', x=i).id for i in range(20)]
+        for job_id in ids:
+            self.assertEqual(self._wait(job_id).status, JobStatus.COMPLETED)
+        self.assertEqual(sorted(c[1] for c in calls if c[0] == 'async'), list(range(20)))
+
+    def test_retry_then_fail(self):
+        job = self._wait(jobs.enqueue('test_bad', x=2).id)
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertEqual(job.attempts, settings.job_max_attempts)
+        self.assertIn(('failed', 2), calls)
+
+    def test_coalesce(self):
+        def merge(queued: dict, new: dict) -> dict:
+            return {**new, 'before': queued['before']}
+        ids = {
+            jobs.enqueue_coalesced('test_coalesce', 'k', merge, 0.5, 5, before=before, after=after).id
+            for before, after in [('a', 'b'), ('b', 'c'), ('c', 'd')]
+        }
+        self.assertEqual(len(ids), 1)
+        job = self._wait(ids.pop())
+        self.assertEqual(job.status, JobStatus.COMPLETED)
+        self.assertEqual([c for c in calls if c[0] == 'coalesce'], [('coalesce', 'a', 'd')])
+
+    def _wait_running(self, job_id: int):
+        for _ in range(100):
+            with get_session() as session:
+                job = session.get(Job, job_id)
+            assert job is not None
+            if job.status == JobStatus.RUNNING:
+                return
+            time.sleep(0.05)
+        self.fail('任务未在限定时间内开始执行')
+
+    def test_cancel(self):
+        job_id = jobs.enqueue('test_cancellable', before='a', after='b').id
+        self._wait_running(job_id)
+        jobs.cancel_job(job_id)
+        job = self._wait(job_id)
+        self.assertEqual(job.status, JobStatus.CANCELLED)
+        for _ in range(50):     # 失败回调在任务标记为取消之后执行
+            if ('cancelled', 'b') in calls:
+                break
+            time.sleep(0.05)
+        self.assertIn(('cancelled', 'b'), calls)
+        with self.assertRaises(JobAlreadyFinished):
+            jobs.cancel_job(job_id)
+        with self.assertRaises(JobNotExist):
+            jobs.cancel_job(10 ** 9)
+
+    def test_supersede(self):
+        def merge(queued: dict, new: dict) -> dict:
+            return {**new, 'before': queued['before']}
+        first = jobs.enqueue_coalesced('test_cancellable', 's', merge, 0, 5, supersede=True, before='a', after='b').id
+        self._wait_running(first)
+        second = jobs.enqueue_coalesced('test_cancellable', 's', merge, 0.2, 5, supersede=True, before='b', after='c').id
+        self.assertEqual(self._wait(first).status, JobStatus.CANCELLED)
+        self.assertEqual(self._wait(second).status, JobStatus.COMPLETED)
+        self.assertIn(('cancellable', 'a', 'c'), calls)    # 被取代的推送并入新的任务
+
+    def test_stale_worker(self):
+        # 租约过期后任务被其他worker重新领取，原worker的执行结果不应覆盖
+        with get_session() as session:
+            job = Job(kind='test_ok', payload='{"x": 3}', status=JobStatus.RUNNING,
+                      locked_by='other:1', locked_until=time.time() + 3600, attempts=2, run_after=time.time())
+            session.add(job)
+            session.commit()
+            job_id = job.id
+        assert job_id is not None
+        self.assertFalse(db.complete(job_id, 'stale:1'))
+        self.assertFalse(db.retry(job_id, 'stale:1', 'boom', 0))
+        with get_session() as session:
+            job = session.get(Job, job_id)
+            assert job is not None
+            self.assertEqual((job.status, job.locked_by), (JobStatus.RUNNING, 'other:1'))
+        self.assertTrue(db.complete(job_id, 'other:1'))
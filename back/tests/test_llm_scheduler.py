@@ -0,0 +1,53 @@
+from unittest import TestCase
+from app.openai.scheduler import LlmScheduler, Priority
+import asyncio
+
+
+class TestLlmScheduler(TestCase):
+    def test_priority_order(self):
+        async def run() -> list[Priority]:
+            scheduler = LlmScheduler(max_in_flight=1)
+            order = []
+            holding, _ = await scheduler.aacquire(Priority.REPO_ANALYSIS, 1)
+
+            async def worker(priority: Priority):
+                async with scheduler.aslot(priority, 1):
+                    order.append(priority)
+
+            tasks = []
+            for priority in (Priority.REPO_ANALYSIS, Priority.COMMIT_REVIEW, Priority.MR_REVIEW):
+                tasks.append(asyncio.create_task(worker(priority)))
+                await asyncio.sleep(0.05)
+            self.assertEqual(order, [])
+            self.assertEqual(scheduler.snapshot()['waiting'], 3)
+            scheduler.release(holding)
+            await asyncio.gather(*tasks)
+            return order
+
+        self.assertEqual(asyncio.run(run()), [Priority.MR_REVIEW, Priority.COMMIT_REVIEW, Priority.REPO_ANALYSIS])
+
+    def test_token_budget(self):
+        async def run() -> float:
+            scheduler = LlmScheduler(max_in_flight=10, tpm=100, window=0.5)
+            usage, _ = await scheduler.aacquire(Priority.COMMIT_REVIEW, 50)
+            scheduler.release(usage, 80)    # 按实际用量修正
+            usage, waited = await scheduler.aacquire(Priority.COMMIT_REVIEW, 30)
+            scheduler.release(usage)
+            return waited
+
+        self.assertGreater(asyncio.run(run()), 0.3)
+
+    def test_cancel_while_waiting(self):
+        async def run():
+            scheduler = LlmScheduler(max_in_flight=1)
+            holding, _ = await scheduler.aacquire(Priority.COMMIT_REVIEW, 1)
+            task = asyncio.create_task(scheduler.aacquire(Priority.COMMIT_REVIEW, 1))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertEqual(scheduler.snapshot()['waiting'], 0)
+            scheduler.release(holding)
+            self.assertEqual(scheduler.snapshot()['in_flight'], 0)
+
+        asyncio.run(run())
@@ -0,0 +1,148 @@
+from unittest import TestCase
+from datetime import datetime, timezone
+from unittest.mock import patch
+from sqlalchemy import create_engine, event, inspect, select, text
+from sqlmodel import Session, SQLModel
+from app.db import engine, migrate
+from app.db import analysis, auth, blobs, commits, jobs, merge_requests, notifications, repositories, review_events, usage, webhook_logs
+from app.db.migrations import MIGRATIONS
+from app.model.blobs import Blob
+from app.model.webhook_logs import WebhookLog
+import os, re, tempfile
+
+# 引入迁移前已发布版本的表结构（只保留迁移涉及的列）
+LEGACY_SCHEMA = [
+    'CREATE TABLE commit_reviews (id INTEGER PRIMARY KEY, repo_id INTEGER, before_commit VARCHAR, after_commit VARCHAR UNIQUE, review_json VARCHAR)',
+    'CREATE TABLE repository_analyses (id INTEGER PRIMARY KEY, repo_id INTEGER, created_at DATETIME, analysis_json VARCHAR)',
+    'CREATE TABLE repositories (id INTEGER PRIMARY KEY, webhook_id INTEGER)',
+    'CREATE TABLE mr_reviews (id INTEGER PRIMARY KEY, repo_id INTEGER, mr_iid INTEGER, review_json VARCHAR)',
+    'CREATE TABLE repository_bindings (id INTEGER PRIMARY KEY, user_id INTEGER, repo_id INTEGER)',
+    'CREATE TABLE webhook_logs (id INTEGER NOT NULL, data TEXT, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL, '
+    'updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL, PRIMARY KEY (id))',
+    'INSERT INTO webhook_logs (id, data, created_at) VALUES (1, \'{"object_kind": "push"}\', \'2024-01-01 00:00:00\')',
+    'INSERT INTO mr_reviews VALUES (1, 1, 7, NULL), (2, 1, 7, \'{"level": 1}\'), (3, 1, 8, NULL)',
+    'INSERT INTO commit_reviews VALUES (1, 1, \'a\', \'b\', \'{"level": 1}\'), (2, 1, \'b\', \'c\', NULL)',
+    'INSERT INTO repository_analyses VALUES (1, 1, NULL, \'# 分析\')',
+    'INSERT INTO repository_bindings VALUES (1, 1, 1), (2, 1, 1), (3, 2, 1)',
+]
+
+
+class TestMigrations(TestCase):
+    def setUp(self) -> None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        self.engine = create_engine(f'sqlite:///{path}')
+        self.addCleanup(self.engine.dispose)
+
+    def test_fresh(self):
+        self.assertEqual(migrate.current_version(self.engine), 0)
+        self.assertEqual(migrate.upgrade(self.engine, target=1), [1])
+        self.assertEqual(migrate.upgrade(self.engine), [m.version for m in MIGRATIONS[1:]])
+        self.assertEqual(migrate.upgrade(self.engine), [])
+        self.assertEqual(migrate.current_version(self.engine), MIGRATIONS[-1].version)
+
+    def test_fresh_matches_models(self):
+        """迁移创建的表结构与模型一致"""
+        migrate.upgrade(self.engine)
+        inspector = inspect(self.engine)
+        self.assertEqual(set(inspector.get_table_names()) - {'schema_version'}, set(SQLModel.metadata.tables))
+        for name, table in SQLModel.metadata.tables.items():
+            with self.subTest(table=name):
+                columns = {c['name']: c for c in inspector.get_columns(name)}
+                self.assertEqual(set(columns), {c.name for c in table.columns})
+                for column in table.columns:
+                    if not column.primary_key:
+                        self.assertEqual(columns[column.name]['nullable'], column.nullable, column.name)
+                indexes = {i['name']: bool(i['unique']) for i in inspector.get_indexes(name)}
+                self.assertEqual(indexes, {i.name: bool(i.unique) for i in table.indexes})
+
+    def test_legacy(self):
+        with self.engine.begin() as conn:
+            for sql in LEGACY_SCHEMA:
+                conn.execute(text(sql))
+        migrate.upgrade(self.engine)
+
+        inspector = inspect(self.engine)
+        columns = lambda table: {c['name'] for c in inspector.get_columns(table)}
+        self.assertIn('diff_hash', columns('commit_reviews'))
+        self.assertTrue({'branch', 'commit_sha'} <= columns('repository_analyses'))
+        self.assertIn('review_exclude', columns('repositories'))
+        self.assertTrue({'jobs', 'webhook_events', 'review_events', 'llm_usages', 'blobs'} <= set(inspector.get_table_names()))
+        indexes = {i['name']: i for i in inspector.get_indexes('mr_reviews')}
+        self.assertTrue(indexes['ix_mr_reviews_repo_id_mr_iid']['unique'])
+
+        with self.engine.connect() as conn:    # 重复记录只保留一条
+            self.assertEqual(conn.execute(text('SELECT id FROM mr_reviews ORDER BY id')).scalars().all(), [2, 3])
+            self.assertEqual(conn.execute(text('SELECT id FROM repository_bindings ORDER BY id')).scalars().all(), [1, 3])
+
+        # 结果移至blobs表，相同的结果只存一份
+        self.assertNotIn('review_json', columns('commit_reviews'))
+        self.assertNotIn('analysis_json', columns('repository_analyses'))
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text('SELECT COUNT(*) FROM blobs')).scalar(), 2)
+            review_hash = conn.execute(text('SELECT review_hash FROM commit_reviews WHERE id = 1')).scalar()
+            self.assertEqual(conn.execute(text('SELECT review_hash FROM mr_reviews WHERE id = 2')).scalar(), review_hash)
+            self.assertIsNone(conn.execute(text('SELECT review_hash FROM commit_reviews WHERE id = 2')).scalar())
+            blob = conn.execute(select(Blob).where(Blob.hash == review_hash)).one()
+            self.assertEqual(blobs.decode(Blob(**blob._mapping)), '{"level": 1}')
+
+        # 旧日志压缩后保留，升级后可写入新日志
+        self.assertIn('ix_webhook_logs_received_at', {i['name'] for i in inspect(self.engine).get_indexes('webhook_logs')})
+        with patch.object(webhook_logs, 'get_session', lambda: Session(self.engine)):
+            webhook_logs.insert_logs([(1.5, b'{"object_kind": "merge_request"}')])
+        with Session(self.engine) as session:
+            logs = session.scalars(select(WebhookLog).order_by(WebhookLog.id)).all() # pyright: ignore[reportArgumentType]
+            self.assertEqual([webhook_logs.decode_log(log) for log in logs], [b'{"object_kind": "push"}', b'{"object_kind": "merge_request"}'])
+            self.assertEqual([log.received_at for log in logs], [datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp(), 1.5])
+
+
+class TestQueryPlans(TestCase):
+    """常用查询不应全表扫描，按时间排序的查询不应额外排序"""
+
+    def _plans(self, query) -> list[tuple[str, list[str]]]:
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append((statement, parameters))
+
+        event.listen(engine, 'before_cursor_execute', capture)
+        try:
+            query()
+        except Exception:   # 记录不存在
+            pass
+        finally:
+            event.remove(engine, 'before_cursor_execute', capture)
+        self.assertTrue(statements)
+        with engine.connect() as conn:
+            return [
+                (statement, [row[3] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)])
+                for statement, parameters in statements
+            ]
+
+    def test_hot_queries(self):
+        queries = {
+            'get_mr_review': lambda: merge_requests.get_mr_review(1, 1),
+            'get_score': lambda: analysis.get_score(1),
+            'get_analysis_history': lambda: analysis.get_analysis_history(1, 20),
+            'get_analysis_history_page': lambda: analysis.get_analysis_history(1, 20, 1),
+            'get_last_completed_analysis': lambda: analysis.get_last_completed_analysis(1, 'main'),
+            'get_user_binded_repos': lambda: repositories.get_user_binded_repos(1),
+            'unbind': lambda: repositories.unbind(1, 1),
+            'is_repo_binded': lambda: repositories.is_repo_binded(1, 1),
+            'get_review_by_commit_id': lambda: commits.get_review_by_commit_id('0' * 40),
+            'get_completed_review_by_diff_hash': lambda: commits.get_completed_review_by_diff_hash(1, 'x'),
+            'list_events': lambda: review_events.list_events('commit_review:1', 0),
+            'get_notification_emails': lambda: notifications.get_notification_emails(1, 1),
+            'get_token_obj': lambda: auth.get_token_obj('x'),
+            'claim': lambda: jobs.claim('test_plan', 0, 1),
+            'get_usage_by_repo': lambda: usage.get_usage_by_repo(datetime(2020, 1, 1), 1),
+        }
+        sorted_queries = {'get_score', 'get_analysis_history', 'get_analysis_history_page', 'get_last_completed_analysis'}
+        for name, query in queries.items():
+            for statement, plan in self._plans(query):
+                with self.subTest(query=name, plan=plan):
+                    self.assertFalse([line for line in plan if re.fullmatch(r'SCAN \w+', line)], statement)
+                    if name in sorted_queries:
+                        self.assertFalse([line for line in plan if 'TEMP B-TREE' in line], statement)
@@ -0,0 +1,111 @@
+from unittest import TestCase
+from unittest.mock import patch
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from openai import AsyncOpenAI
+from app.core import loop
+from app.core.progress import use_sink
+from app.openai import openai
+from app.openai.providers import Provider
+from app.service import progress
+import asyncio, json
+
+
+def _chunk(delta: dict, finish_reason=None) -> dict:
+    return {'id': 'x', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'test',
+            'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+
+
+_CHUNKS = [
+    _chunk({'role': 'assistant', 'content': '你好'}),
+    _chunk({'content': '，世界'}),
+    _chunk({'tool_calls': [{'index': 0, 'id': 'c1', 'type': 'function', 'function': {'name': 'get_branch', 'arguments': '{"project_id": 1,'}}]}),
+    _chunk({'tool_calls': [{'index': 0, 'function': {'arguments': ' "branch_name": "main"}'}}]}),
+    _chunk({}, 'tool_calls'),
+    {'id': 'x', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'test', 'choices': [],
+     'usage': {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15}},
+]
+
+
+class _FakeOpenAI(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for chunk in _CHUNKS:
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+        self.wfile.write(b'data: [DONE]\n\n')
+
+
+class TestStreaming(TestCase):
+    def test_stream_assembles_message(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeOpenAI)
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        client = AsyncOpenAI(base_url=f'http://127.0.0.1:{server.server_address[1]}/v1', api_key='test')
+        events = []
+
+        async def request():
+            with use_sink(lambda type, data: events.append((type, data))):
+                return await openai._request(Provider('test', client, 'test'), [{'role': 'user', 'content': 'hi'}])
+
+        message, usage = loop.run(request())
+        self.assertEqual(message['content'], '你好，世界')
+        self.assertEqual(message['tool_calls'], [{'id': 'c1', 'type': 'function', 'function': {
+            'name': 'get_branch', 'arguments': '{"project_id": 1, "branch_name": "main"}'}}])
+        self.assertEqual(usage.total_tokens, 15)
+        self.assertEqual([data['delta'] for type, data in events if type == 'content'], ['你好', '，世界'])
+
+
+class TestProgressStream(TestCase):
+    def test_track_and_stream(self):
+        subject = 'test:1'
+        finished = []
+
+        async def job():
+            async with progress.track(subject):
+                await asyncio.sleep(0.2)
+                progress.emit('content', delta='部分')
+                progress.emit('content', delta='结果')
+                progress.emit('tool_call', name='get_branch')
+                await asyncio.sleep(0.8)
+                finished.append(True)
+                progress.emit('completed', result='最终结果')
+
+        def get_result():
+            return ('completed', {'result': '最终结果'}) if finished else None
+
+        async def consume() -> list[str]:
+            return [message async for message in progress.stream(subject, get_result)]
+
+        future = loop.submit(job())
+        messages = asyncio.run(consume())
+        future.result()
+        types = [line.removeprefix('event: ') for m in messages for line in m.splitlines() if line.startswith('event: ')]
+        self.assertEqual(types[0], 'started')
+        self.assertIn('content', types)
+        self.assertEqual(types[-1], 'completed')
+        self.assertIn('部分结果', ''.join(messages))
+
+    def test_failure_ends_stream(self):
+        """不再重试的失败上报最终的failed事件，订阅者据此结束"""
+        subject = 'test:2'
+
+        async def job():
+            async with progress.track(subject):
+                await asyncio.sleep(0.2)
+                raise RuntimeError('boom')
+
+        async def consume() -> list[str]:
+            return [message async for message in progress.stream(subject, lambda: None)]
+
+        future = loop.submit(job())
+        messages = asyncio.run(asyncio.wait_for(consume(), 5))
+        with self.assertRaises(RuntimeError):
+            future.result()
+        self.assertIn('event: failed', messages[-1])
+        self.assertIn('boom', messages[-1])
@@ -0,0 +1,58 @@
+from unittest import TestCase
+from pathlib import Path
+from app.openai import projections
+from app.openai.chunking import count_tokens
+import json
+
+FIXTURES = Path(__file__).parent / 'fixtures' / 'gitlab'
+
+# 函数调用名 -> (原始返回值的样本文件, 投影函数, 精简后token数占原始返回值的比例上限)
+CORPUS = {
+    'get_repo_info': ('project.json', projections.project_repo_info, 0.1),
+    'get_repo_branches': ('branches.json', projections.project_branches, 0.05),
+    'get_repo_tree': ('tree.json', projections.project_tree, 0.15),
+    'get_project_commits': ('commits.json', projections.project_commits, 0.3),
+    'get_commit_details': ('commit.json', projections.project_commit, 0.3),
+    'get_commit_compare': ('compare.json', projections.project_compare, 0.5),
+    'get_branch': ('branch.json', projections.project_branch, 0.3),
+}
+
+
+def _tokens(data) -> int:
+    return count_tokens(json.dumps(data, ensure_ascii=False, default=str))
+
+
+def _load(name: str):
+    return json.loads((FIXTURES / name).read_text(encoding='utf-8'))
+
+
+class TestProjections(TestCase):
+    def test_token_reduction(self):
+        total_raw = total_compact = 0
+        for tool, (fixture, project, max_ratio) in CORPUS.items():
+            with self.subTest(tool):
+                raw = _load(fixture)
+                compact, verbose = _tokens(project(raw)), _tokens(project(raw, verbose=True))
+                self.assertLessEqual(compact, _tokens(raw) * max_ratio)
+                self.assertLessEqual(compact, verbose)
+                total_raw += _tokens(raw)
+                total_compact += compact
+        self.assertLessEqual(total_compact, total_raw * 0.25)
+
+    def test_compare_keeps_diff_fields(self):
+        """评审、差异哈希和增量分析依赖diffs中的路径和差异内容"""
+        raw = _load('compare.json')
+        compact = projections.project_compare(raw)
+        self.assertNotIn('commit', compact)
+        self.assertEqual(
+            [(d['old_path'], d['new_path'], d['diff']) for d in compact['diffs']],
+            [(d['old_path'], d['new_path'], d['diff']) for d in raw['diffs']],
+        )
+        self.assertTrue(compact['diffs'][2]['new_file'])
+        self.assertNotIn('new_file', compact['diffs'][0])
+        self.assertEqual(compact['commits'][0]['title'], raw['commits'][0]['title'])
+
+    def test_tree_only_blobs(self):
+        tree = projections.project_tree(_load('tree.json'))
+        self.assertIn('app/service/payments.py', tree)
+        self.assertNotIn('app/service', tree)
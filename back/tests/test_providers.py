@@ -0,0 +1,116 @@
+from unittest import TestCase
+from unittest.mock import patch
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from openai import AsyncOpenAI
+from app.core import loop
+from app.core.config import settings
+from app.openai import openai
+from app.openai.providers import Provider, ProviderPool
+from app.openai.scheduler import LlmScheduler, Priority, estimate_tokens
+from app.openai.usage import track_usage
+import asyncio, json, time
+
+
+def _completion(content: str) -> dict:
+    return {
+        'id': 'x', 'object': 'chat.completion', 'created': 0, 'model': 'test',
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+    }
+
+
+def _server(status: int, content: str = '', delay: float = 0) -> ThreadingHTTPServer:
+    """模拟大模型服务：延迟delay秒后返回status，status为200时返回content"""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            self.server.requests += 1   # type: ignore
+            time.sleep(delay)
+            body = json.dumps(_completion(content) if status == 200 else {'error': {'message': 'boom'}}).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.requests = 0     # type: ignore
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class TestProviderPool(TestCase):
+    def setUp(self) -> None:
+        for name in ('llm_stream', 'llm_breaker_threshold', 'llm_breaker_cooldown'):
+            self.addCleanup(setattr, settings, name, getattr(settings, name))
+        settings.llm_stream = False
+        settings.llm_breaker_threshold = 2
+        settings.llm_breaker_cooldown = 0.5
+
+    def _provider(self, name: str, server: ThreadingHTTPServer, weight: float = 1) -> Provider:
+        self.addCleanup(server.shutdown)
+        client = AsyncOpenAI(base_url=f'http://127.0.0.1:{server.server_address[1]}/v1', api_key='test', max_retries=0)
+        return Provider(name, client, 'test', weight)
+
+    def _ask(self, pool: ProviderPool, hedge_delay: float = 0) -> str:
+        async def request():
+            message, _ = await pool.call(lambda provider: openai._request(provider, [{'role': 'user', 'content': 'hi'}]), hedge_delay)
+            return message['content']
+        return loop.run(request())
+
+    def test_failover_and_breaker(self):
+        bad_server, good_server = _server(500), _server(200, 'ok')
+        bad, good = self._provider('bad', bad_server, weight=10 ** 6), self._provider('good', good_server)
+        pool = ProviderPool([bad, good])
+        for _ in range(5):
+            self.assertEqual(self._ask(pool), 'ok')
+        self.assertEqual(bad_server.requests, 2)    # type: ignore  # 连续失败2次后熔断，不再收到请求
+        stats = pool.stats()
+        self.assertEqual(stats['bad']['state'], 'open')
+        self.assertEqual(stats['bad']['failures'], 2)
+        self.assertEqual(stats['good']['requests'], 5)
+
+        time.sleep(0.6)     # 冷却后放行一个试探请求，失败后重新熔断
+        self.assertEqual(pool.stats()['bad']['state'], 'half_open')
+        self.assertEqual(self._ask(pool), 'ok')
+        self.assertEqual(bad_server.requests, 3)    # type: ignore
+        self.assertEqual(pool.stats()['bad']['state'], 'open')
+
+    def test_all_failed(self):
+        pool = ProviderPool([self._provider('a', _server(503)), self._provider('b', _server(502))])
+        with self.assertRaises(Exception):
+            self._ask(pool)
+
+    def test_hedge(self):
+        slow, fast = self._provider('slow', _server(200, 'slow', delay=2), weight=10 ** 6), self._provider('fast', _server(200, 'fast'))
+        pool = ProviderPool([slow, fast])
+        start = time.monotonic()
+        self.assertEqual(self._ask(pool, hedge_delay=0.2), 'fast')
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_hedge_takes_own_slot(self):
+        """对冲请求另外占用调度器名额，被取消的较慢请求按估算的输入token计入用量"""
+        slow, fast = self._provider('slow', _server(200, 'slow', delay=2), weight=10 ** 6), self._provider('fast', _server(200, 'fast', delay=0.6))
+        scheduler = LlmScheduler(max_in_flight=10)
+        messages = [{'role': 'user', 'content': 'hi'}]
+        self.addCleanup(setattr, settings, 'llm_hedge_delay', settings.llm_hedge_delay)
+        settings.llm_hedge_delay = 0.2
+
+        async def request():
+            with track_usage() as job_usage:
+                task = asyncio.create_task(openai._create_completion(messages, Priority.MR_REVIEW))
+                await asyncio.sleep(0.5)
+                in_flight = scheduler.snapshot()['in_flight']
+                message, _ = await task
+            return message['content'], in_flight, job_usage
+
+        with patch.object(openai, 'provider_pool', ProviderPool([slow, fast])), patch.object(openai, 'scheduler', scheduler):
+            content, in_flight, job_usage = loop.run(request())
+        self.assertEqual(content, 'fast')
+        self.assertEqual(in_flight, 2)
+        self.assertEqual(scheduler.snapshot()['in_flight'], 0)
+        self.assertEqual(job_usage.prompt_tokens, estimate_tokens(messages))    # 胜出请求的用量由afunction_call记录
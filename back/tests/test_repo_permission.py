@@ -0,0 +1,59 @@
+from unittest import TestCase
+from unittest.mock import patch
+from types import SimpleNamespace
+from app.core.config import settings
+from app.db import get_session
+from app.db import repositories as db
+from app.errors.auth import PermissionDenied
+from app.model.users import User
+from app.model.repositories import Repository
+from app.service import auth, repositories
+import random
+
+
+class TestRepoPermission(TestCase):
+    def setUp(self) -> None:
+        self.addCleanup(setattr, settings, 'permission_cache_ttl', settings.permission_cache_ttl)
+        settings.permission_cache_ttl = 60
+        self.user_id, self.other_user_id, self.repo_id = (random.randint(10 ** 8, 10 ** 9) for _ in range(3))
+        with get_session() as session:
+            session.add(User(id=self.user_id, username='a', email='a@example.com'))
+            session.add(User(id=self.other_user_id, username='b', email='b@example.com'))
+            session.add(Repository(id=self.repo_id, webhook_id=1))
+            session.commit()
+        db.bind_repo_with_user(self.repo_id, self.other_user_id)
+
+    def _count_queries(self):
+        queries = []
+        original = repositories.is_repo_binded
+
+        def is_repo_binded(user_id, repo_id):
+            queries.append((user_id, repo_id))
+            return original(user_id, repo_id)
+        patcher = patch.object(repositories, 'is_repo_binded', is_repo_binded)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return queries
+
+    def test_cached_and_invalidated(self):
+        queries = self._count_queries()
+        for _ in range(3):
+            with self.assertRaises(PermissionDenied):
+                auth.check_repo_permission(self.user_id, self.repo_id)
+        self.assertEqual(len(queries), 1)
+
+        db.bind_repo_with_user(self.repo_id, self.user_id)
+        auth.invalidate_repo_permission(self.user_id)
+        auth.check_repo_permission(self.user_id, self.repo_id)
+        auth.check_repo_permission(self.user_id, self.repo_id)
+        self.assertEqual(len(queries), 2)
+
+        token = SimpleNamespace(user_id=self.user_id, user=SimpleNamespace(id=self.user_id))
+        repositories.unbind_repo(token, self.repo_id)  # type: ignore
+        with self.assertRaises(PermissionDenied):
+            auth.check_repo_permission(self.user_id, self.repo_id)
+        auth.check_repo_permission(self.other_user_id, self.repo_id)
+
+    def test_already_binded(self):
+        with self.assertRaises(repositories.RepoAlreadyBinded):
+            db.bind_repo_with_user(self.repo_id, self.other_user_id)
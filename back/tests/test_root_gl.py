@@ -1,6 +1,10 @@
 from unittest import TestCase
-from app.service.auth import get_root_gitlab_obj
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from app.core.config import settings
+from app.service.auth import get_root_gitlab_obj, invalidate_root_gitlab_obj, verify_gitlab_token
 from gitlab import Gitlab
+import gitlab.exceptions, json
 
 
 class TestGetRootGitlabObj(TestCase):
@@ -8,3 +12,76 @@ class TestGetRootGitlabObj(TestCase):
         gl = get_root_gitlab_obj()
         self.assertIsInstance(gl, Gitlab)
         self.assertEqual(gl.user.id, 1) # type: ignore
+
+
+class _FakeGitlab(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive
+    requests: list[tuple[str, int]] = []    # (路径, 客户端端口)
+    cookies: list[str] = []     # 客户端带上的cookie
+    revoked = False
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append((self.path, self.client_address[1]))
+        if cookie := self.headers.get('Cookie'):
+            self.cookies.append(cookie)
+        if self.revoked:
+            self._reply(401, {'message': '401 Unauthorized'})
+        elif self.path == '/api/v4/user':
+            self._reply(200, {'id': 1, 'username': 'root'})
+        else:
+            self._reply(200, {'id': 1, 'name': 'demo'})
+
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Set-Cookie', '_gitlab_session=abc; Path=/')
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class TestSharedRootGitlabObj(TestCase):
+    def setUp(self) -> None:
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeGitlab)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(setattr, settings, 'gitlab_url', settings.gitlab_url)
+        self.addCleanup(setattr, settings, 'gitlab_root_private_token', settings.gitlab_root_private_token)
+        settings.gitlab_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        settings.gitlab_root_private_token = 'root-token'
+        _FakeGitlab.requests = []
+        _FakeGitlab.cookies = []
+        _FakeGitlab.revoked = False
+        invalidate_root_gitlab_obj()
+        self.addCleanup(invalidate_root_gitlab_obj)
+
+    def _user_requests(self) -> int:
+        return sum(path == '/api/v4/user' for path, _ in _FakeGitlab.requests)
+
+    def test_auth_once_and_reuse_connection(self):
+        for _ in range(5):
+            get_root_gitlab_obj().projects.get(1)
+        self.assertIs(get_root_gitlab_obj(), get_root_gitlab_obj())
+        self.assertEqual(self._user_requests(), 1)
+        self.assertEqual(len({port for _, port in _FakeGitlab.requests}), 1)
+
+    def test_revalidate_after_401(self):
+        gl = get_root_gitlab_obj()
+        _FakeGitlab.revoked = True
+        with self.assertRaises(gitlab.exceptions.GitlabAuthenticationError):
+            gl.projects.get(1)
+        _FakeGitlab.revoked = False
+        self.assertIsNot(get_root_gitlab_obj(), gl)
+        self.assertEqual(self._user_requests(), 2)
+
+    def test_no_cookie_shared_between_identities(self):
+        get_root_gitlab_obj().projects.get(1)
+        user_gl = verify_gitlab_token('user-token')
+        user_gl.projects.get(1)
+        get_root_gitlab_obj().projects.get(1)
+        self.assertEqual(_FakeGitlab.cookies, [])
+        self.assertIsNot(user_gl.session, get_root_gitlab_obj().session)
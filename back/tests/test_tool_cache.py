@@ -0,0 +1,46 @@
+from unittest import TestCase
+from app.core.config import settings
+from app.openai.cache import ToolCache, cached, tool_cache
+import tempfile, time
+
+SHA = 'a' * 40
+calls = []
+
+
+@cached('ref')
+def _get_file(gl, project_id, ref, file_path):
+    calls.append((ref, file_path))
+    return {'ref': ref, 'path': file_path}
+
+
+class TestToolCache(TestCase):
+    def setUp(self) -> None:
+        tool_cache.clear()
+        calls.clear()
+
+    def test_immutable_sha(self):
+        for _ in range(3):
+            self.assertEqual(_get_file(object(), 1, SHA, 'a.py'), {'ref': SHA, 'path': 'a.py'})
+        _get_file(None, 1, ref=SHA, file_path='b.py')
+        self.assertEqual(calls, [(SHA, 'a.py'), (SHA, 'b.py')])
+
+    def test_branch_ttl(self):
+        self.addCleanup(setattr, settings, 'tool_cache_ttl', settings.tool_cache_ttl)
+        settings.tool_cache_ttl = 0.2
+        _get_file(None, 1, 'main', 'a.py')
+        _get_file(None, 1, 'main', 'a.py')
+        self.assertEqual(len(calls), 1)
+        time.sleep(0.3)
+        _get_file(None, 1, 'main', 'a.py')
+        self.assertEqual(len(calls), 2)
+
+    def test_lru_spill(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            cache = ToolCache(max_bytes=10, spill_dir=spill_dir)
+            cache.set('a', b'123456')
+            cache.set('b', b'123456')   # 超出内存上限，a被写入磁盘
+            cache.set('c', b'1', ttl=10)
+            self.assertEqual(cache.snapshot()['bytes'], 7)
+            self.assertEqual(cache.get('a'), b'123456')
+            self.assertEqual(cache.snapshot()['disk_hits'], 1)
+            self.assertIsNone(cache.get('d'))
@@ -0,0 +1,115 @@
+from unittest import TestCase
+from unittest.mock import patch
+from app.core.config import settings
+from app.openai import openai
+from app.openai.budget import TokenBudget
+from app.core.execution import ExecutionLimitExceeded
+import json, time
+
+
+def _tool_call(id: str, name: str, **args):
+    return {'id': id, 'type': 'function', 'function': {'name': name, 'arguments': json.dumps(args)}}
+
+
+def _response(content=None, tool_calls=None):
+    message = {'role': 'assistant', 'content': content}
+    if tool_calls:
+        message['tool_calls'] = tool_calls
+    return message, None
+
+
+tool_calls = []
+
+
+def _slow_tool(path: str):
+    tool_calls.append(path)
+    time.sleep(0.3)
+    if path == 'bad':
+        raise FileNotFoundError(path)
+    return f'content of {path}'
+
+
+class TestParallelToolCalls(TestCase):
+    def test_parallel_in_order(self):
+        responses = [
+            _response(tool_calls=[
+                _tool_call('c1', 'slow', path='a'),
+                _tool_call('c2', 'slow', path='bad'),
+                _tool_call('c3', 'slow', path='c'),
+                _tool_call('c4', 'missing'),
+            ]),
+            _response(content='done'),
+        ]
+
+        async def create_completion(messages, priority, final=False):
+            return responses.pop(0)
+
+        messages = []
+        with patch.dict(openai.function_map, {'slow': _slow_tool}), \
+                patch.object(openai, '_create_completion', create_completion):
+            start = time.monotonic()
+            result = openai.function_call(messages, None)   # type: ignore
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(result, 'done')
+        self.assertLess(elapsed, 0.6)   # 串行执行需要0.9秒
+        tool_messages = [m for m in messages if m['role'] == 'tool']
+        self.assertEqual([m['tool_call_id'] for m in tool_messages], ['c1', 'c2', 'c3', 'c4'])
+        self.assertEqual(json.loads(tool_messages[0]['content']), 'content of a')
+        self.assertIn('error', json.loads(tool_messages[1]['content']))
+        self.assertIn('error', json.loads(tool_messages[3]['content']))
+
+    def test_dedup_and_truncate(self):
+        responses = [
+            _response(tool_calls=[_tool_call('c1', 'slow', path='a'), _tool_call('c2', 'slow', path='a')]),
+            _response(tool_calls=[_tool_call('c3', 'slow', path='a'), _tool_call('c4', 'big')]),
+            _response(content='done'),
+        ]
+
+        async def create_completion(messages, priority, final=False):
+            return responses.pop(0)
+
+        self.addCleanup(setattr, settings, 'llm_tool_output_max_tokens', settings.llm_tool_output_max_tokens)
+        settings.llm_tool_output_max_tokens = 100
+        tool_calls.clear()
+        messages = []
+        with patch.dict(openai.function_map, {'slow': _slow_tool, 'big': lambda: 'y' * 100000}), \
+                patch.object(openai, '_create_completion', create_completion):
+            openai.function_call(messages, None)   # type: ignore
+
+        self.assertEqual(tool_calls, ['a'])
+        contents = {m['tool_call_id']: m['content'] for m in messages if m['role'] == 'tool'}
+        self.assertIn('c1', contents['c2'])
+        self.assertIn('c1', contents['c3'])
+        self.assertLess(len(contents['c4']), 1000)
+
+    def test_compact(self):
+        self.addCleanup(setattr, settings, 'llm_compact_threshold', settings.llm_compact_threshold)
+        settings.llm_compact_threshold = 1000
+        budget = TokenBudget()
+        messages = [{'role': 'tool', 'tool_call_id': f'c{i}', 'content': 'z' * 1000} for i in range(6)]
+        budget.remember('k', 'c0', 'z' * 1000)
+        budget.compact(messages)
+        self.assertEqual([len(m['content']) for m in messages[-settings.llm_compact_keep_recent:]], [1000] * 4)
+        self.assertLess(len(messages[0]['content']), 100)
+        self.assertEqual(budget.lookup('k'), 'z' * 1000)   # 原结果已被压缩，重新附上
+
+    def test_max_turns_forces_final_answer(self):
+        self.addCleanup(setattr, settings, 'llm_max_turns', settings.llm_max_turns)
+        settings.llm_max_turns = 2
+        requests = []
+
+        async def create_completion(messages, priority, final=False):
+            requests.append(final)
+            if final:
+                return _response(content=final_content)
+            return _response(tool_calls=[_tool_call(f'c{len(requests)}', 'slow', path=str(len(requests)))])
+
+        with patch.dict(openai.function_map, {'slow': lambda path: path}), \
+                patch.object(openai, '_create_completion', create_completion):
+            final_content = 'forced'
+            self.assertEqual(openai.function_call([], None), 'forced')   # type: ignore
+            self.assertEqual(requests, [False, False, True])
+            final_content = None
+            with self.assertRaises(ExecutionLimitExceeded):
+                openai.function_call([], None)   # type: ignore
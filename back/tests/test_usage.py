@@ -0,0 +1,57 @@
+from unittest import TestCase
+from unittest.mock import patch
+from types import SimpleNamespace
+from app.core import loop
+from app.openai import openai
+from app.service import usage
+
+
+def _usage(prompt: int, completion: int, cached: int = 0):
+    return SimpleNamespace(
+        prompt_tokens=prompt, completion_tokens=completion, total_tokens=prompt + completion,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=cached),
+    )
+
+
+def _tool_call(id: str, name: str):
+    return {'id': id, 'type': 'function', 'function': {'name': name, 'arguments': '{}'}}
+
+
+class TestUsage(TestCase):
+    def _run_job(self, repo_id: int, fail: bool = False):
+        responses = [
+            ({'role': 'assistant', 'content': None, 'tool_calls': [_tool_call('c1', 'a'), _tool_call('c2', 'b')]}, _usage(100, 10, 50)),
+            ({'role': 'assistant', 'content': None, 'tool_calls': [_tool_call('c3', 'a')]}, _usage(200, 20)),
+            ({'role': 'assistant', 'content': 'done'}, _usage(300, 30)),
+        ]
+
+        async def create_completion(messages, priority, final=False):
+            return responses.pop(0)
+
+        async def job():
+            async with usage.record_usage('commit_review', repo_id) as job_usage:
+                await openai.afunction_call([], None)   # type: ignore
+                if fail:
+                    raise RuntimeError
+            return job_usage
+
+        with patch.dict(openai.function_map, {'a': lambda: 'a', 'b': lambda: 'b'}), \
+                patch.object(openai, '_create_completion', create_completion):
+            return loop.run(job())
+
+    def test_record_and_rollup(self):
+        repo_id = 7001
+        job_usage = self._run_job(repo_id)
+        self.assertEqual((job_usage.prompt_tokens, job_usage.completion_tokens, job_usage.cached_tokens), (600, 60, 50))
+        self.assertEqual(job_usage.turns, 3)
+        self.assertEqual(job_usage.tool_calls, {'a': 2, 'b': 1})
+        with self.assertRaises(RuntimeError):
+            self._run_job(repo_id, fail=True)
+
+        by_repo, by_day = usage.get_usage_summary(1, repo_id)
+        self.assertEqual(len(by_repo), 1)
+        self.assertEqual(by_repo[0]['repo_id'], repo_id)
+        self.assertEqual(by_repo[0]['jobs'], 2)
+        self.assertEqual(by_repo[0]['prompt_tokens'], 1200)
+        self.assertEqual(by_repo[0]['tool_calls'], 6)
+        self.assertEqual(sum(row['jobs'] for row in by_day), 2)
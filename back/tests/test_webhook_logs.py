@@ -0,0 +1,37 @@
+from unittest import TestCase
+from sqlmodel import select, delete, desc
+from app.db import get_session
+from app.db.webhook_logs import *
+from app.model.webhook_logs import WebhookLog
+import time
+
+
+class TestWebhookLogRetention(TestCase):
+    def setUp(self) -> None:
+        with get_session() as session:
+            session.execute(delete(WebhookLog))
+            session.commit()
+        now = time.time()
+        insert_logs((now - i, f'{{"seq": {i}}}'.encode() * 50) for i in range(20, 0, -1))
+
+    def _remaining(self) -> list[WebhookLog]:
+        with get_session() as session:
+            return list(session.exec(select(WebhookLog).order_by(desc(WebhookLog.id))).all())
+
+    def test_compressed(self):
+        log = self._remaining()[0]
+        self.assertLess(log.stored_size, log.size)
+        self.assertEqual(decode_log(log), b'{"seq": 1}' * 50)
+
+    def test_prune_by_age(self):
+        self.assertEqual(prune_by_age(time.time() - 10.5, chunk=3), 10)
+        self.assertEqual(len(self._remaining()), 10)
+
+    def test_prune_by_rows(self):
+        self.assertEqual(prune_by_rows(5, chunk=4), 15)
+        self.assertEqual(decode_log(self._remaining()[0]), b'{"seq": 1}' * 50)
+
+    def test_prune_by_bytes(self):
+        stored_size = self._remaining()[0].stored_size
+        prune_by_bytes(stored_size * 3, chunk=4)
+        self.assertEqual(len(self._remaining()), 3)
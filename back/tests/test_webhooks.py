@@ -0,0 +1,58 @@
+from unittest import TestCase
+from unittest.mock import patch
+from app.db import get_session
+from app.model.jobs import Job
+from app.service import webhooks
+from sqlmodel import select
+import json, uuid
+
+
+class TestWebhookDedup(TestCase):
+    def setUp(self) -> None:
+        self.body = json.dumps({
+            'object_kind': 'push', 'project_id': 1, 'ref': 'refs/heads/main',
+            'before': uuid.uuid4().hex, 'after': uuid.uuid4().hex,
+        })
+        self.headers = {'x-gitlab-event-uuid': uuid.uuid4().hex}
+
+    def test_retry_after_failure(self):
+        calls = []
+
+        def review_commit(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise RuntimeError('数据库暂时不可用')
+
+        with patch.object(webhooks.commits, 'review_commit', review_commit):
+            with self.assertRaises(RuntimeError):
+                webhooks._dispatch(self.body, self.headers, 1)
+            webhooks._dispatch(self.body, self.headers, 2)    # 失败后的重新投递不算重复
+            webhooks._dispatch(self.body, self.headers, 3)
+        self.assertEqual(len(calls), 2)
+
+    def test_retry_after_crash(self):
+        """记录去重键后worker崩溃，同一任务重试时仍处理该事件，其他任务视为重复投递"""
+        data = json.loads(self.body)
+        self.assertIsNotNone(webhooks._claim_keys(webhooks._event_keys('push', data, self.headers), 10))
+        self.addCleanup(setattr, webhooks, '_recent_keys', webhooks._recent_keys)
+        webhooks._recent_keys = webhooks._RecentKeys(100)  # 在另一个进程中重试
+        calls = []
+        with patch.object(webhooks.commits, 'review_commit', lambda *args: calls.append(args)):
+            webhooks._dispatch(self.body, self.headers, 10)
+            webhooks._dispatch(self.body, self.headers, 11)
+        self.assertEqual(len(calls), 1)
+
+    def test_accept_persists_before_ack(self):
+        """响应前事件已写入任务表，且不保存webhook密钥"""
+        webhooks.accept(self.body.encode(), {**self.headers, 'x-gitlab-token': 'secret', 'x-gitlab-event': 'Push Hook'})
+        with get_session() as session:
+            job = session.exec(select(Job).where(Job.kind == 'webhook').order_by(Job.id.desc())).first() # pyright: ignore[reportAttributeAccessIssue]
+        assert job is not None
+        payload = json.loads(job.payload)
+        self.assertEqual(payload['body'], self.body)
+        self.assertEqual(payload['headers'], {'x-gitlab-event': 'Push Hook', **self.headers})
+
+        calls = []
+        with patch.object(webhooks.commits, 'review_commit', lambda *args: calls.append(args)):
+            webhooks._dispatch(payload['body'], payload['headers'], job.id)
+        self.assertEqual(calls, [(1, 'refs/heads/main', json.loads(self.body)['before'], json.loads(self.body)['after'])])